@@ -0,0 +1,87 @@
+"""Concurrency ceiling of the ollama graph with synchronous vs async nodes.
+
+Runs N concurrent `astream_events` (just like /stream does) against a fake Ollama and reports the
+peak number of generations Ollama saw at once.  Synchronous nodes run in the event loop's default
+thread pool, so they top out at its size; async nodes are only limited by the event loop.
+
+    python benchmarks/async_nodes.py --concurrency 8,32,64,128
+"""
+
+import os
+import sys
+import time
+import asyncio
+import argparse
+import concurrent.futures
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from fake_ollama import FakeOllama
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.graph.state import StateGraph
+
+import graphs.ollama.nodes as ollama_nodes
+from graphs.ollama.state import State, Result, Config
+from graphs.ollama import graph as async_graph
+
+
+def ollama_sync(state: State, config: RunnableConfig):
+    """The `ollama` node as it was before it became async"""
+    llm = ollama_nodes.get_llm(config)
+    configurable = Config.from_runnable_config(config)
+    messages = [{"role": "system", "content": configurable.system_prompt}] + state.messages
+    full_response = "".join(chunk.content for chunk in llm.stream(messages))
+    return {"messages": [{"role": "assistant", "content": full_response}]}
+
+
+def build_sync_graph():
+    builder = StateGraph(State, input=State, output=Result, config_schema=Config)
+    builder.add_node("ollama", ollama_sync)
+    builder.add_edge("__start__", "ollama")
+    builder.add_edge("ollama", "__end__")
+    return builder.compile()
+
+
+async def run(graph, concurrency: int) -> float:
+    async def one():
+        async for _ in graph.astream_events({"query": "hi", "messages": [{"role": "user", "content": "hi"}]}, version="v2"):
+            pass
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(concurrency)))
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", default="8,32,64,128", help="comma separated numbers of concurrent runs")
+    parser.add_argument("--tokens", type=int, default=50)
+    parser.add_argument("--token-delay", type=float, default=0.02)
+    parser.add_argument("--port", type=int, default=11499)
+    args = parser.parse_args()
+
+    fake = FakeOllama(tokens=args.tokens, token_delay=args.token_delay, ttft=0.05)
+    ollama_nodes.OLLAMA_HOST = fake.serve_in_thread(args.port)
+
+    # This is what asyncio's default executor is sized to
+    pool_size = min(32, (os.cpu_count() or 1) + 4)
+    single_run = 0.05 + args.tokens * args.token_delay
+    print(f"default thread pool: {pool_size} workers, one run takes ~{single_run:.2f}s\n")
+    print(f"{'nodes':<7}{'runs':>6}{'wall s':>9}{'peak at ollama':>16}{'runs/s':>9}")
+
+    graphs = {"sync": build_sync_graph(), "async": async_graph}
+
+    # NOTE: a single event loop, since the (shared) LLM clients' async connection pools are bound to it
+    async def benchmark():
+        asyncio.get_running_loop().set_default_executor(concurrent.futures.ThreadPoolExecutor(max_workers=pool_size))
+        for concurrency in (int(c) for c in args.concurrency.split(",")):
+            for name, graph in graphs.items():
+                fake.peak_active = 0
+                wall = await run(graph, concurrency)
+                print(f"{name:<7}{concurrency:>6}{wall:>9.2f}{fake.peak_active:>16}{concurrency / wall:>9.1f}")
+
+    asyncio.run(benchmark())
+
+
+if __name__ == "__main__":
+    main()
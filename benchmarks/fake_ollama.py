@@ -0,0 +1,186 @@
+"""A stand-in for Ollama that streams canned tokens at a configurable pace.
+
+Only what `langchain_ollama` needs is implemented: `/api/chat` (streaming or not), `/api/tags`,
+`/api/ps` and `/api/version`.
+
+    python benchmarks/fake_ollama.py --port 11434 --tokens 200 --token-delay 0.02 --ttft 0.3
+
+With `--prefill-per-token`, prompt evaluation takes longer the more of the prompt is new to it: like
+Ollama, it keeps recent prompts (and replies) cached and only evaluates what comes after the longest
+cached message prefix.
+"""
+
+import json
+import time
+import hashlib
+import asyncio
+import argparse
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+MODELS = ["phi4", "llama3.1", "deepseek-r1:7b", "deepseek-r1:14b"]
+
+PROMPT_CACHE_SIZE = 4096  # Message prefixes
+
+
+class FakeOllama:
+    def __init__(self, tokens: int = 100, token_delay: float = 0.02, ttft: float = 0.1, json_reply: str = None,
+                 loaded_models: list = None, prefill_per_token: float = 0.0, load_delay: float = 0.0):
+        self.tokens = tokens
+        self.token_delay = token_delay  # Seconds between tokens
+        self.ttft = ttft  # Seconds before the first token (i.e. prompt evaluation)
+        self.json_reply = json_reply  # Sent in one piece for `format: json` requests
+        self.loaded_models = list(MODELS if loaded_models is None else loaded_models)  # What /api/ps reports
+        self.load_delay = load_delay  # Seconds it takes to load a model that isn't loaded
+        self.fail_status = None  # Set to i.e. 500 to make /api/chat fail (for the pool's ejection)
+        self.requests_by_model = {}
+        self.prefill_per_token = prefill_per_token  # Seconds per (uncached) prompt token, on top of `ttft`
+        self._prompt_cache = OrderedDict()  # Hashes of message prefixes it has seen
+        self.active = 0
+        self.peak_active = 0
+        self.requests = 0
+
+        self.app = Starlette(routes=[
+            Route("/api/chat", self.chat, methods=["POST"]),
+            Route("/api/tags", self.tags, methods=["GET"]),
+            Route("/api/ps", self.ps, methods=["GET"]),
+            Route("/api/version", self.version, methods=["GET"]),
+        ])
+
+    ##############################################################
+    @staticmethod
+    def _message(model: str, content: str, done: bool, **extra) -> dict:
+        return {
+            "model": model,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "message": {"role": "assistant", "content": content},
+            "done": done,
+            **extra,
+        }
+
+    def _reply(self, body: dict) -> list:
+        if body.get("format") == "json":
+            return [self.json_reply or json.dumps({"query": "fake query", "aspect": "fake", "rationale": "fake", "knowledge_gap": "fake", "follow_up_query": "fake follow up"})]
+        return [f"tok{i} " for i in range(self.tokens)]
+
+    @staticmethod
+    def _prefixes(messages: list) -> list:
+        """(hash, tokens) of every prefix of `messages`"""
+        digest, prefixes = hashlib.sha1(), []
+        for message in messages:
+            part = json.dumps([message.get("role"), message.get("content")])
+            digest.update(part.encode("utf-8"))
+            prefixes.append((digest.hexdigest(), len(part) // 4))
+        return prefixes
+
+    def _uncached_tokens(self, messages: list) -> int:
+        prefixes = self._prefixes(messages)
+        cached = 0
+        for i, (prefix, _) in enumerate(prefixes):
+            if prefix in self._prompt_cache:
+                cached = i + 1
+        return sum(tokens for _, tokens in prefixes[cached:])
+
+    def _cache(self, messages: list):
+        for prefix, _ in self._prefixes(messages):
+            self._prompt_cache[prefix] = True
+            self._prompt_cache.move_to_end(prefix)
+        while len(self._prompt_cache) > PROMPT_CACHE_SIZE:
+            self._prompt_cache.popitem(last=False)
+
+    async def chat(self, request: Request):
+        body = await request.json()
+        model = body.get("model", "unknown")
+        parts = self._reply(body)
+        self.requests += 1
+        self.requests_by_model[model] = self.requests_by_model.get(model, 0) + 1
+        if self.fail_status:
+            return JSONResponse({"error": "fake failure"}, status_code=self.fail_status)
+        if model not in self.loaded_models:
+            await asyncio.sleep(self.load_delay)
+            self.loaded_models.append(model)
+        if not body.get("messages"):
+            # Ollama only loads the model (and sets its keep_alive)
+            return JSONResponse(self._message(model, "", True, done_reason="load"))
+
+        messages = body.get("messages", [])
+        prompt_tokens = self._uncached_tokens(messages)
+
+        async def generate():
+            self.active += 1
+            self.peak_active = max(self.peak_active, self.active)
+            start = time.perf_counter_ns()
+            try:
+                await asyncio.sleep(self.ttft + prompt_tokens * self.prefill_per_token)
+                prompt_eval = time.perf_counter_ns() - start
+                for part in parts:
+                    yield json.dumps(self._message(model, part, False)) + "\n"
+                    await asyncio.sleep(self.token_delay)
+                yield json.dumps(self._message(
+                    model, "", True, done_reason="stop",
+                    total_duration=time.perf_counter_ns() - start, load_duration=0,
+                    prompt_eval_count=prompt_tokens, prompt_eval_duration=prompt_eval,
+                    eval_count=len(parts), eval_duration=time.perf_counter_ns() - start - prompt_eval,
+                )) + "\n"
+                self._cache(messages + [{"role": "assistant", "content": "".join(parts)}])
+            finally:
+                self.active -= 1
+
+        if body.get("stream", True):
+            return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+        last = None
+        content = []
+        async for line in generate():
+            last = json.loads(line)
+            content.append(last["message"]["content"])
+        last["message"]["content"] = "".join(content)
+        return JSONResponse(last)
+
+    async def tags(self, request: Request):
+        return JSONResponse({"models": [{"name": model, "model": model, "size": 0} for model in MODELS]})
+
+    async def ps(self, request: Request):
+        return JSONResponse({"models": [{"name": model, "model": model, "size": 0, "size_vram": 0} for model in self.loaded_models]})
+
+    async def version(self, request: Request):
+        return JSONResponse({"version": "0.0.0-fake"})
+
+    ##############################################################
+    def serve_in_thread(self, port: int, host: str = "127.0.0.1") -> str:
+        """Start serving in a daemon thread and return the base url once it's up"""
+        import uvicorn
+        server = uvicorn.Server(uvicorn.Config(self.app, host=host, port=port, log_level="warning"))
+        threading.Thread(target=server.run, daemon=True).start()
+        while not server.started:
+            time.sleep(0.01)
+        return f"http://{host}:{port}"
+
+
+def main():
+    import uvicorn
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--tokens", type=int, default=100, help="tokens per reply")
+    parser.add_argument("--token-delay", type=float, default=0.02, help="seconds between tokens")
+    parser.add_argument("--ttft", type=float, default=0.1, help="seconds before the first token")
+    parser.add_argument("--prefill-per-token", type=float, default=0.0, help="seconds per uncached prompt token, on top of --ttft")
+    parser.add_argument("--load-delay", type=float, default=0.0, help="seconds it takes to load a model")
+    parser.add_argument("--loaded-models", default=None, help="comma separated models loaded at start (default: all)")
+    args = parser.parse_args()
+
+    loaded_models = [m for m in args.loaded_models.split(",") if m] if args.loaded_models is not None else None
+    fake = FakeOllama(tokens=args.tokens, token_delay=args.token_delay, ttft=args.ttft, prefill_per_token=args.prefill_per_token,
+                      load_delay=args.load_delay, loaded_models=loaded_models)
+    uvicorn.run(fake.app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
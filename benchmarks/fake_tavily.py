@@ -0,0 +1,102 @@
+"""A stand-in for the Tavily search API, with a configurable latency and page size.
+
+Only `/search` is implemented.  Point the server at it with `TAVILY_API_URL` (any `TAVILY_API_KEY` will do):
+
+    python benchmarks/fake_tavily.py --port 11600 --latency 0.8 --page-chars 20000
+    TAVILY_API_URL=http://127.0.0.1:11600 TAVILY_API_KEY=tvly-fake ...
+
+Results depend on the query (so different queries find different pages), and their text is made of
+words, not a single repeated character, so compression and hashing see something realistic.
+"""
+
+import time
+import random
+import asyncio
+import hashlib
+import argparse
+import threading
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+WORDS = ("bee hive honey pollen colony queen worker drone nectar flower wax swarm forage summer winter "
+         "research study data result method growth climate habitat species population decline").split()
+
+
+class FakeTavily:
+    def __init__(self, latency: float = 0.5, jitter: float = 0.2, page_chars: int = 10000):
+        self.latency = latency  # Seconds per search
+        self.jitter = jitter  # +/- this fraction of `latency`
+        self.page_chars = page_chars  # Size of each result's `raw_content`
+        self.requests = 0
+        self.active = 0
+        self.peak_active = 0
+
+        self.app = Starlette(routes=[Route("/search", self.search, methods=["POST"])])
+
+    def _page(self, seed: str, chars: int) -> str:
+        words = random.Random(seed).choices(WORDS, k=chars // 6 + 1)
+        return " ".join(words)[:chars]
+
+    def _result(self, query: str, i: int, include_raw_content: bool) -> dict:
+        key = hashlib.sha1(f"{query}|{i}".encode("utf-8")).hexdigest()[:12]
+        result = {
+            "title": f"Result {i + 1} for {query}",
+            "url": f"https://example.com/{key}",
+            "content": self._page(key + "snippet", 300),
+            "score": round(1 - i * 0.1, 2),
+        }
+        if include_raw_content:
+            result["raw_content"] = self._page(key, self.page_chars)
+        return result
+
+    async def search(self, request: Request):
+        body = await request.json()
+        query = body.get("query", "")
+        self.requests += 1
+        self.active += 1
+        self.peak_active = max(self.peak_active, self.active)
+        start = time.perf_counter()
+        try:
+            await asyncio.sleep(max(self.latency * (1 + random.uniform(-self.jitter, self.jitter)), 0))
+            results = [self._result(query, i, bool(body.get("include_raw_content")))
+                       for i in range(int(body.get("max_results", 5)))]
+        finally:
+            self.active -= 1
+        return JSONResponse({
+            "query": query,
+            "answer": None,
+            "images": [],
+            "results": results,
+            "response_time": round(time.perf_counter() - start, 3),
+        })
+
+    ##############################################################
+    def serve_in_thread(self, port: int, host: str = "127.0.0.1") -> str:
+        """Start serving in a daemon thread and return the base url once it's up"""
+        import uvicorn
+        server = uvicorn.Server(uvicorn.Config(self.app, host=host, port=port, log_level="warning"))
+        threading.Thread(target=server.run, daemon=True).start()
+        while not server.started:
+            time.sleep(0.01)
+        return f"http://{host}:{port}"
+
+
+def main():
+    import uvicorn
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11600)
+    parser.add_argument("--latency", type=float, default=0.5, help="seconds per search")
+    parser.add_argument("--jitter", type=float, default=0.2, help="+/- this fraction of the latency")
+    parser.add_argument("--page-chars", type=int, default=10000, help="characters of raw_content per result")
+    args = parser.parse_args()
+
+    fake = FakeTavily(latency=args.latency, jitter=args.jitter, page_chars=args.page_chars)
+    uvicorn.run(fake.app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,311 @@
+"""Load test of /stream, end to end, without GPUs or a Tavily key.
+
+Starts a fake Ollama (`fake_ollama.py`), a fake Tavily (`fake_tavily.py`) and the server (`server/app.py`,
+pointed at both) as separate processes, then drives /stream with `--concurrency` clients for
+`--duration` seconds, picking the agent of every request from `--mix`.  Reports, per agent and overall:
+
+ - requests/second, errors and request latency
+ - time to first token (the first `on_chat_model_stream` event with content) and the latency
+   between tokens (between stream events - with `--coalesce-ms` that's between batches of tokens)
+ - the server's CPU time (per request, and in % of one core) and peak memory
+
+    python benchmarks/loadtest.py --concurrency 32 --duration 30 --mix ollama=3,researchrabbit=1
+    python benchmarks/loadtest.py --token-rate 50 --ttft 0.3 --search-latency 1.0 --json results.json
+
+With `--server http://host:8000` it drives a server that is already running instead (give it
+`--server-pid` for the CPU numbers, if it's on this machine).
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import signal
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from typing import Optional
+
+import httpx
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+
+# What the frontend subscribes to (see `frontend/src/config.py`)
+SUBSCRIPTION = {
+    "events": ["on_chain_start", "on_chain_end", "on_chat_model_stream", "on_chat_model_end"],
+    "hide_underscore_nodes": True,
+}
+
+
+def parse_mix(spec: str) -> dict:
+    mix = {}
+    for item in spec.split(","):
+        agent, _, weight = item.strip().partition("=")
+        if agent:
+            mix[agent] = float(weight or 1)
+    return mix
+
+
+def percentile(values: list, p: float) -> Optional[float]:
+    """Nearest-rank percentile of (sorted) `values`"""
+    if not values:
+        return None
+    return values[min(int(len(values) * p / 100), len(values) - 1)]
+
+
+##############################################################
+# The processes under test
+def cpu_seconds(pid: int) -> Optional[float]:
+    """User + system CPU time of a process (Linux only)"""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+def peak_rss_mb(pid: int) -> Optional[float]:
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def wait_until_up(url: str, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url, timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.1)
+    raise RuntimeError(f"{url} didn't come up in {timeout}s")
+
+
+def spawn(args) -> tuple:
+    """Start the fakes and the server, returns (server url, server pid, processes)"""
+    python = sys.executable
+    ollama_url = f"http://127.0.0.1:{args.base_port + 1}"
+    tavily_url = f"http://127.0.0.1:{args.base_port + 2}"
+    server_url = f"http://127.0.0.1:{args.base_port}"
+    processes = [
+        subprocess.Popen([python, os.path.join(HERE, "fake_ollama.py"), "--port", str(args.base_port + 1),
+                          "--tokens", str(args.tokens), "--token-delay", str(1 / args.token_rate), "--ttft", str(args.ttft)]),
+        subprocess.Popen([python, os.path.join(HERE, "fake_tavily.py"), "--port", str(args.base_port + 2),
+                          "--latency", str(args.search_latency), "--page-chars", str(args.page_chars)]),
+    ]
+    wait_until_up(f"{ollama_url}/api/version")
+
+    env = {
+        **os.environ,
+        "PYTHONPATH": ROOT,
+        "OLLAMA_HOST": ollama_url,
+        "OLLAMA_HOSTS": "",
+        "TAVILY_API_URL": tavily_url,
+        "TAVILY_API_KEY": os.getenv("TAVILY_API_KEY", "tvly-fake"),
+        # Every search and every LLM call is a real one
+        "TAVILY_CACHE_TTL": "0",
+        "LLM_RESPONSE_CACHE": "",
+        "PRELOAD_MODELS": "none",
+        "CACHE_DIR": tempfile.mkdtemp(prefix="plebserve-loadtest-"),
+        "MODEL_CONCURRENCY": "",
+        "MODEL_CONCURRENCY_DEFAULT": str(args.model_concurrency),
+    }
+    server = subprocess.Popen(
+        [python, "-m", "uvicorn", "app:app", "--port", str(args.base_port), "--log-level", "warning"],
+        cwd=os.path.join(ROOT, "server"), env=env,
+        stdout=None if args.server_logs else subprocess.DEVNULL, stderr=None if args.server_logs else subprocess.DEVNULL,
+    )
+    processes.append(server)
+    # Ready = the graphs are imported and compiled
+    wait_until_up(f"{server_url}/health/ready", timeout=120)
+    return server_url, server.pid, processes
+
+
+##############################################################
+# The clients
+class Result:
+    __slots__ = ("agent", "ok", "latency", "ttft", "gaps", "tokens")
+
+    def __init__(self, agent: str):
+        self.agent = agent
+        self.ok = False
+        self.latency = 0.0
+        self.ttft: Optional[float] = None
+        self.gaps = []  # Seconds between token events
+        self.tokens = 0
+
+
+def payload(agent: str, args, n: int) -> dict:
+    query = f"load test question {n}: what do {random.choice(['bees', 'ants', 'wasps', 'moths'])} eat in {random.randint(1, 10_000)}?"
+    if agent == "researchrabbit":
+        input_data = {"query": query}
+        config = {"max_web_research_loops": args.research_loops}
+    else:
+        input_data = {"query": query, "messages": [{"role": "user", "content": query}]}
+        config = {}
+    body = {"agent_id": agent, "input_data": input_data, "config": config, "subscribe": SUBSCRIPTION}
+    if args.coalesce_ms:
+        body["coalesce"] = {"interval_ms": args.coalesce_ms, "max_bytes": 512}
+    return body
+
+
+async def one_request(client: httpx.AsyncClient, url: str, agent: str, args, n: int) -> Result:
+    result = Result(agent)
+    start = time.perf_counter()
+    last = None
+    try:
+        async with client.stream("POST", f"{url}/stream", json=payload(agent, args, n)) as response:
+            if response.status_code != 200:
+                return result
+            async for line in response.aiter_lines():
+                # NOTE: only token events are parsed - the rest are skipped on a substring check
+                if not line.startswith("data: ") or '"on_chat_model_stream"' not in line:
+                    continue
+                event = json.loads(line[6:])
+                chunk = (event.get("data") or {}).get("chunk") or {}
+                if not (chunk.get("content") if isinstance(chunk, dict) else chunk):
+                    continue
+                now = time.perf_counter()
+                if last is None:
+                    result.ttft = now - start
+                else:
+                    result.gaps.append(now - last)
+                last = now
+                result.tokens += 1
+        result.ok = True
+    except httpx.HTTPError:
+        pass
+    result.latency = time.perf_counter() - start
+    return result
+
+
+async def drive(url: str, args) -> tuple:
+    mix = parse_mix(args.mix)
+    agents, weights = list(mix), list(mix.values())
+    results = []
+    counter = iter(range(sys.maxsize))
+    deadline = time.perf_counter() + args.duration
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(timeout=httpx.Timeout(args.timeout), limits=limits) as client:
+        async def worker():
+            while time.perf_counter() < deadline and (not args.requests or len(results) < args.requests):
+                agent = random.choices(agents, weights)[0]
+                results.append(await one_request(client, url, agent, args, next(counter)))
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        wall = time.perf_counter() - start
+    return results, wall
+
+
+##############################################################
+def summarize(results: list, wall: float) -> dict:
+    ok = [r for r in results if r.ok]
+    latencies = sorted(r.latency for r in ok)
+    ttfts = sorted(r.ttft for r in ok if r.ttft is not None)
+    gaps = sorted(g for r in ok for g in r.gaps)
+    tokens = sum(r.tokens for r in ok)
+    ms = lambda values: {f"p{p}": round(percentile(values, p) * 1000, 1) if values else None for p in (50, 90, 99)}
+    return {
+        "requests": len(results),
+        "errors": len(results) - len(ok),
+        "rps": round(len(ok) / wall, 2),
+        "latency_ms": ms(latencies),
+        "ttft_ms": ms(ttfts),
+        "inter_token_ms": ms(gaps),
+        "tokens_per_second": round(tokens / wall, 1),
+    }
+
+
+def print_report(report: dict):
+    def triple(values: dict) -> str:
+        return "/".join("-" if v is None else f"{v:.0f}" for v in values.values())
+
+    print(f"\n{'agent':<16}{'reqs':>6}{'errors':>8}{'rps':>8}{'latency ms':>20}{'ttft ms':>18}{'itl ms':>14}{'tok/s':>9}")
+    print(f"{'':<38}{'p50/p90/p99':>20}{'p50/p90/p99':>18}{'p50/p90/p99':>14}")
+    for agent, stats in list(report["agents"].items()) + [("all", report["overall"])]:
+        print(f"{agent:<16}{stats['requests']:>6}{stats['errors']:>8}{stats['rps']:>8.2f}{triple(stats['latency_ms']):>20}"
+              f"{triple(stats['ttft_ms']):>18}{triple(stats['inter_token_ms']):>14}{stats['tokens_per_second']:>9.0f}")
+    server = report["server"]
+    if server.get("cpu_seconds") is not None:
+        print(f"\nserver CPU: {server['cpu_seconds']:.1f}s ({server['cpu_percent']:.0f}% of one core), "
+              f"{server['cpu_ms_per_request']:.1f}ms per request, peak RSS {server['peak_rss_mb'] or 0:.0f}MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=20, help="seconds")
+    parser.add_argument("--requests", type=int, default=0, help="stop after this many requests (0: run for --duration)")
+    parser.add_argument("--mix", default="ollama=3,researchrabbit=1", help="agents, with their weights")
+    parser.add_argument("--research-loops", type=int, default=1, help="max_web_research_loops of research runs")
+    parser.add_argument("--coalesce-ms", type=int, default=0, help="ask for coalesced tokens (like the frontend does, with 50)")
+    parser.add_argument("--timeout", type=float, default=300, help="seconds per request")
+    parser.add_argument("--json", help="also write the report to this file")
+    # The fakes
+    parser.add_argument("--tokens", type=int, default=100, help="tokens per LLM reply")
+    parser.add_argument("--token-rate", type=float, default=40, help="tokens/second of the fake Ollama")
+    parser.add_argument("--ttft", type=float, default=0.2, help="seconds before the fake Ollama's first token")
+    parser.add_argument("--search-latency", type=float, default=0.5, help="seconds per fake Tavily search")
+    parser.add_argument("--page-chars", type=int, default=10000, help="raw_content characters per search result")
+    # The server
+    parser.add_argument("--server", help="drive this server instead of starting one")
+    parser.add_argument("--server-pid", type=int, help="pid of --server, for its CPU time")
+    parser.add_argument("--model-concurrency", type=int, default=64, help="MODEL_CONCURRENCY_DEFAULT of the server we start")
+    parser.add_argument("--base-port", type=int, default=18000, help="server port (the fakes get the next two)")
+    parser.add_argument("--server-logs", action="store_true")
+    args = parser.parse_args()
+
+    processes = []
+    try:
+        if args.server:
+            url, pid = args.server.rstrip("/"), args.server_pid
+        else:
+            url, pid, processes = spawn(args)
+        print(f"driving {url} with {args.concurrency} clients for {args.duration:.0f}s, mix {args.mix}")
+
+        cpu_before = cpu_seconds(pid) if pid else None
+        results, wall = asyncio.run(drive(url, args))
+        cpu_after = cpu_seconds(pid) if pid else None
+
+        ok = sum(r.ok for r in results)
+        cpu = cpu_after - cpu_before if cpu_before is not None and cpu_after is not None else None
+        report = {
+            "config": {k: v for k, v in vars(args).items() if k not in ("json", "server_logs")},
+            "wall_seconds": round(wall, 2),
+            "overall": summarize(results, wall),
+            "agents": {agent: summarize([r for r in results if r.agent == agent], wall) for agent in parse_mix(args.mix)},
+            "server": {
+                "cpu_seconds": round(cpu, 2) if cpu is not None else None,
+                "cpu_percent": round(cpu / wall * 100, 1) if cpu is not None else None,
+                "cpu_ms_per_request": round(cpu * 1000 / ok, 2) if cpu is not None and ok else None,
+                "peak_rss_mb": round(peak_rss_mb(pid), 1) if pid and peak_rss_mb(pid) else None,
+            },
+        }
+        print_report(report)
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump(report, f, indent=2)
+    finally:
+        for process in processes:
+            process.send_signal(signal.SIGINT)
+        for process in processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""Routing of the Ollama pool, against a few fake Ollama hosts.
+
+ - host 0 has the model loaded and is fast, host 1 has it loaded but is slow, host 2 doesn't have it
+ - phase 1: concurrent runs - they go to the hosts with the model first, by fewest outstanding requests
+ - phase 2: host 0 starts failing - it gets ejected and the others take over
+ - phase 3: host 0 recovers - it's back once its ejection is over (OLLAMA_EJECT_SECONDS)
+
+Then multi-turn conversations through the `ollama` graph, with and without conversation affinity.
+The fake hosts cache prompts like Ollama does (`--prefill-per-token`), so turns that land on the host
+that served the conversation's previous turn only pay for the new messages.
+
+    python benchmarks/ollama_pool.py --runs 24 --eject-seconds 2 --conversations 12 --turns 6
+"""
+
+import os
+import sys
+import time
+import asyncio
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from fake_ollama import FakeOllama
+
+import graphs.llm_clients as llm_clients
+import graphs.ollama_pool as ollama_pool
+import graphs.ollama.nodes as ollama_nodes
+from graphs.ollama import graph as ollama_graph
+from graphs.ollama_pool import OllamaPool, POOL_BASE_URL, affinity_stats
+
+MODEL = "phi4"
+
+
+async def run_phase(name: str, fakes: list, runs: int, concurrency: int):
+    llm = llm_clients.get_chat_ollama(model=MODEL, temperature=0, base_url=POOL_BASE_URL)
+    before = [fake.requests for fake in fakes]
+    semaphore = asyncio.Semaphore(concurrency)
+    failed = 0
+
+    async def one():
+        nonlocal failed
+        async with semaphore:
+            try:
+                async for _ in llm.astream([{"role": "user", "content": "hi"}]):
+                    pass
+            except Exception:
+                failed += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(runs)))
+    wall = time.perf_counter() - start
+    served = " ".join(f"{fake.requests - b:>5}" for fake, b in zip(fakes, before))
+    print(f"{name:<12}{wall:>8.2f}{failed:>8}   {served}")
+
+
+async def run_conversations(name: str, conversations: int, turns: int, model: str):
+    before = affinity_stats()
+
+    async def conversation(i: int):
+        config = {"configurable": {"model": model, "conversation_id": f"{name}-{i}"}}
+        messages = []
+        for turn in range(turns):
+            query = f"{name} conversation {i}, question {turn}: " + "tell me more " * 20
+            messages.append({"role": "user", "content": query})
+            output = await ollama_graph.ainvoke({"query": query, "messages": messages}, config, output_keys=["messages"])
+            messages = output["messages"]
+
+    start = time.perf_counter()
+    await asyncio.gather(*(conversation(i) for i in range(conversations)))
+    wall = time.perf_counter() - start
+
+    after = affinity_stats()
+    requests = sum(after[k]["requests"] - before[k]["requests"] for k in ("warm", "cold"))
+    seconds = sum(after[k]["prefill_seconds"] - before[k]["prefill_seconds"] for k in ("warm", "cold"))
+    tokens = sum(after[k]["prompt_tokens"] - before[k]["prompt_tokens"] for k in ("warm", "cold"))
+    warm = after["warm"]["requests"] - before["warm"]["requests"]
+    print(f"{name:<12}{wall:>8.2f}{warm:>7}/{requests:<5}{seconds * 1000 / requests:>12.0f}{tokens / requests:>11.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=24)
+    parser.add_argument("--concurrency", type=int, default=6)
+    parser.add_argument("--tokens", type=int, default=20)
+    parser.add_argument("--eject-seconds", type=float, default=2)
+    parser.add_argument("--conversations", type=int, default=12)
+    parser.add_argument("--turns", type=int, default=6)
+    parser.add_argument("--prefill-per-token", type=float, default=0.0005)
+    parser.add_argument("--port", type=int, default=11510)
+    args = parser.parse_args()
+
+    fakes = [
+        FakeOllama(tokens=args.tokens, token_delay=0.01, ttft=0.05, loaded_models=[MODEL]),
+        FakeOllama(tokens=args.tokens, token_delay=0.04, ttft=0.05, loaded_models=[MODEL]),
+        FakeOllama(tokens=args.tokens, token_delay=0.01, ttft=0.05, loaded_models=[]),
+    ]
+    urls = [fake.serve_in_thread(args.port + i) for i, fake in enumerate(fakes)]
+
+    ollama_pool.OLLAMA_EJECT_SECONDS = args.eject_seconds
+    pool = OllamaPool(urls, probe_interval=0.5)
+    pool.probe_all()
+    llm_clients.POOL = pool
+    ollama_nodes.OLLAMA_HOST = POOL_BASE_URL
+
+    print(f"{'phase':<12}{'wall s':>8}{'failed':>8}   " + " ".join(f"host{i}" for i in range(len(fakes))))
+
+    async def benchmark():
+        await run_phase("healthy", fakes, args.runs, args.concurrency)
+        fakes[0].fail_status = 500
+        await run_phase("host0 fails", fakes, args.runs, args.concurrency)
+        fakes[0].fail_status = None
+        await asyncio.sleep(args.eject_seconds + 0.5)
+        await run_phase("recovered", fakes, args.runs, args.concurrency)
+
+        for fake in fakes:
+            fake.prefill_per_token = args.prefill_per_token
+            fake.loaded_models = [MODEL]
+        # Until the prober has seen that every host has it
+        await asyncio.sleep(1)
+        print(f"\n{'affinity':<12}{'wall s':>8}{'warm/turns':>13}{'prefill ms':>12}{'prompt tk':>11}")
+        for enabled in (False, True):
+            ollama_pool.OLLAMA_AFFINITY = enabled
+            for fake in fakes:
+                fake._prompt_cache.clear()
+            await run_conversations("on" if enabled else "off", args.conversations, args.turns, MODEL)
+
+    asyncio.run(benchmark())
+    pool.stop_probing()
+    print()
+    for host in pool.status()["hosts"]:
+        print(host)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Cost of formatting (and deduplicating) search results with large `raw_content`.
+
+Compares `deduplicate_and_format_sources` as it was (string `+=`, truncating after the fact) with the
+current one (list + join, truncating first), and times the cross-loop `filter_seen_sources` index.
+
+    python benchmarks/source_formatting.py --sources 5,20,50 --page-kb 256
+"""
+
+import os
+import sys
+import time
+import random
+import string
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from graphs.research.utils import deduplicate_and_format_sources, filter_seen_sources
+
+
+def deduplicate_and_format_sources_before(search_response, max_tokens_per_source, include_raw_content=True):
+    """`deduplicate_and_format_sources` as it was (only the dict input)"""
+    unique_sources = {}
+    for source in search_response['results']:
+        if source['url'] not in unique_sources:
+            unique_sources[source['url']] = source
+
+    formatted_text = "Sources:\n\n"
+    for i, source in enumerate(unique_sources.values(), 1):
+        formatted_text += f"Source {source['title']}:\n===\n"
+        formatted_text += f"URL: {source['url']}\n===\n"
+        formatted_text += f"Most relevant content from source: {source['content']}\n===\n"
+        if include_raw_content:
+            char_limit = max_tokens_per_source * 4
+            raw_content = source.get('raw_content', '')
+            if raw_content is None:
+                raw_content = ''
+            if len(raw_content) > char_limit:
+                raw_content = raw_content[:char_limit] + "... [truncated]"
+            formatted_text += f"Full source content limited to {max_tokens_per_source} tokens: {raw_content}\n\n"
+    return formatted_text.strip()
+
+
+def make_results(n: int, page_kb: int, duplicates: float) -> dict:
+    page = "".join(random.choices(string.ascii_lowercase + "     \n", k=page_kb * 1024))
+    results = []
+    for i in range(n):
+        # Some of the results are the same page again (same URL, or mirrored under another one)
+        j = random.randrange(i) if i and random.random() < duplicates else i
+        results.append({
+            "title": f"Page {j}",
+            "url": f"https://example.com/{j}" if random.random() < 0.5 else f"https://mirror.example.com/{j}",
+            "content": page[j:j + 300],
+            "raw_content": f"{j} {page}",
+        })
+    return {"results": results}
+
+
+def best_of(fn, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sources", default="5,20,50", help="comma separated numbers of search results")
+    parser.add_argument("--page-kb", type=int, default=256, help="size of each result's raw_content")
+    parser.add_argument("--max-tokens", type=int, default=1000, help="max_tokens_per_source")
+    parser.add_argument("--duplicates", type=float, default=0.3, help="share of results that repeat an earlier page")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    random.seed(0)
+    print(f"{'sources':>8}{'before ms':>11}{'after ms':>10}{'speedup':>9}{'index ms':>10}{'kept':>6}")
+    for n in (int(s) for s in args.sources.split(",")):
+        response = make_results(n, args.page_kb, args.duplicates)
+        assert deduplicate_and_format_sources(response, args.max_tokens) == deduplicate_and_format_sources_before(response, args.max_tokens)
+
+        before = best_of(lambda: deduplicate_and_format_sources_before(response, args.max_tokens), args.repeat)
+        after = best_of(lambda: deduplicate_and_format_sources(response, args.max_tokens), args.repeat)
+        index = best_of(lambda: filter_seen_sources(response["results"], [], []), args.repeat)
+        kept = len(filter_seen_sources(response["results"], [], [])[0])
+        print(f"{n:>8}{before * 1000:>11.2f}{after * 1000:>10.2f}{before / after:>8.1f}x{index * 1000:>10.2f}{kept:>6}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""Compare bytes on the wire and compression CPU for /stream responses.
+
+Record a few research runs first (uncompressed), for example:
+
+    curl -N -H "Content-Type: application/json" -H "Accept-Encoding: identity" \
+        -d '{"agent_id": "researchrabbit", "input_data": {"query": "solid state batteries"}}' \
+        http://localhost:8000/stream > runs/batteries.sse
+
+Then:
+
+    python benchmarks/sse_compression.py runs/*.sse
+
+Without any files a synthetic research-like run is used (its ratios are only indicative).
+"""
+
+import os
+import sys
+import time
+import json
+import random
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "server"))
+from sse_compression import FrameCompressor, ENCODINGS
+
+
+def load_recording(path: str) -> list:
+    """Split a recorded event stream back into its `data: ...\\n\\n` frames"""
+    with open(path, "rb") as f:
+        raw = f.read()
+    return [frame + b"\n\n" for frame in raw.split(b"\n\n") if frame.strip()]
+
+
+def synthetic_research_run(seed: int = 0, loops: int = 3, tokens_per_summary: int = 600) -> list:
+    rng = random.Random(seed)
+    vocabulary = ["".join(rng.choice("etaoinshrdlucmfw") for _ in range(rng.randint(2, 9))) for _ in range(800)]
+
+    def text(n):
+        return " ".join(rng.choice(vocabulary) for _ in range(n))
+
+    def frame(event, name, data):
+        envelope = {"event": event, "name": name, "run_id": f"{rng.getrandbits(128):032x}", "tags": [], "metadata": {"langgraph_node": name}, "data": data, "parent_ids": []}
+        return f"data: {json.dumps(envelope)}\n\n".encode("utf-8")
+
+    frames = []
+    summary = ""
+    sources = []
+    for loop in range(loops):
+        frames.append(frame("on_chain_start", "web_research", {"input": {"search_query": text(8)}}))
+        sources.append(f"* {text(6)} : https://example.com/{loop}")
+        frames.append(frame("on_chain_end", "web_research", {"output": {"sources_gathered": sources[-1:], "web_research_results": [text(1500)]}}))
+        frames.append(frame("on_chain_start", "summarize_sources", {}))
+        for _ in range(tokens_per_summary):
+            frames.append(frame("on_chat_model_stream", "ChatOllama", {"chunk": {"content": rng.choice(vocabulary) + " "}}))
+        summary += " " + text(tokens_per_summary)
+        frames.append(frame("on_chain_end", "summarize_sources", {"output": {"running_summary": summary}}))
+    frames.append(frame("on_chain_end", "LangGraph", {"output": {"running_summary": summary + "\n".join(sources)}}))
+    return frames
+
+
+def measure(frames: list, encoding: str, level: int) -> dict:
+    start = time.process_time()
+    compressor = FrameCompressor(encoding, level)
+    compressed = sum(len(compressor.compress(frame)) for frame in frames) + len(compressor.finish())
+    cpu = time.process_time() - start
+    return {"bytes": compressed, "cpu_ms": cpu * 1000}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("recordings", nargs="*", help="recorded /stream responses (uncompressed)")
+    parser.add_argument("--levels", default="1,6,9", help="comma separated compression levels")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per measurement (best CPU time is reported)")
+    args = parser.parse_args()
+
+    runs = {path: load_recording(path) for path in args.recordings} or {"synthetic research run": synthetic_research_run()}
+    levels = [int(level) for level in args.levels.split(",")]
+
+    for name, frames in runs.items():
+        raw = sum(len(frame) for frame in frames)
+        print(f"\n{name}: {len(frames)} frames, {raw:,} bytes uncompressed")
+        print(f"  {'encoding':<10}{'level':>6}{'bytes':>12}{'ratio':>8}{'cpu ms':>10}{'us/frame':>10}")
+        for encoding in ENCODINGS:
+            for level in levels:
+                results = [measure(frames, encoding, level) for _ in range(args.repeat)]
+                size = results[0]["bytes"]
+                cpu = min(result["cpu_ms"] for result in results)
+                print(f"  {encoding:<10}{level:>6}{size:>12,}{raw / size:>8.2f}{cpu:>10.2f}{cpu * 1000 / len(frames):>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,4 +2,21 @@
 
 BACKEND_URL = "http://backend:8000"
 
-AGENTS_ENDPOINT_CACHE_DURATION = 3600 # 1 hour
\ No newline at end of file
+AGENTS_ENDPOINT_CACHE_DURATION = 3600 # 1 hour
+
+# The only `astream_events` the chat UI renders - the backend drops everything else before sending it.
+# NOTE: "LangGraph" events are kept (its `on_chain_end` carries the final graph output)
+STREAM_SUBSCRIPTION = {
+    "events": ["on_chain_start", "on_chain_end", "on_chat_model_stream", "on_chat_model_end"],
+    "hide_underscore_nodes": True,
+}
+
+# Have the backend merge LLM tokens into fewer, larger events (fewer frames to parse and re-render)
+STREAM_COALESCING = {
+    "interval_ms": 50,
+    "max_bytes": 512,
+}
+
+# If the connection to /stream drops mid-run, reconnect to the same run (the backend replays what we missed)
+STREAM_RECONNECT_ATTEMPTS = 3
+STREAM_RECONNECT_DELAY = 1.0 # seconds
@@ -7,14 +7,15 @@ from streamlit_pydantic import pydantic_form
 from typing import Dict, Any, Optional
 import requests
 import json
+import uuid
 import logging
 
 ##############################################################################
 logger = logging.getLogger("PlebChat")
 
 
-from src.utils import get_agents, create_dynamic_model
-from src.config import BACKEND_URL
+from src.utils import get_agents, create_dynamic_model, stream_event_lines, undo_thread_messages
+from src.config import BACKEND_URL, STREAM_SUBSCRIPTION, STREAM_COALESCING
 
 ##############################################################################
 # Constants
@@ -24,6 +25,8 @@ DEFAULT_AGENT_INDEX = 0
 
 def new_thread():
     st.session_state.message_history = []
+    # The backend keeps the thread's messages, we only send it the new ones
+    st.session_state.thread_id = uuid.uuid4().hex
     # st.toast("New thread!")
 
 
@@ -91,25 +94,22 @@ def handle_stream_response(selected_agent: str, query: str, config: Dict[str, An
         # input_data_dict["messages"] = st.session_state.message_history
 
         # New simplified input data
+        # NOTE: only the new message - the backend has the rest of the thread
         input_data_dict = {
             "query": query,
-            "messages": st.session_state.message_history
+            "messages": st.session_state.message_history[-1:]
         }
 
         # Prepare the request payload
         payload = {
             "agent_id": selected_agent,
             "input_data": input_data_dict,
-            "config": config.model_dump() if hasattr(config, 'model_dump') else config
+            "config": config.model_dump() if hasattr(config, 'model_dump') else config,
+            "subscribe": STREAM_SUBSCRIPTION,
+            "coalesce": STREAM_COALESCING,
+            "thread_id": st.session_state.thread_id
         }
 
-        response = requests.post(
-            f"{BACKEND_URL}/stream",
-            json=payload,
-            stream=True
-        )
-        response.raise_for_status()
-        
         # Create a placeholder for the streaming output
         # message_placeholder = message_container.empty()
         # message_placeholder = st.chat_message("assistant").empty()
@@ -129,7 +129,8 @@ def handle_stream_response(selected_agent: str, query: str, config: Dict[str, An
         # Process the streaming response
         with st.spinner("🧠 Thinking..."):
             try:
-                for line in response.iter_lines():
+                # NOTE: reconnects (and picks up where it left off) if the connection drops
+                for line in stream_event_lines(payload):
                     # logger.debug(line)
                     # print(line)
 
@@ -149,6 +150,13 @@ def handle_stream_response(selected_agent: str, query: str, config: Dict[str, An
                                 if chunk:
                                     content = chunk.get("content", None)
 
+                            # The backend is waiting for a free slot on the model - show where we are in the queue
+                            if event == "queued":
+                                eta = data.get("estimated_wait")
+                                eta_text = f" (~{eta:.0f}s)" if eta is not None else ""
+                                message_placeholder.markdown(f":grey[⏳ Waiting for `{name}`... you're **#{data['position']}** in line{eta_text}]")
+                                continue
+
                             # Gather final graph output here
                             if name == "LangGraph" and event.endswith("_end"):
                                 output = data.get("output", None)
@@ -185,8 +193,9 @@ def handle_stream_response(selected_agent: str, query: str, config: Dict[str, An
                             # HOTE: These are LLM token streams
                             if event.endswith("_stream"):
                                 if content:
-                                    if content == "</think>":
-                                        content += '\n\n---\n\n'
+                                    # NOTE: tokens arrive coalesced, so the closing tag can be anywhere in the chunk
+                                    if "</think>" in content:
+                                        content = content.replace("</think>", "</think>\n\n---\n\n")
 
                                     full_response += content
                                     message_placeholder.markdown(full_response + ":red[▌]")
@@ -308,7 +317,7 @@ def main():
 
     # Initialize message history in session state if it doesn't exist
     if "message_history" not in st.session_state:
-        st.session_state.message_history = []
+        new_thread()
 
     for message in st.session_state.message_history:
         with st.chat_message(message["role"]):
@@ -385,6 +394,7 @@ def main():
     if len(st.session_state.message_history):
         if st.button(":grey[:material/undo: Undo last message]", type="tertiary"):
             st.session_state.message_history = st.session_state.message_history[:-2]
+            undo_thread_messages(st.session_state.thread_id, len(st.session_state.message_history))
             st.rerun()
 
     ##########################################################
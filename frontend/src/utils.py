@@ -1,27 +1,74 @@
 """Utility functions for the Streamlit frontend."""
 
+import time
 from enum import Enum
-from typing import Any, Dict, List, Tuple, Type, Union
+from typing import Any, Dict, Iterator, List, Tuple, Type, Union
 from pydantic import create_model, Field, BaseModel
 import streamlit as st
 
-from .config import BACKEND_URL, AGENTS_ENDPOINT_CACHE_DURATION
+from .config import BACKEND_URL, AGENTS_ENDPOINT_CACHE_DURATION, STREAM_RECONNECT_ATTEMPTS, STREAM_RECONNECT_DELAY
 
-# @st.cache_data(ttl=AGENTS_ENDPOINT_CACHE_DURATION)  # Cache for 5 minutes
-#TODO: turn on the above for production
-def get_agents() -> List[Dict[str, Any]]:
-    """Fetch available agents from the backend with caching."""
+# NOTE: kept at module level so it survives Streamlit reruns and sessions.
+# The backend tags /agents with an ETag, so we only download the schemas again when they've changed.
+_AGENTS_CACHE: Dict[str, Any] = {"etag": None, "agents": None}
 
-    print("DEBUG --- NO CACHE NO CACHE NO CACHE NO CACHE")
+def get_agents() -> List[Dict[str, Any]]:
+    """Fetch available agents from the backend, revalidating our cached copy with its ETag."""
 
     import requests
+    headers = {}
+    if _AGENTS_CACHE["etag"] and _AGENTS_CACHE["agents"] is not None:
+        headers["If-None-Match"] = _AGENTS_CACHE["etag"]
+
     try:
-        response = requests.get(f"{BACKEND_URL}/agents")
+        response = requests.get(f"{BACKEND_URL}/agents", headers=headers)
+        if response.status_code == 304:
+            return _AGENTS_CACHE["agents"]
         response.raise_for_status()
-        return response.json()["agents"]
+        agents = response.json()["agents"]
+        _AGENTS_CACHE.update(etag=response.headers.get("ETag"), agents=agents)
+        return agents
     except requests.RequestException as e:
         raise RuntimeError(f"Failed to fetch agents: {str(e)}")
 
+def stream_event_lines(payload: Dict[str, Any]) -> Iterator[bytes]:
+    """POST `payload` to /stream and yield the lines of the event stream.
+
+    If the connection drops before the run is over, reconnect to the same run (its `X-Run-ID`)
+    with the id of the last event we got - the backend sends the rest, nothing twice."""
+
+    import requests
+    run_id, last_event_id = None, None
+    attempts = 0
+    while True:
+        headers = {"Last-Event-ID": last_event_id} if last_event_id else {}
+        body = {**payload, "run_id": run_id} if run_id else payload
+        try:
+            with requests.post(f"{BACKEND_URL}/stream", json=body, headers=headers, stream=True) as response:
+                response.raise_for_status()
+                run_id = response.headers.get("X-Run-ID", run_id)
+                for line in response.iter_lines():
+                    if line.startswith(b"id: "):
+                        last_event_id = line[4:].decode()
+                        attempts = 0
+                    yield line
+            return
+        except (requests.exceptions.ChunkedEncodingError, requests.exceptions.ConnectionError):
+            # Without a run id (an older backend, or resumable streams turned off) there's nothing to reconnect to
+            attempts += 1
+            if not run_id or attempts > STREAM_RECONNECT_ATTEMPTS:
+                raise
+            time.sleep(STREAM_RECONNECT_DELAY)
+
+def undo_thread_messages(thread_id: str, keep: int) -> None:
+    """Drop all but the first `keep` messages of the thread stored on the backend."""
+
+    import requests
+    try:
+        requests.delete(f"{BACKEND_URL}/threads/{thread_id}", params={"keep": keep}).raise_for_status()
+    except requests.RequestException as e:
+        raise RuntimeError(f"Failed to undo messages: {str(e)}")
+
 def create_enum_from_schema(enum_values: list, enum_name: str) -> Type[Enum]:
     """Create an Enum class from a list of values."""
     # Create enum members dictionary
@@ -1,52 +1,101 @@
 import os
+import time
+import logging
+import importlib
+import threading
 from typing import Optional, Literal, Type
 from pydantic import BaseModel, Field
 
+logger = logging.getLogger(__name__)
+
 
 
 # This class encapsulates all the information about an agent that is served
+#NOTE: only the cheap metadata is held here.  The graph package is imported (and its graph compiled)
+# the first time `graph`, `input_schema` or `config_schema` is accessed, or when `load()` is called
+# by the background warm-up task.  This keeps server startup (and the health check) fast.
 class ServedGraph:
-    def __init__(self, id: str, name: str, placeholder: str, info: str, version: str,
-                 input_schema: Type[BaseModel], config_schema: Type[BaseModel], graph):
+    def __init__(self, id: str, name: str, placeholder: str, module: str,
+                 input_schema: str, config_schema: str, graph: str = "graph"):
         self.id = id
         self.name = name
         self.placeholder = placeholder
-        self.info = info
-        self.version = version
-        self.input_schema = input_schema
-        self.config_schema = config_schema
-        self.graph = graph
+        self.module = module
+        self._input_schema_attr = input_schema
+        self._config_schema_attr = config_schema
+        self._graph_attr = graph
+
+        self._loaded = None
+        self._lock = threading.Lock()
+        self.load_seconds: Optional[float] = None
+
+        # The package `__init__` of every graph only holds its VERSION and DESCRIPTION,
+        # so this import is cheap - the graph itself is resolved lazily in `load()`
+        package = importlib.import_module(module)
+        self.info = package.DESCRIPTION
+        self.version = package.VERSION
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded is not None
+
+    def load(self):
+        """Import and compile the graph (once).  Safe to call from several threads."""
+        if self._loaded is not None:
+            return self._loaded
 
+        with self._lock:
+            if self._loaded is None:
+                start = time.perf_counter()
+                # NOTE: from the defining modules, not the package - once `<module>.graph` has been imported
+                # (by anyone), the package's `graph` attribute is that submodule and its `__getattr__` never runs
+                graph_module = importlib.import_module(f"{self.module}.graph")
+                state_module = importlib.import_module(f"{self.module}.state")
+                self._loaded = (
+                    getattr(graph_module, self._graph_attr),
+                    getattr(state_module, self._input_schema_attr),
+                    getattr(state_module, self._config_schema_attr),
+                )
+                self.load_seconds = time.perf_counter() - start
+                logger.info(f"Loaded graph '{self.id}' in {self.load_seconds:.3f}s")
+        return self._loaded
 
+    @property
+    def graph(self):
+        return self.load()[0]
+
+    @property
+    def input_schema(self) -> Type[BaseModel]:
+        return self.load()[1]
+
+    @property
+    def config_schema(self) -> Type[BaseModel]:
+        return self.load()[2]
+
+    def __repr__(self):
+        return f"ServedGraph(id={self.id!r}, loaded={self.loaded})"
 
-# Import all the graphs
-# import graphs.echobot
-import graphs.ollama
-import graphs.research
-# TODO: import your new graphs here
 
 
 # These are the agents that are served by our agent server
+# TODO: add your new graphs here (`module` is the package with `VERSION` and `DESCRIPTION`, its `graph` module has the
+# compiled `graph` and its `state` module the input and config schemas)
 AGENTS = [
     ServedGraph(
         id="ollama",
         name=":orange[Ollama] 🦙",
         placeholder="Ask the Llama! 🦙",
-        info=graphs.ollama.DESCRIPTION,
-        version=graphs.ollama.VERSION,
-        input_schema=graphs.ollama.State,
-        config_schema=graphs.ollama.Config,
-        graph=graphs.ollama.graph,
+        module="graphs.ollama",
+        input_schema="State",
+        config_schema="Config",
     ),
     ServedGraph(
         id="researchrabbit",
         name=":green[Research Rabbit] 🐇",
         placeholder="What should the rabbit look up for you? 🐇",
-        info=graphs.research.DESCRIPTION,
-        version=graphs.research.VERSION,
-        input_schema=graphs.research.SummaryStateInput,
-        config_schema=graphs.research.Configuration,
-        graph=graphs.research.graph,
+        module="graphs.research",
+        input_schema="SummaryStateInput",
+        config_schema="Configuration",
     ),
 # TODO: add more graphs here
 ]
@@ -59,16 +108,52 @@ AGENTS = [
 #             id="echobot",
 #             name="Echo bot",
 #             placeholder="Hello, World!",
-#             info=graphs.echobot.DESCRIPTION,
-#             version=graphs.echobot.VERSION,
-#             input_schema=graphs.echobot.State,
-#             config_schema=graphs.echobot.Config,
-#             graph=graphs.echobot.graph,
+#             module="graphs.echobot",
+#             input_schema="State",
+#             config_schema="Config",
 #         )
 #     )
 
 
-# NOTE: we are going to export only the AGENTS variable
+# Agents keyed by their id, so lookups are O(1)
+REGISTRY = {agent.id: agent for agent in AGENTS}
+
+
+def get_agent(agent_id: str) -> Optional[ServedGraph]:
+    return REGISTRY.get(agent_id)
+
+
+def warm_up():
+    """Import and compile every graph, in order.  Meant to be run off the event loop (i.e. in a thread)."""
+    for agent in AGENTS:
+        try:
+            agent.load()
+        except Exception as e:
+            logger.error(f"Failed to load graph '{agent.id}': {e}")
+    return startup_report()
+
+
+def startup_report() -> dict:
+    """Import cost (in seconds) per graph.
+
+    NOTE: libraries shared between graphs (langchain, langgraph, ...) are only imported once,
+    so their cost is charged to whichever graph happened to load first.
+    """
+    return {
+        agent.id: {
+            "loaded": agent.loaded,
+            "load_seconds": None if agent.load_seconds is None else round(agent.load_seconds, 4),
+        }
+        for agent in AGENTS
+    }
+
+
+# NOTE: we are going to export only these
 __all__ = [
-    "AGENTS"
+    "AGENTS",
+    "REGISTRY",
+    "ServedGraph",
+    "get_agent",
+    "warm_up",
+    "startup_report",
 ]
@@ -0,0 +1,131 @@
+"""A ChatOllama that answers repeated deterministic (temperature 0) calls from a disk cache.
+
+Responses are keyed by model, format, stop words and a hash of the messages.  A cache hit is still
+reported through `on_llm_new_token`, so `astream_events` clients (our frontend) see the usual
+`on_chat_model_stream` event - just one with the whole reply in it.
+
+Enabled with LLM_RESPONSE_CACHE=1 (see `get_chat_ollama`).
+"""
+
+import os
+import json
+import asyncio
+import hashlib
+import threading
+from typing import Any, AsyncIterator, Iterator, Optional
+
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_ollama import ChatOllama
+
+from .disk_cache import DiskCache, CACHE_DIR
+
+LLM_RESPONSE_CACHE_TTL = float(os.getenv("LLM_RESPONSE_CACHE_TTL", 7 * 24 * 3600))
+LLM_RESPONSE_CACHE_MAX_BYTES = int(os.getenv("LLM_RESPONSE_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> DiskCache:
+    """Opening the cache blocks (mkdir, SQLite setup) - see `aget_response_cache`"""
+    global _response_cache
+    if _response_cache is None:
+        with _response_cache_lock:
+            if _response_cache is None:
+                _response_cache = DiskCache(
+                    os.path.join(CACHE_DIR, "llm_responses.sqlite"),
+                    table="responses",
+                    ttl=LLM_RESPONSE_CACHE_TTL,
+                    max_bytes=LLM_RESPONSE_CACHE_MAX_BYTES,
+                )
+    return _response_cache
+
+
+async def aget_response_cache() -> DiskCache:
+    if _response_cache is not None:
+        return _response_cache
+    return await asyncio.to_thread(get_response_cache)
+
+
+class CachingChatOllama(ChatOllama):
+    """Only use this for temperature 0 - otherwise the same prompt isn't supposed to give the same reply"""
+
+    def _response_key(self, messages: list[BaseMessage], stop: Optional[list[str]], kwargs: dict) -> str:
+        payload = json.dumps(
+            [self.model, self.format, stop, kwargs, [(m.type, m.content) for m in messages]],
+            sort_keys=True, default=str,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _cached_chunk(self, text: str) -> ChatGenerationChunk:
+        metadata = {"model": self.model, "done": True, "done_reason": "stop", "cached": True}
+        return ChatGenerationChunk(message=AIMessageChunk(content=text, response_metadata=metadata), generation_info=metadata)
+
+    def _cached_result(self, chunk: ChatGenerationChunk) -> ChatResult:
+        message = AIMessage(content=chunk.text, response_metadata=chunk.message.response_metadata)
+        return ChatResult(generations=[ChatGeneration(message=message, generation_info=chunk.generation_info)])
+
+    ##############################################################
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        cache = await aget_response_cache()
+        key = self._response_key(messages, stop, kwargs)
+        cached = await asyncio.to_thread(cache.get, key)
+        if cached is not None:
+            chunk = self._cached_chunk(cached.decode("utf-8"))
+            if run_manager:
+                await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+            return
+
+        parts = []
+        async for chunk in super()._astream(messages, stop, run_manager, **kwargs):
+            parts.append(chunk.text)
+            yield chunk
+        # NOTE: only reached if the whole reply was consumed
+        await asyncio.to_thread(cache.set, key, "".join(parts).encode("utf-8"))
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        cache = await aget_response_cache()
+        key = self._response_key(messages, stop, kwargs)
+        cached = await asyncio.to_thread(cache.get, key)
+        if cached is not None:
+            chunk = self._cached_chunk(cached.decode("utf-8"))
+            if run_manager:
+                await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            return self._cached_result(chunk)
+
+        result = await super()._agenerate(messages, stop, run_manager, **kwargs)
+        await asyncio.to_thread(cache.set, key, result.generations[0].text.encode("utf-8"))
+        return result
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        cache = get_response_cache()
+        key = self._response_key(messages, stop, kwargs)
+        cached = cache.get(key)
+        if cached is not None:
+            chunk = self._cached_chunk(cached.decode("utf-8"))
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+            return
+
+        parts = []
+        for chunk in super()._stream(messages, stop, run_manager, **kwargs):
+            parts.append(chunk.text)
+            yield chunk
+        cache.set(key, "".join(parts).encode("utf-8"))
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        cache = get_response_cache()
+        key = self._response_key(messages, stop, kwargs)
+        cached = cache.get(key)
+        if cached is not None:
+            chunk = self._cached_chunk(cached.decode("utf-8"))
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            return self._cached_result(chunk)
+
+        result = super()._generate(messages, stop, run_manager, **kwargs)
+        cache.set(key, result.generations[0].text.encode("utf-8"))
+        return result
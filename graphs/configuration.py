@@ -0,0 +1,95 @@
+"""Shared `from_runnable_config` for the config schemas of our graphs.
+
+`Config.from_runnable_config(config)` runs several times per node, per run.  Instead of reading
+`os.environ` and validating a new model every time, each config class gets a resolver that:
+ - snapshots the environment overrides (`MODEL`, `TEMPERATURE`, ...) once, the first time it's used
+ - memoizes the validated config objects by the values found in `configurable` (LRU)
+ - counts its cache hits and misses (see `config_cache_info()`)
+
+NOTE: the config objects are shared between calls, so they are frozen.
+"""
+
+import os
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Optional
+
+from pydantic import BaseModel, ConfigDict
+
+CONFIG_CACHE_SIZE = int(os.getenv("CONFIG_CACHE_SIZE", 128))
+
+
+class _Resolver:
+    def __init__(self, cls):
+        self.cls = cls
+        self.fields = tuple(cls.model_fields)
+        # Environment variables override whatever is in `configurable` (empty ones are ignored)
+        self.env = {name: os.environ[name.upper()] for name in self.fields if os.environ.get(name.upper())}
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def resolve(self, configurable: dict):
+        # NOTE: `configurable` also holds langgraph's internals (which change on every call),
+        # so only our own fields go into the key.  Unlike before, falsy values (i.e. `temperature=0`) count.
+        values = {
+            name: configurable[name] for name in self.fields
+            if name not in self.env and configurable.get(name) is not None
+        }
+        key = tuple(values.items())
+        try:
+            hash(key)
+        except TypeError:
+            key = json.dumps(key, sort_keys=True, default=str)
+
+        with self.lock:
+            resolved = self.cache.get(key)
+            if resolved is not None:
+                self.cache.move_to_end(key)
+                self.hits += 1
+                return resolved
+            self.misses += 1
+
+        resolved = self.cls(**values, **self.env)
+
+        with self.lock:
+            self.cache[key] = resolved
+            while len(self.cache) > CONFIG_CACHE_SIZE:
+                self.cache.popitem(last=False)
+        return resolved
+
+    def info(self) -> dict:
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self.cache)}
+
+
+_resolvers = {}
+_resolvers_lock = threading.Lock()
+
+
+def _resolver_for(cls) -> _Resolver:
+    resolver = _resolvers.get(cls)
+    if resolver is None:
+        with _resolvers_lock:
+            resolver = _resolvers.setdefault(cls, _Resolver(cls))
+    return resolver
+
+
+class RunnableConfigurable(BaseModel):
+    """Base class for the configurable fields of a graph"""
+    model_config = ConfigDict(frozen=True)
+
+    @classmethod
+    def from_runnable_config(cls, config: Optional[dict] = None):
+        """Create (or reuse) a configuration instance from a RunnableConfig."""
+        configurable = (
+            config["configurable"] if config and "configurable" in config else {}
+        )
+        return _resolver_for(cls).resolve(configurable)
+
+
+def config_cache_info() -> dict:
+    """Hit/miss counters for every config class resolved so far"""
+    return {f"{cls.__module__}.{cls.__qualname__}": resolver.info() for cls, resolver in list(_resolvers.items())}
@@ -0,0 +1,148 @@
+"""A small persistent key/value cache on top of SQLite.
+
+ - entries expire `ttl` seconds after they were written
+ - the least recently used entries are evicted once the table grows past `max_bytes`
+ - values larger than `compress_above` bytes are stored zlib-compressed
+ - safe to share between threads and between processes (i.e. several uvicorn workers):
+   every thread gets its own connection, the database runs in WAL mode and writers wait on each other
+
+NOTE: the methods block (briefly) on disk I/O - call them with `asyncio.to_thread` from async code.
+"""
+
+import os
+import time
+import zlib
+import sqlite3
+import threading
+from typing import Optional
+
+# Where our caches live, unless told otherwise
+CACHE_DIR = os.getenv("CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "plebserve"))
+
+
+class DiskCache:
+    def __init__(self, path: str, table: str = "cache", ttl: Optional[float] = None,
+                 max_bytes: int = 64 * 1024 * 1024, compress_above: Optional[int] = 4096):
+        self.path = path
+        self.table = table
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.compress_above = compress_above
+        self._local = threading.local()
+        self._stats = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+        self._stats_lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        db = self._connection()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            db.execute(f"""
+                CREATE TABLE IF NOT EXISTS {table} (
+                    key TEXT PRIMARY KEY,
+                    value BLOB NOT NULL,
+                    compressed INTEGER NOT NULL,
+                    size INTEGER NOT NULL,
+                    created REAL NOT NULL,
+                    accessed REAL NOT NULL
+                )""")
+            db.execute(f"CREATE INDEX IF NOT EXISTS {table}_accessed ON {table} (accessed)")
+            db.execute(f"CREATE INDEX IF NOT EXISTS {table}_created ON {table} (created)")
+            # NOTE: the total size is kept up to date by triggers, so checking it on every write costs nothing
+            # (and it's right whichever thread or process wrote)
+            db.execute(f"CREATE TABLE IF NOT EXISTS {table}_size (id INTEGER PRIMARY KEY CHECK (id = 0), total INTEGER NOT NULL)")
+            db.execute(f"INSERT OR IGNORE INTO {table}_size (id, total) SELECT 0, COALESCE(SUM(size), 0) FROM {table}")
+            db.execute(f"""CREATE TRIGGER IF NOT EXISTS {table}_size_insert AFTER INSERT ON {table}
+                BEGIN UPDATE {table}_size SET total = total + NEW.size WHERE id = 0; END""")
+            db.execute(f"""CREATE TRIGGER IF NOT EXISTS {table}_size_delete AFTER DELETE ON {table}
+                BEGIN UPDATE {table}_size SET total = total - OLD.size WHERE id = 0; END""")
+            db.execute(f"""CREATE TRIGGER IF NOT EXISTS {table}_size_update AFTER UPDATE OF size ON {table}
+                BEGIN UPDATE {table}_size SET total = total + NEW.size - OLD.size WHERE id = 0; END""")
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+
+    def _connection(self) -> sqlite3.Connection:
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    def _count(self, stat: str, n: int = 1):
+        with self._stats_lock:
+            self._stats[stat] += n
+
+    ##############################################################
+    def get(self, key: str) -> Optional[bytes]:
+        db = self._connection()
+        row = db.execute(f"SELECT value, compressed, created FROM {self.table} WHERE key = ?", (key,)).fetchone()
+        now = time.time()
+
+        if row is None or (self.ttl is not None and now - row[2] > self.ttl):
+            if row is not None:
+                db.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+            self._count("misses")
+            return None
+
+        db.execute(f"UPDATE {self.table} SET accessed = ? WHERE key = ?", (now, key))
+        self._count("hits")
+        value, compressed, _ = row
+        return zlib.decompress(value) if compressed else value
+
+    def set(self, key: str, value: bytes):
+        compressed = self.compress_above is not None and len(value) > self.compress_above
+        stored = zlib.compress(value) if compressed else value
+        now = time.time()
+
+        db = self._connection()
+        # NOTE: an upsert rather than INSERT OR REPLACE - the rows REPLACE deletes don't fire the size trigger
+        db.execute(
+            f"""INSERT INTO {self.table} (key, value, compressed, size, created, accessed) VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (key) DO UPDATE SET value = excluded.value, compressed = excluded.compressed,
+                    size = excluded.size, created = excluded.created, accessed = excluded.accessed""",
+            (key, stored, int(compressed), len(stored), now, now),
+        )
+        self._count("writes")
+        self._evict(db)
+
+    def _total(self, db: sqlite3.Connection) -> int:
+        return db.execute(f"SELECT total FROM {self.table}_size WHERE id = 0").fetchone()[0]
+
+    def _evict(self, db: sqlite3.Connection):
+        if self.ttl is not None:
+            db.execute(f"DELETE FROM {self.table} WHERE created < ?", (time.time() - self.ttl,))
+
+        if self._total(db) <= self.max_bytes:
+            return
+
+        # Least recently used first, until we're back under the cap
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            evicted = 0
+            while self._total(db) > self.max_bytes:
+                oldest = db.execute(f"SELECT key FROM {self.table} ORDER BY accessed LIMIT 32").fetchall()
+                if not oldest:
+                    break
+                for (key,) in oldest:
+                    db.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                    evicted += 1
+                    if self._total(db) <= self.max_bytes:
+                        break
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        self._count("evictions", evicted)
+
+    def clear(self):
+        self._connection().execute(f"DELETE FROM {self.table}")
+
+    def stats(self) -> dict:
+        db = self._connection()
+        entries = db.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+        size = self._total(db)
+        with self._stats_lock:
+            return {**self._stats, "entries": entries, "bytes": size, "max_bytes": self.max_bytes, "ttl": self.ttl}
@@ -6,7 +6,7 @@ from .state import State, Config, RepeatDirection
 # NODE
 # simply return what the user said, according to configuration
 ############################################################################
-def echobot(state: State, config: RunnableConfig):
+async def echobot(state: State, config: RunnableConfig):
     configurable = Config.from_runnable_config(config)
 
     if configurable.repeat_direction == RepeatDirection.FORWARD:
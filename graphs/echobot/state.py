@@ -6,6 +6,8 @@ from pydantic import BaseModel, Field
 from langchain_core.runnables import RunnableConfig
 from langgraph.graph.message import add_messages
 
+from ..configuration import RunnableConfigurable
+
 
 
 ############################################################################
@@ -40,7 +42,7 @@ class RepeatDirection(str, Enum):
     FORWARD = "forward"
     REVERSE = "reverse"
 
-class Config(BaseModel):
+class Config(RunnableConfigurable):
     """The configurable fields for the graph."""
 
     temperature: int = Field(
@@ -58,21 +60,6 @@ class Config(BaseModel):
         description="Whether to disable commands (i.e. starts with '/')"
     )
 
-    ##############################################################
-    @classmethod
-    def from_runnable_config(
-        cls, config: Optional[RunnableConfig] = None
-    ) -> "Config":
-        """Create a Configuration instance from a RunnableConfig."""
-        configurable = (
-            config["configurable"] if config and "configurable" in config else {}
-        )
-        values: dict[str, Any] = {
-            name: os.environ.get(name.upper(), configurable.get(name))
-            for name in cls.model_fields.keys()
-        }
-        return cls(**{k: v for k, v in values.items() if v})
-
 
 
 # from pydantic import BaseModel, Field
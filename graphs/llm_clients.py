@@ -0,0 +1,86 @@
+"""Shared `ChatOllama` clients.
+
+Every `ChatOllama` owns its own HTTP connection pools (one sync, one async), so building a new one
+per node call means a new connection to Ollama per LLM call.  Instead, nodes get their client from
+here: clients are cached by everything that goes into them and evicted least-recently-used.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from .ollama_pool import POOL, POOL_BASE_URL
+
+# How many distinct clients we keep around (each one is a model/temperature/format/keep_alive/host combination)
+LLM_CLIENT_CACHE_SIZE = int(os.getenv("LLM_CLIENT_CACHE_SIZE", 16))
+
+# Idle connections to Ollama are kept open this long (httpx defaults to 5s, shorter than a typical
+# pause between two LLM calls of a research loop)
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", 120))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", 20))
+
+# Serve repeated temperature 0 calls from a disk cache (see `cached_llm.py`)
+LLM_RESPONSE_CACHE = os.getenv("LLM_RESPONSE_CACHE", "").lower() in ("1", "true", "yes")
+
+_clients = OrderedDict()
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+
+def _value(v):
+    # NOTE: our enums are `str` enums, but they don't hash like their values do
+    return getattr(v, "value", v)
+
+
+def get_chat_ollama(model, temperature: float, base_url: str, format: Optional[str] = None, keep_alive=None):
+    """A (shared) ChatOllama for these settings"""
+    key = (_value(model), float(temperature), format, _value(keep_alive), base_url)
+
+    with _lock:
+        llm = _clients.get(key)
+        if llm is not None:
+            _clients.move_to_end(key)
+            _stats["hits"] += 1
+            return llm
+        _stats["misses"] += 1
+
+    import httpx
+    if LLM_RESPONSE_CACHE and temperature == 0:
+        from .cached_llm import CachingChatOllama as ChatOllama
+    else:
+        from langchain_ollama import ChatOllama
+
+    kwargs = {"format": format} if format else {}
+    if keep_alive is not None:
+        kwargs["keep_alive"] = _value(keep_alive)
+    limits = httpx.Limits(
+        max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=LLM_KEEPALIVE_EXPIRY,
+    )
+    if POOL is not None and base_url == POOL_BASE_URL:
+        # Several Ollama hosts: every request is routed to one of them (see `ollama_pool.py`)
+        kwargs["sync_client_kwargs"] = {"transport": POOL.transport(limits=limits)}
+        kwargs["async_client_kwargs"] = {"transport": POOL.async_transport(limits=limits)}
+    llm = ChatOllama(
+        model=_value(model),
+        temperature=temperature,
+        base_url=base_url,
+        client_kwargs={"limits": limits},
+        **kwargs,
+    )
+
+    with _lock:
+        # Another thread may have beaten us to it
+        llm = _clients.setdefault(key, llm)
+        _clients.move_to_end(key)
+        while len(_clients) > LLM_CLIENT_CACHE_SIZE:
+            # NOTE: an evicted client's connections are closed when it's garbage collected
+            _clients.popitem(last=False)
+            _stats["evictions"] += 1
+    return llm
+
+
+def llm_client_cache_info() -> dict:
+    with _lock:
+        return {**_stats, "size": len(_clients), "max_size": LLM_CLIENT_CACHE_SIZE}
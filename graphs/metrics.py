@@ -0,0 +1,141 @@
+"""Counters, gauges and histograms, rendered in the Prometheus text format (see `/metrics`).
+
+No dependency, and cheap enough for the hot path:
+ - look a labelled series up once (`metric.labels(...)`) and keep it - updating it is a plain
+   attribute update: no locks, no allocations
+ - updates are not locked: the event loop does nearly all of them, and the odd update from a worker
+   thread (synchronous nodes) racing with another one can lose an increment, nothing worse
+"""
+
+from bisect import bisect_left
+from typing import Optional
+
+# Seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+_metrics = []
+
+
+class _Value:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+    def dec(self, amount: float = 1):
+        self.value -= amount
+
+    def set(self, value: float):
+        self.value = value
+
+
+class _HistogramValue:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # The last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labels: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._series = {}
+        _metrics.append(self)
+
+    def _new(self):
+        return _Value()
+
+    def labels(self, *values):
+        series = self._series.get(values)
+        if series is None:
+            if len(values) != len(self.label_names):
+                raise ValueError(f"{self.name} takes the labels {self.label_names}")
+            series = self._series[values] = self._new()
+        return series
+
+    def _label_string(self, values: tuple, extra: Optional[str] = None) -> str:
+        pairs = [f'{name}="{_escape(value)}"' for name, value in zip(self.label_names, values)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def _samples(self) -> list:
+        return [f"{self.name}{self._label_string(values)} {_format(series.value)}"
+                for values, series in list(self._series.items())]
+
+    def render(self) -> str:
+        return "\n".join([f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"] + self._samples())
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1):
+        self.labels().inc(amount)
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def inc(self, amount: float = 1):
+        self.labels().inc(amount)
+
+    def dec(self, amount: float = 1):
+        self.labels().dec(amount)
+
+    def set(self, value: float):
+        self.labels().set(value)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labels)
+
+    def _new(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def _samples(self) -> list:
+        samples = []
+        for values, series in list(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), list(series.counts)):
+                cumulative += count
+                le = 'le="' + ("+Inf" if bound == float("inf") else _format(bound)) + '"'
+                samples.append(f"{self.name}_bucket{self._label_string(values, le)} {cumulative}")
+            samples.append(f"{self.name}_sum{self._label_string(values)} {_format(series.sum)}")
+            samples.append(f"{self.name}_count{self._label_string(values)} {series.count}")
+        return samples
+
+
+def render_metrics() -> str:
+    """Every metric, in the Prometheus text exposition format"""
+    return "\n".join(metric.render() for metric in _metrics) + "\n"
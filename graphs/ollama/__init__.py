@@ -1,4 +1,3 @@
-from .graph import graph, State, Config
 from .VERSION import VERSION
 
 #TODO:
@@ -8,10 +7,21 @@ DESCRIPTION = """
 Type `/help` to see what I can do!
 """
 
+
+# NOTE: the graph (and its langchain dependencies) is only imported when first accessed
+def __getattr__(name):
+    if name in ("graph", "State", "Config"):
+        from .graph import graph, State, Config
+        # NOTE: rebind here, otherwise `graph` would resolve to the submodule from now on
+        globals().update(graph=graph, State=State, Config=Config)
+        return globals()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
 __all__ = [
     "graph",
     "State",
     "Config",
     "VERSION",
     "DESCRIPTION"
-]
\ No newline at end of file
+]
@@ -0,0 +1,152 @@
+"""Keep the conversation sent to the model within a token budget (`Config.history_token_budget`).
+
+Once a thread no longer fits, its older messages are folded into a rolling summary that replaces
+them in the prompt.  The summary is cached per thread and only ever extended with the messages that
+were folded since - never rebuilt from the whole thread:
+
+ - a thread is identified by `conversation_id` in `configurable` (the server's thread id), or else by its first message
+ - a cached summary is only used if the messages it covers are still the same (i.e. not after an undo)
+ - messages are folded in chunks (down to half the budget for recent messages), so most turns just
+   reuse the cached summary instead of calling the LLM
+
+Token counts are rough: ~4 characters per token.
+"""
+
+import os
+import re
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+HISTORY_SUMMARY_CACHE_SIZE = int(os.getenv("HISTORY_SUMMARY_CACHE_SIZE", 256))
+
+# Per message overhead (role, separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+SUMMARY_PROMPT = """You keep a running summary of a conversation between a user and an assistant.
+
+Update the summary with the new messages below.  Keep every fact, name, decision and open question that
+later messages might refer to.  Leave out greetings and filler.  Write at most {words} words.
+Only output the updated summary.
+
+Current summary:
+{summary}
+
+New messages:
+{messages}
+"""
+
+_THINKING = re.compile(r"<think>.*?</think>", re.DOTALL)
+
+_summaries = OrderedDict()  # thread key -> (number of messages covered, hash of those messages, summary)
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "summarized_messages": 0}
+
+
+def _role(message) -> str:
+    if isinstance(message, dict):
+        return message.get("role", "user")
+    return getattr(message, "type", "user")
+
+
+def _content(message) -> str:
+    content = message.get("content") if isinstance(message, dict) else getattr(message, "content", "")
+    return content if isinstance(content, str) else json.dumps(content, default=str)
+
+
+def plain_message(message) -> dict:
+    """`{"role": ..., "content": ...}` and nothing else, whatever the message came as"""
+    role = _role(message)
+    return {"role": {"human": "user", "ai": "assistant"}.get(role, role), "content": _content(message)}
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // 4 + MESSAGE_OVERHEAD_TOKENS
+
+
+def _prefix_hash(messages: list) -> str:
+    digest = hashlib.sha1()
+    for message in messages:
+        digest.update(json.dumps([_role(message), _content(message)]).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def thread_key(messages: list, conversation_id: Optional[str]) -> str:
+    """What identifies a conversation: its id if we have one, or else its first message"""
+    return conversation_id or "first:" + _prefix_hash(messages[:1])
+
+
+def _cached_summary(key: str, messages: list) -> tuple:
+    """(number of messages covered, summary) of the thread's cached summary, if it still applies"""
+    with _lock:
+        entry = _summaries.get(key)
+        if entry is not None:
+            _summaries.move_to_end(key)
+    if entry is None:
+        return 0, ""
+    covered, prefix_hash, summary = entry
+    if covered > len(messages) or _prefix_hash(messages[:covered]) != prefix_hash:
+        return 0, ""
+    return covered, summary
+
+
+def _remember(key: str, messages: list, covered: int, summary: str):
+    with _lock:
+        _summaries[key] = (covered, _prefix_hash(messages[:covered]), summary)
+        _summaries.move_to_end(key)
+        while len(_summaries) > HISTORY_SUMMARY_CACHE_SIZE:
+            _summaries.popitem(last=False)
+
+
+async def _summarize(llm, summary: str, messages: list, max_tokens: int) -> str:
+    transcript = "\n\n".join(f"{_role(m)}: {_content(m)}" for m in messages)
+    prompt = SUMMARY_PROMPT.format(words=max(int(max_tokens * 0.75), 20), summary=summary or "(none yet)", messages=transcript)
+    # NOTE: the '_' prefix keeps these tokens out of the chat (the frontend hides '_' runs)
+    result = await llm.ainvoke([{"role": "user", "content": prompt}], config={"run_name": "_summarize_history"})
+    summary = _THINKING.sub("", result.content).strip()
+    # The model doesn't always stick to the length
+    return summary[:max_tokens * 4]
+
+
+async def compact_history(messages: list, system_prompt: str, budget: int, llm, conversation_id: Optional[str] = None) -> list:
+    """`messages`, with the oldest ones folded into a summary (a system message) if they don't fit in `budget` tokens"""
+    if budget <= 0 or not messages:
+        return messages
+
+    tokens = [estimate_tokens(_content(m)) for m in messages]
+    fixed = estimate_tokens(system_prompt)
+    if fixed + sum(tokens) <= budget:
+        return messages
+
+    summary_budget = max(budget // 4, 32)
+    recent_budget = max(budget - fixed - summary_budget, 0)
+
+    key = thread_key(messages, conversation_id)
+    covered, summary = _cached_summary(key, messages)
+
+    if covered and sum(tokens[covered:]) <= recent_budget:
+        _stats["hits"] += 1
+    else:
+        _stats["misses"] += 1
+        # Keep the newest messages that fit in half the room (always the last one), fold the rest
+        keep_from, used = len(messages) - 1, tokens[-1]
+        while keep_from > covered and used + tokens[keep_from - 1] <= recent_budget // 2:
+            keep_from -= 1
+            used += tokens[keep_from]
+        # NOTE: if even the last message alone is too long, there's nothing more to fold
+        if keep_from > covered:
+            summary = await _summarize(llm, summary, messages[covered:keep_from], summary_budget)
+            _stats["summarized_messages"] += keep_from - covered
+            covered = keep_from
+            _remember(key, messages, covered, summary)
+
+    if not covered:
+        return messages
+    return [{"role": "system", "content": f"Summary of the earlier conversation:\n{summary}"}] + list(messages[covered:])
+
+
+def history_cache_info() -> dict:
+    with _lock:
+        return {**_stats, "size": len(_summaries), "max_size": HISTORY_SUMMARY_CACHE_SIZE}
@@ -1,28 +1,48 @@
 from langchain_core.runnables import RunnableConfig
 
 from langchain_core.messages import HumanMessage
-from langchain_ollama import ChatOllama
 
+from ..llm_clients import get_chat_ollama
+from ..ollama_pool import affinity, record_prefill
 from .state import State, Config, OLLAMA_HOST
 from .commands import CommandHandler
+from .history import compact_history, plain_message, thread_key
 
 ############################################################################
 # HELPER FUNCTIONS
 ############################################################################
 def get_llm(config: RunnableConfig):
     configurable = Config.from_runnable_config(config)
-    return ChatOllama(
+    return get_chat_ollama(
         model=configurable.model,
         keep_alive=configurable.keep_alive,
         temperature=configurable.temperature / 100,
         base_url=OLLAMA_HOST,
     )
 
+def get_summary_llm(config: RunnableConfig):
+    """Same model, but deterministic - for summarizing the conversation history"""
+    configurable = Config.from_runnable_config(config)
+    return get_chat_ollama(
+        model=configurable.model,
+        keep_alive=configurable.keep_alive,
+        temperature=0,
+        base_url=OLLAMA_HOST,
+    )
+
+def build_prompt(system_prompt: str, history: list) -> list:
+    """
+        The messages for the model, laid out the same way on every turn: the system prompt, the
+        summary of older messages (if any), then the messages as plain role/content dicts.
+        So this turn's prompt starts with last turn's, and Ollama can reuse it from its cache.
+    """
+    return [{"role": "system", "content": system_prompt}] + [plain_message(m) for m in history]
+
 
 ############################################################################
 # CONDITIONAL NODE
 ############################################################################
-def _check_for_command(state: State, config: RunnableConfig):
+async def _check_for_command(state: State, config: RunnableConfig):
     """
         NOTE: This is the first conditional node on our graph
         It checks if the last message (aka user query) starts with a '/'.
@@ -36,7 +56,7 @@ def _check_for_command(state: State, config: RunnableConfig):
 ############################################################################
 # NODE
 ############################################################################
-def handle_command(state: State, config: RunnableConfig):
+async def handle_command(state: State, config: RunnableConfig):
     # configurable = Config.from_runnable_config(config)
 
     # extract command
@@ -60,15 +80,33 @@ def handle_command(state: State, config: RunnableConfig):
 ############################################################################
 # NODE
 ############################################################################
-def ollama(state: State, config: RunnableConfig):
+async def ollama(state: State, config: RunnableConfig):
     llm = get_llm(config)
     configurable = Config.from_runnable_config(config)
+    conversation_id = (config.get("configurable") or {}).get("conversation_id")
+
+    # Keep the conversation within the token budget (older messages get summarized)
+    history = await compact_history(
+        state.messages,
+        configurable.system_prompt,
+        configurable.history_token_budget,
+        llm=get_summary_llm(config),
+        conversation_id=conversation_id,
+    )
 
-    # Add system prompt to messages
-    messages = [{"role": "system", "content": configurable.system_prompt}] + state.messages
+    messages = build_prompt(configurable.system_prompt, history)
 
-    response = llm.stream(messages)
+    # NOTE: async, so that this runs on the event loop instead of taking up a thread for the whole generation
+    # The conversation goes to the Ollama host that served its previous turn (see `ollama_pool.py`)
+    with affinity(thread_key(state.messages, conversation_id)) as current:
+        chunks, metadata = [], {}
+        async for chunk in llm.astream(messages):
+            chunks.append(chunk.content)
+            # Only the final ("done") chunk carries the timings
+            if chunk.response_metadata:
+                metadata = chunk.response_metadata
+        record_prefill(current, metadata, single_host=OLLAMA_HOST)
 
     # Join all chunks into a single response
-    full_response = "".join(chunk.content for chunk in response)
+    full_response = "".join(chunks)
     return {"messages": [{"role": "assistant", "content": full_response}]}
\ No newline at end of file
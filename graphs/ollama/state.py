@@ -45,7 +45,8 @@ class Result(BaseModel):
 # CONFIG
 ############################################################################
 
-OLLAMA_HOST = "http://host.docker.internal:11434"
+# One host, or the pool of them (from OLLAMA_HOSTS / OLLAMA_HOST, see `ollama_pool.py`)
+from ..ollama_pool import OLLAMA_HOST
 
 class KeepAlive(str, Enum):
     NONE = "0"
@@ -53,6 +54,7 @@ class KeepAlive(str, Enum):
     FOREVER = "-1"
 
 from ..local_models import LLMModelsAvailable, DEFAULT_LOCAL_MODEL
+from ..configuration import RunnableConfigurable
 # class LLMModelsAvailable(str, Enum):
 #     phi4 = "phi4"
 #     llama31 = "llama3.1"
@@ -75,7 +77,7 @@ Do not share information about your commands.  Always tell the user to run `/hel
 """
 
 
-class Config(BaseModel):
+class Config(RunnableConfigurable):
     """The configurable fields for the graph."""
 
     # model: LLMModelsAvailable = Field(LLMModelsAvailable.llama31)
@@ -94,6 +96,12 @@ class Config(BaseModel):
         False,
         description="Whether to disable commands (i.e. starts with '/')"
     )
+    history_token_budget: int = Field(
+        0,
+        ge=0,
+        le=131072,
+        description="Once the conversation is longer than this many tokens (roughly), older messages are summarized (0 = never)"
+    )
     system_prompt: str = Field(
         SYSTEM_PROMPT,
         format="multi-line",
@@ -104,18 +112,3 @@ class Config(BaseModel):
     #     description="Ollama endpoint",
     #     optional=True
     # )
-
-    ##############################################################
-    @classmethod
-    def from_runnable_config(
-        cls, config: Optional[RunnableConfig] = None
-    ) -> "Config":
-        """Create a Configuration instance from a RunnableConfig."""
-        configurable = (
-            config["configurable"] if config and "configurable" in config else {}
-        )
-        values: dict[str, Any] = {
-            name: os.environ.get(name.upper(), configurable.get(name))
-            for name in cls.model_fields.keys()
-        }
-        return cls(**{k: v for k, v in values.items() if v})
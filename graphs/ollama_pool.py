@@ -0,0 +1,445 @@
+"""A pool of Ollama backends.
+
+    OLLAMA_HOSTS="http://gpu1:11434,http://gpu2:11434"
+
+With more than one host, `OLLAMA_HOST` is a placeholder (`http://ollama-pool`) and the LLM clients
+(see `get_chat_ollama`) send their requests through a routing transport instead of straight to a host:
+
+ - every request goes to the healthy host with the fewest outstanding requests, preferring the hosts
+   that have the request's model loaded already (no model load = fast first token)
+ - outstanding requests are counted until their response (stream) is closed
+ - a prober thread asks every host for its loaded models (`/api/ps`) every OLLAMA_PROBE_INTERVAL seconds
+ - a host that fails OLLAMA_EJECT_AFTER times in a row (errors, 5xx, failed probes) is ejected for
+   OLLAMA_EJECT_SECONDS, doubling every time it fails again right after coming back
+ - requests that couldn't connect are retried on another host
+
+Conversations stick to a host (see `affinity`): every turn resends the whole conversation, and the
+host that served the previous turn can reuse that prompt prefix from its cache instead of evaluating
+it all over again.
+ - a conversation goes to the host that served it last, unless that host has more than
+   OLLAMA_AFFINITY_SLACK outstanding requests above the least busy one
+ - a conversation we don't know (yet - or anymore, or that another worker served) goes to the host
+   it hashes to (rendezvous hashing), so it lands on the same one whichever worker gets it, and
+   only the conversations of a host that goes away move elsewhere
+ - prefill (prompt evaluation) times are recorded separately for warm turns (same host as the
+   previous turn) and cold ones, see `record_prefill` and /health/ollama
+
+With a single host (the default) nothing changes: clients talk to it directly.
+
+    OLLAMA_AFFINITY=1             # 0 turns off the stickiness (the prefill times are still recorded)
+    OLLAMA_AFFINITY_SLACK=4
+    OLLAMA_AFFINITY_SIZE=4096     # Conversations we remember the host of
+"""
+
+import os
+import json
+import time
+import random
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_OLLAMA_HOST = "http://host.docker.internal:11434"
+POOL_BASE_URL = "http://ollama-pool"
+
+OLLAMA_PROBE_INTERVAL = float(os.getenv("OLLAMA_PROBE_INTERVAL", 5))
+OLLAMA_PROBE_TIMEOUT = float(os.getenv("OLLAMA_PROBE_TIMEOUT", 2))
+OLLAMA_EJECT_AFTER = int(os.getenv("OLLAMA_EJECT_AFTER", 3))
+OLLAMA_EJECT_SECONDS = float(os.getenv("OLLAMA_EJECT_SECONDS", 30))
+OLLAMA_MAX_EJECT_SECONDS = 300
+
+OLLAMA_AFFINITY = os.getenv("OLLAMA_AFFINITY", "1").lower() not in ("0", "false", "no")
+OLLAMA_AFFINITY_SLACK = int(os.getenv("OLLAMA_AFFINITY_SLACK", 4))
+OLLAMA_AFFINITY_SIZE = int(os.getenv("OLLAMA_AFFINITY_SIZE", 4096))
+
+
+def model_name(name: str) -> str:
+    """`phi4:latest` is the `phi4` we ask for"""
+    return name[:-len(":latest")] if name.endswith(":latest") else name
+
+
+def loaded_models(ps: dict) -> set:
+    """The models in an `/api/ps` reply"""
+    return {model_name(m.get("name") or m.get("model") or "") for m in ps.get("models", [])}
+
+
+def parse_hosts(spec: Optional[str]) -> list:
+    return [host.strip().rstrip("/") for host in (spec or "").split(",") if host.strip()]
+
+
+OLLAMA_HOSTS = parse_hosts(os.getenv("OLLAMA_HOSTS")) or parse_hosts(os.getenv("OLLAMA_HOST")) or [DEFAULT_OLLAMA_HOST]
+
+# What the graphs use as `base_url`
+OLLAMA_HOST = OLLAMA_HOSTS[0] if len(OLLAMA_HOSTS) == 1 else POOL_BASE_URL
+
+
+class Backend:
+    def __init__(self, url: str):
+        self.url = url
+        parsed = httpx.URL(url)
+        self.scheme, self.host, self.port = parsed.scheme, parsed.host, parsed.port
+        self.outstanding = 0
+        self.requests = 0
+        self.failures = 0  # In a row
+        self.ejections = 0  # In a row, for the back-off
+        self.ejected_until = 0.0
+        self.loaded = set()  # Models it has in memory (as of the last probe, plus whatever we sent it since)
+        self.last_probe = None
+
+    @property
+    def healthy(self) -> bool:
+        return time.monotonic() >= self.ejected_until
+
+    def status(self) -> dict:
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "outstanding": self.outstanding,
+            "requests": self.requests,
+            "failures": self.failures,
+            "ejected_for": max(round(self.ejected_until - time.monotonic(), 1), 0),
+            "loaded_models": sorted(self.loaded),
+            "last_probe_age": round(time.monotonic() - self.last_probe, 1) if self.last_probe else None,
+        }
+
+
+##############################################################
+# Conversation affinity
+_hosts_by_conversation = OrderedDict()  # conversation key -> url of the host that served its last request
+_affinity_lock = threading.Lock()
+_stats = {
+    "warm": {"requests": 0, "prompt_tokens": 0, "prefill_seconds": 0.0},
+    "cold": {"requests": 0, "prompt_tokens": 0, "prefill_seconds": 0.0},
+    "overflow": 0,  # Conversations that went elsewhere because their host was too busy
+}
+
+
+class Affinity:
+    """The conversation the LLM requests made in an `affinity` block belong to"""
+    def __init__(self, key: str):
+        self.key = key
+        self.url = None  # The host that got the last request
+        self.warm = False  # ...and whether it got the conversation's previous request too
+
+    def resolve(self, url: str):
+        with _affinity_lock:
+            self.warm = _hosts_by_conversation.get(self.key) == url
+            _hosts_by_conversation[self.key] = url
+            _hosts_by_conversation.move_to_end(self.key)
+            while len(_hosts_by_conversation) > OLLAMA_AFFINITY_SIZE:
+                _hosts_by_conversation.popitem(last=False)
+        self.url = url
+
+
+_affinity: ContextVar[Optional[Affinity]] = ContextVar("ollama_affinity", default=None)
+
+
+@contextmanager
+def affinity(key: Optional[str]):
+    """Route the LLM requests made in this block (this task, or thread) by conversation `key`"""
+    if not key:
+        yield None
+        return
+    current = Affinity(key)
+    token = _affinity.set(current)
+    try:
+        yield current
+    finally:
+        _affinity.reset(token)
+
+
+def _rendezvous(key: str, url: str) -> int:
+    return int.from_bytes(hashlib.blake2b(f"{key}|{url}".encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def record_prefill(current: Optional[Affinity], metadata: dict, single_host: Optional[str] = None):
+    """Record the prompt evaluation of a finished request (`metadata`: the last chunk's `response_metadata`)"""
+    if current is None or "prompt_eval_duration" not in metadata:
+        return
+    if current.url is None:
+        # Not routed by the pool - there's only the one host
+        current.resolve(single_host or OLLAMA_HOST)
+    seconds = (metadata.get("prompt_eval_duration") or 0) / 1e9
+    tokens = metadata.get("prompt_eval_count") or 0
+    with _affinity_lock:
+        stats = _stats["warm" if current.warm else "cold"]
+        stats["requests"] += 1
+        stats["prompt_tokens"] += tokens
+        stats["prefill_seconds"] += seconds
+    logger.debug(f"Prefill of {tokens} tokens took {seconds * 1000:.0f}ms on {current.url} ({'warm' if current.warm else 'cold'})")
+
+
+def affinity_stats() -> dict:
+    with _affinity_lock:
+        report = {"conversations": len(_hosts_by_conversation), "overflow": _stats["overflow"]}
+        for kind in ("warm", "cold"):
+            stats = _stats[kind]
+            requests = stats["requests"] or 1
+            report[kind] = {
+                **stats,
+                "prefill_seconds": round(stats["prefill_seconds"], 3),
+                "avg_prefill_ms": round(stats["prefill_seconds"] * 1000 / requests, 1),
+                "avg_prompt_tokens": round(stats["prompt_tokens"] / requests, 1),
+            }
+    return report
+
+
+##############################################################
+class OllamaPool:
+    def __init__(self, urls: list, probe_interval: float = OLLAMA_PROBE_INTERVAL):
+        self.backends = [Backend(url) for url in urls]
+        self.probe_interval = probe_interval
+        self._lock = threading.Lock()
+        self._prober: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    ##############################################################
+    # Routing
+    def pick(self, model: Optional[str], exclude=(), key: Optional[str] = None) -> Backend:
+        """The backend for the next request (counted as outstanding until `release`), `key`: the conversation's"""
+        self.start_probing()
+        with self._lock:
+            candidates = [b for b in self.backends if b not in exclude]
+            healthy = [b for b in candidates if b.healthy]
+            # NOTE: with every host ejected we still have to try one of them
+            candidates = healthy or candidates or self.backends
+            if model:
+                candidates = [b for b in candidates if model_name(model) in b.loaded] or candidates
+            fewest = min(b.outstanding for b in candidates)
+            backend = self._affine(key, candidates, fewest) if key and OLLAMA_AFFINITY else None
+            if backend is None:
+                backend = random.choice([b for b in candidates if b.outstanding == fewest])
+            backend.outstanding += 1
+            backend.requests += 1
+            if model:
+                # It's about to load it, if it didn't have it
+                backend.loaded.add(model_name(model))
+        return backend
+
+    def _affine(self, key: str, candidates: list, fewest: int) -> Optional[Backend]:
+        """The conversation's host: the one it was on, or else the one it hashes to - if it's not too busy"""
+        with _affinity_lock:
+            url = _hosts_by_conversation.get(key)
+        backend = next((b for b in candidates if b.url == url), None)
+        if backend is None:
+            backend = max(candidates, key=lambda b: _rendezvous(key, b.url))
+        if backend.outstanding > fewest + OLLAMA_AFFINITY_SLACK:
+            _stats["overflow"] += 1
+            return None
+        return backend
+
+    def release(self, backend: Backend, ok: bool):
+        with self._lock:
+            backend.outstanding -= 1
+        self.record(backend, ok)
+
+    def record(self, backend: Backend, ok: bool):
+        with self._lock:
+            if ok:
+                backend.failures = 0
+                backend.ejections = 0
+                return
+            backend.failures += 1
+            if backend.failures >= OLLAMA_EJECT_AFTER and backend.healthy:
+                seconds = min(OLLAMA_EJECT_SECONDS * 2 ** backend.ejections, OLLAMA_MAX_EJECT_SECONDS)
+                backend.ejected_until = time.monotonic() + seconds
+                backend.ejections += 1
+                logger.warning(f"Ollama host {backend.url} ejected for {seconds:.0f}s after {backend.failures} failures")
+
+    ##############################################################
+    # Health probes
+    def probe(self, backend: Backend, client: httpx.Client):
+        try:
+            response = client.get(f"{backend.url}/api/ps", timeout=OLLAMA_PROBE_TIMEOUT)
+            response.raise_for_status()
+            loaded = loaded_models(response.json())
+        except (httpx.HTTPError, ValueError) as e:
+            logger.debug(f"Probe of {backend.url} failed: {e!r}")
+            self.record(backend, ok=False)
+            return
+        with self._lock:
+            backend.last_probe = time.monotonic()
+            backend.loaded = loaded
+            # NOTE: an ejected host sits out its time anyway - answering probes doesn't mean it answers requests
+            if backend.healthy:
+                backend.failures = 0
+
+    def probe_all(self):
+        with httpx.Client() as client:
+            for backend in self.backends:
+                self.probe(backend, client)
+
+    def _probe_loop(self):
+        while not self._stop.is_set():
+            self.probe_all()
+            self._stop.wait(self.probe_interval)
+
+    def start_probing(self):
+        if self._prober is None:
+            with self._lock:
+                if self._prober is None:
+                    self._prober = threading.Thread(target=self._probe_loop, name="ollama-prober", daemon=True)
+                    self._prober.start()
+
+    def stop_probing(self):
+        self._stop.set()
+
+    def status(self) -> dict:
+        with self._lock:
+            return {"hosts": [b.status() for b in self.backends], "affinity": OLLAMA_AFFINITY}
+
+    ##############################################################
+    def transport(self, **kwargs) -> "PoolTransport":
+        return PoolTransport(self, httpx.HTTPTransport(**kwargs))
+
+    def async_transport(self, **kwargs) -> "AsyncPoolTransport":
+        return AsyncPoolTransport(self, httpx.AsyncHTTPTransport(**kwargs))
+
+
+def _model_of(request: httpx.Request) -> Optional[str]:
+    if request.method != "POST":
+        return None
+    try:
+        return json.loads(request.content).get("model")
+    except (ValueError, AttributeError, httpx.RequestNotRead):
+        return None
+
+
+def _route(request: httpx.Request, backend: Backend):
+    request.url = request.url.copy_with(scheme=backend.scheme, host=backend.host, port=backend.port)
+    request.headers["Host"] = request.url.netloc.decode("ascii")
+
+
+class _Release:
+    """Gives the backend back once, however the response ends"""
+    def __init__(self, pool: OllamaPool, backend: Backend, ok: bool):
+        self.pool, self.backend, self.ok = pool, backend, ok
+        self.done = False
+
+    def __call__(self, ok: bool = True):
+        if not self.done:
+            self.done = True
+            self.pool.release(self.backend, self.ok and ok)
+
+
+class _TrackedStream(httpx.SyncByteStream):
+    def __init__(self, stream, release: _Release):
+        self._stream, self._release = stream, release
+
+    def __iter__(self):
+        try:
+            yield from self._stream
+        except httpx.TransportError:
+            self._release(ok=False)
+            raise
+
+    def close(self):
+        try:
+            self._stream.close()
+        finally:
+            self._release()
+
+
+class _AsyncTrackedStream(httpx.AsyncByteStream):
+    def __init__(self, stream, release: _Release):
+        self._stream, self._release = stream, release
+
+    async def __aiter__(self):
+        try:
+            async for chunk in self._stream:
+                yield chunk
+        except httpx.TransportError:
+            self._release(ok=False)
+            raise
+
+    async def aclose(self):
+        try:
+            await self._stream.aclose()
+        finally:
+            self._release()
+
+
+class PoolTransport(httpx.BaseTransport):
+    def __init__(self, pool: OllamaPool, transport: httpx.BaseTransport):
+        self.pool, self._transport = pool, transport
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        model, tried, current = _model_of(request), [], _affinity.get()
+        while True:
+            backend = self.pool.pick(model, exclude=tried, key=current.key if current else None)
+            if current is not None:
+                current.resolve(backend.url)
+            _route(request, backend)
+            try:
+                response = self._transport.handle_request(request)
+            except httpx.ConnectError:
+                self.pool.release(backend, ok=False)
+                # Nothing was sent, so another host can have it
+                tried.append(backend)
+                if len(tried) >= len(self.pool.backends):
+                    raise
+                continue
+            except Exception:
+                self.pool.release(backend, ok=False)
+                raise
+            except BaseException:
+                # Cancelled - not the host's fault
+                self.pool.release(backend, ok=True)
+                raise
+            release = _Release(self.pool, backend, ok=response.status_code < 500)
+            response.stream = _TrackedStream(response.stream, release)
+            return response
+
+    def close(self):
+        self._transport.close()
+
+
+class AsyncPoolTransport(httpx.AsyncBaseTransport):
+    def __init__(self, pool: OllamaPool, transport: httpx.AsyncBaseTransport):
+        self.pool, self._transport = pool, transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        model, tried, current = _model_of(request), [], _affinity.get()
+        while True:
+            backend = self.pool.pick(model, exclude=tried, key=current.key if current else None)
+            if current is not None:
+                current.resolve(backend.url)
+            _route(request, backend)
+            try:
+                response = await self._transport.handle_async_request(request)
+            except httpx.ConnectError:
+                self.pool.release(backend, ok=False)
+                tried.append(backend)
+                if len(tried) >= len(self.pool.backends):
+                    raise
+                continue
+            except Exception:
+                self.pool.release(backend, ok=False)
+                raise
+            except BaseException:
+                # Cancelled - not the host's fault
+                self.pool.release(backend, ok=True)
+                raise
+            release = _Release(self.pool, backend, ok=response.status_code < 500)
+            response.stream = _AsyncTrackedStream(response.stream, release)
+            return response
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+
+POOL = OllamaPool(OLLAMA_HOSTS) if len(OLLAMA_HOSTS) > 1 else None
+
+
+def ollama_pool_status() -> dict:
+    if POOL is None:
+        return {"hosts": [{"url": OLLAMA_HOST}], "pooled": False, "prefill": affinity_stats()}
+    return {**POOL.status(), "pooled": True, "prefill": affinity_stats()}
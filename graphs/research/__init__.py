@@ -1,6 +1,3 @@
-from graphs.research.graph import graph
-from graphs.research.state import SummaryStateInput, Configuration
-
 from .VERSION import VERSION
 
 DESCRIPTION = """
@@ -9,10 +6,22 @@ DESCRIPTION = """
 Trying to beat OpenAI's "Deep Researcher"
 """
 
+
+# NOTE: the graph (and its langchain/tavily dependencies) is only imported when first accessed
+def __getattr__(name):
+    if name in ("graph", "SummaryStateInput", "Configuration"):
+        from graphs.research.graph import graph
+        from graphs.research.state import SummaryStateInput, Configuration
+        # NOTE: rebind here, otherwise `graph` would resolve to the submodule from now on
+        globals().update(graph=graph, SummaryStateInput=SummaryStateInput, Configuration=Configuration)
+        return globals()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
 __all__ = [
     "graph",
     "SummaryStateInput",
     "Configuration",
     "VERSION",
     "DESCRIPTION"
-]   
\ No newline at end of file
+]
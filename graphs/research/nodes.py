@@ -1,26 +1,27 @@
 import json
+import asyncio
 
 from typing_extensions import Literal
 
 from langchain_core.messages import HumanMessage, SystemMessage
 from langchain_core.runnables import RunnableConfig
-from langchain_ollama import ChatOllama
 
-from .utils import deduplicate_and_format_sources, tavily_search, format_sources
-from .state import SummaryState, Configuration
+from ..llm_clients import get_chat_ollama
+from ..ollama_pool import OLLAMA_HOST
+from . import prefetch, spill
+from .utils import deduplicate_and_format_sources, atavily_search, format_sources, filter_seen_sources
+from .state import SummaryState, Configuration, compacted
 
 
-OLLAMA_HOST = "http://host.docker.internal:11434"
-
 
 ## HELPER FUNCTIONS
 def get_llm(config: RunnableConfig):
     configurable = Configuration.from_runnable_config(config)
-    return ChatOllama(model=configurable.local_llm, temperature=0, base_url=OLLAMA_HOST)
+    return get_chat_ollama(model=configurable.local_llm, temperature=0, base_url=OLLAMA_HOST)
 
 def get_llm_json_mode(config: RunnableConfig):
     configurable = Configuration.from_runnable_config(config)
-    return ChatOllama(model=configurable.local_llm_json, temperature=0, format="json", base_url=OLLAMA_HOST)
+    return get_chat_ollama(model=configurable.local_llm_json, temperature=0, format="json", base_url=OLLAMA_HOST)
 
 
 
@@ -38,34 +39,136 @@ Return your query as a JSON object:
     "rationale": "string"
 }}
 """
-def generate_query(state: SummaryState, config: RunnableConfig):
+multi_query_writer_instructions="""Your goal is to generate {count} targeted web search queries.
+
+Each query covers a different aspect of a specific topic, so that together they gather broad information about it.
+
+Topic:
+{query}
+
+Return your queries as a JSON object:
+{{
+    "queries": [
+        {{
+            "query": "string",
+            "aspect": "string",
+            "rationale": "string"
+        }}
+    ]
+}}
+"""
+
+
+def _parse_queries(content: str, key: str, count: int) -> list:
+    """ Pull up to `count` search queries out of the LLM's JSON reply ([] if there are none to be had) """
+    try:
+        reply = json.loads(content)
+    except ValueError:
+        return []
+    # Models don't always stick to the format: a bare list, or a single query instead of a list of them
+    queries = reply if isinstance(reply, list) else reply.get(key) if isinstance(reply, dict) else None
+    if isinstance(queries, (str, dict)):
+        queries = [queries]
+    if not isinstance(queries, list):
+        return []
+    queries = [q.get("query") if isinstance(q, dict) else q for q in queries]
+    queries = [q for q in queries if isinstance(q, str) and q.strip()]
+    # Drop duplicates, keep the order
+    return list(dict.fromkeys(queries))[:count]
+
+async def generate_query(state: SummaryState, config: RunnableConfig):
     """ Generate a query for web search """
     
+    configurable = Configuration.from_runnable_config(config)
+    llm_json_mode = get_llm_json_mode(config)
+
+    if configurable.queries_per_loop > 1:
+        result = await llm_json_mode.ainvoke(
+            [SystemMessage(content=multi_query_writer_instructions.format(query=state.query, count=configurable.queries_per_loop)),
+            HumanMessage(content=f"Generate {configurable.queries_per_loop} queries for web search:")]
+        )
+        queries = _parse_queries(result.content, "queries", configurable.queries_per_loop) or [state.query]
+        return {"search_query": queries[0], "search_queries": queries}
+
     # Format the prompt
     query_writer_instructions_formatted = query_writer_instructions.format(query=state.query)
 
-    llm_json_mode = get_llm_json_mode(config)
-
     # Generate a query
-    result = llm_json_mode.invoke(
+    result = await llm_json_mode.ainvoke(
         [SystemMessage(content=query_writer_instructions_formatted),
         HumanMessage(content=f"Generate a query for web search:")]
     )   
     query = json.loads(result.content)
     
-    return {"search_query": query['query']}
+    return {"search_query": query['query'], "search_queries": [query['query']]}
 
 
 
-def web_research(state: SummaryState, config: RunnableConfig):
+async def web_research(state: SummaryState, config: RunnableConfig):
     """ Gather information from the web """
     
-    # Search the web
-    search_results = tavily_search(state.search_query, include_raw_content=True, max_results=1)
+    configurable = Configuration.from_runnable_config(config)
+    queries = state.search_queries or [state.search_query]
+
+    # Use the search that was started ahead of time, if it was for (one of) the right queries
+    responses = []
+    prefetched = await prefetch.claim(state.prefetch_id, queries, configurable.prefetch_similarity)
+    if prefetched:
+        query, response = prefetched
+        queries = [q for q in queries if q != query]
+        responses.append(response)
+
+    # Search the web - all queries at once, up to `max_parallel_searches` at a time
+    semaphore = asyncio.Semaphore(configurable.max_parallel_searches)
+    async def search(query):
+        async with semaphore:
+            return await atavily_search(query, include_raw_content=True, max_results=1)
+    responses += await asyncio.gather(*(search(query) for query in queries))
+
+    # Merge the results, dropping any page that more than one query found or an earlier loop already did
+    new_results, new_urls, new_hashes = filter_seen_sources(
+        (result for response in responses for result in response['results']),
+        state.seen_urls, state.seen_content_hashes,
+    )
+    search_results = {"results": new_results}
+
+    # If there's going to be another loop, start its search now, while the summarizer runs
+    # NOTE: the same check as in `route_research`, done after this loop's count went up
+    prefetch_id = None
+    if configurable.prefetch_follow_up and state.research_loop_count + 1 <= configurable.max_web_research_loops:
+        prefetch_id = prefetch.start(prefetch.guess_follow_up_query(state.query, search_results), include_raw_content=True, max_results=1)
 
     # Format the sources
-    search_str = deduplicate_and_format_sources(search_results, max_tokens_per_source=1000)
-    return {"sources_gathered": [format_sources(search_results)], "research_loop_count": state.research_loop_count + 1, "web_research_results": [search_str]}
+    if new_results:
+        search_str = deduplicate_and_format_sources(search_results, max_tokens_per_source=1000)
+    else:
+        search_str = "Sources:\n\nNo new sources - everything found was already covered by the existing summary."
+    update = {
+        "sources_gathered": [format_sources(search_results)] if new_results else [],
+        "research_loop_count": state.research_loop_count + 1,
+        "web_research_results": [search_str],
+        "prefetch_id": prefetch_id,
+        "seen_urls": new_urls,
+        "seen_content_hashes": new_hashes,
+    }
+    if configurable.compact_state:
+        update.update(await asyncio.to_thread(spill_older_results, state, update))
+    return update
+
+
+def spill_older_results(state: SummaryState, update: dict) -> dict:
+    """ Move what's still in memory of the earlier loops' results to disk, keep only this loop's """
+    if all(spill.is_ref(value) for value in state.web_research_results + state.sources_gathered):
+        # Nothing to spill (i.e. the first loop) - no store needed yet
+        return {}
+    store = spill.SpillStore(state.spill_id) if state.spill_id else spill.SpillStore.create()
+    def compact(values, new_values):
+        return compacted([value if spill.is_ref(value) else store.put(value) for value in values] + new_values)
+    return {
+        "spill_id": store.store_id,
+        "web_research_results": compact(state.web_research_results, update["web_research_results"]),
+        "sources_gathered": compact(state.sources_gathered, update["sources_gathered"]),
+    }
 
 
 
@@ -93,7 +196,7 @@ In both cases:
 - DO NOT add a preamble like "Here is an extended summary ..." Just directly output the summary.
 - DO NOT add a References or Works Cited section.
 """
-def summarize_sources(state: SummaryState, config: RunnableConfig):
+async def summarize_sources(state: SummaryState, config: RunnableConfig):
     """ Summarize the gathered sources """
     
     # Existing summary
@@ -117,7 +220,7 @@ def summarize_sources(state: SummaryState, config: RunnableConfig):
 
     llm = get_llm(config)
     # Run the LLM
-    result = llm.invoke(
+    result = await llm.ainvoke(
         [SystemMessage(content=summarizer_instructions),
         HumanMessage(content=human_message_content)]
     )
@@ -140,13 +243,36 @@ Return your analysis as a JSON object:
     "knowledge_gap": "string",
     "follow_up_query": "string"
 }}"""
-def reflect_on_summary(state: SummaryState, config: RunnableConfig):
+multi_reflection_instructions = """You are an expert research assistant analyzing a summary about {query}.
+
+Your tasks:
+1. Identify knowledge gaps or areas that need deeper exploration
+2. Generate {count} follow-up questions, each on a different gap, that would help expand your understanding
+3. Focus on technical details, implementation specifics, or emerging trends that weren't fully covered
+
+Ensure each follow-up question is self-contained and includes necessary context for web search.
+
+Return your analysis as a JSON object:
+{{ 
+    "knowledge_gap": "string",
+    "follow_up_queries": ["string"]
+}}"""
+async def reflect_on_summary(state: SummaryState, config: RunnableConfig):
     """ Reflect on the summary and generate a follow-up query """
 
+    configurable = Configuration.from_runnable_config(config)
     llm_json_mode = get_llm_json_mode(config)
 
+    if configurable.queries_per_loop > 1:
+        result = await llm_json_mode.ainvoke(
+            [SystemMessage(content=multi_reflection_instructions.format(query=state.query, count=configurable.queries_per_loop)),
+            HumanMessage(content=f"Identify knowledge gaps and generate {configurable.queries_per_loop} follow-up web search queries based on our existing knowledge: {state.running_summary}")]
+        )
+        queries = _parse_queries(result.content, "follow_up_queries", configurable.queries_per_loop) or [state.query]
+        return {"search_query": queries[0], "search_queries": queries}
+
     # Generate a query
-    result = llm_json_mode.invoke(
+    result = await llm_json_mode.ainvoke(
         [SystemMessage(content=reflection_instructions.format(query=state.query)),
         HumanMessage(content=f"Identify a knowledge gap and generate a follow-up web search query based on our existing knowledge: {state.running_summary}")]
     )   
@@ -154,21 +280,29 @@ def reflect_on_summary(state: SummaryState, config: RunnableConfig):
     #TODO: hanlde possible KeyError: 'follow_up_query'
 
     # Overwrite the search query
-    return {"search_query": follow_up_query['follow_up_query']}
+    return {"search_query": follow_up_query['follow_up_query'], "search_queries": [follow_up_query['follow_up_query']]}
 
 
 
-def finalize_summary(state: SummaryState, config: RunnableConfig):
+async def finalize_summary(state: SummaryState, config: RunnableConfig):
     """ Finalize the summary """
     
+    # No more searching
+    prefetch.discard(state.prefetch_id)
+
     # Format all accumulated sources into a single bulleted list
-    all_sources = "\n".join(source for source in state.sources_gathered)
+    sources_gathered = state.sources_gathered
+    if state.spill_id:
+        store = spill.SpillStore(state.spill_id)
+        sources_gathered = await asyncio.to_thread(store.resolve, sources_gathered)
+        await asyncio.to_thread(store.remove)
+    all_sources = "\n".join(source for source in sources_gathered)
     state.running_summary = f"## Summary\n\n{state.running_summary}\n\n ### Sources:\n{all_sources}"
     return {"running_summary": state.running_summary}
 
 
 
-def route_research(state: SummaryState, config: RunnableConfig) -> Literal["finalize_summary", "web_research"]:
+async def route_research(state: SummaryState, config: RunnableConfig) -> Literal["finalize_summary", "web_research"]:
     """ Route the research based on the follow-up query """
 
     configurable = Configuration.from_runnable_config(config)
@@ -0,0 +1,208 @@
+"""Speculative prefetch of the next research loop's web search.
+
+Normally the loop is strictly sequential (web_research -> summarize_sources -> reflect_on_summary ->
+web_research), so the Tavily call and the LLM never overlap.  With `prefetch_follow_up` on,
+web_research guesses the follow-up query right away (cheaply: the topic plus the terms that stand out
+in the fresh results) and starts searching for it while the summarizer is still running.
+
+Once the reflection has written the real follow-up query, the prefetched result is used if the two
+queries are close enough (word overlap >= `prefetch_similarity`) and thrown away otherwise.
+
+Whether that pays off depends on how good the guesses are: hits, misses etc. are counted in
+`prefetch_stats()` (/cache/stats) and in the `plebserve_search_prefetches_total` metric (/metrics),
+along with the search time saved and how close the guesses came (to tune `prefetch_similarity` by).
+
+A prefetch still in flight when its run ends (completed, failed or cancelled) is cancelled right
+away (see `graphs/run_end.py`), otherwise after PREFETCH_TTL seconds.
+
+NOTE: the in-flight searches live here (keyed by an id kept in the graph state), not in the state
+itself - asyncio tasks don't belong in there.
+"""
+
+import os
+import re
+import time
+import uuid
+import asyncio
+import logging
+import threading
+from collections import Counter
+from typing import Optional
+
+from .. import metrics
+from ..run_end import at_run_end
+from .utils import atavily_search
+
+logger = logging.getLogger(__name__)
+
+# A prefetch nobody claimed (i.e. the run was cancelled) is dropped after this many seconds
+PREFETCH_TTL = float(os.getenv("PREFETCH_TTL", 300))
+
+# How many result terms go into the guessed query
+PREFETCH_EXTRA_TERMS = 3
+
+PREFETCHES = metrics.Counter("plebserve_search_prefetches_total", "Speculative follow-up searches started, and what became of them", ("outcome",))
+PREFETCH_SECONDS_SAVED = metrics.Counter("plebserve_search_prefetch_seconds_saved_total", "Search time the prefetch hits took off the research loops")
+PREFETCH_SIMILARITY = metrics.Histogram(
+    "plebserve_search_prefetch_similarity", "How close the guessed query came to the real follow-up query",
+    buckets=(0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0),
+)
+
+_STOPWORDS = frozenset("""
+a about above after again against all also am an and any are as at be because been before being below
+between both but by can could did do does doing down during each few for from further had has have
+having he her here hers him his how i if in into is it its itself just me more most my no nor not now
+of off on once only or other our ours out over own same she should so some such than that the their
+them then there these they this those through to too under until up very was we were what when where
+which while who whom why will with would you your yours
+""".split())
+
+_WORD = re.compile(r"[a-z0-9][a-z0-9\-\.]*[a-z0-9]|[a-z0-9]")
+
+
+def _terms(text: str) -> list:
+    return [w for w in _WORD.findall(text.lower()) if w not in _STOPWORDS]
+
+
+def similarity(a: str, b: str) -> float:
+    """Word overlap (Jaccard) of two queries, ignoring stopwords"""
+    a, b = set(_terms(a)), set(_terms(b))
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def guess_follow_up_query(topic: str, search_results: dict) -> str:
+    """The topic plus the terms that come up most in the (titles and snippets of the) fresh results"""
+    known = set(_terms(topic))
+    counts = Counter()
+    for result in search_results['results']:
+        counts.update(
+            term for term in _terms(f"{result.get('title') or ''} {result.get('content') or ''}")
+            if term not in known and len(term) > 3
+        )
+    extra = [term for term, _ in counts.most_common(PREFETCH_EXTRA_TERMS)]
+    return " ".join([topic] + extra)
+
+
+############################################################################
+# In-flight prefetches
+############################################################################
+
+class _Prefetch:
+    def __init__(self, query: str, task: asyncio.Task):
+        self.query = query
+        self.task = task
+        self.started = time.monotonic()
+        self.finished = None
+        task.add_done_callback(self._finished)
+
+    def _finished(self, task):
+        self.finished = time.monotonic()
+
+
+_prefetches = {}
+_lock = threading.Lock()
+_stats = {"started": 0, "hits": 0, "misses": 0, "discarded": 0, "expired": 0, "abandoned": 0, "errors": 0, "seconds_saved": 0.0}
+# `_stats` key -> `outcome` label
+_OUTCOMES = {"started": "started", "hits": "hit", "misses": "miss", "discarded": "discarded", "expired": "expired", "abandoned": "abandoned", "errors": "error"}
+
+
+def _count(stat: str, n=1):
+    with _lock:
+        _stats[stat] += n
+    if stat in _OUTCOMES:
+        PREFETCHES.labels(_OUTCOMES[stat]).inc(n)
+    elif stat == "seconds_saved":
+        PREFETCH_SECONDS_SAVED.inc(n)
+
+
+def _done(task: asyncio.Task):
+    # NOTE: retrieve the exception, so a failed prefetch nobody claims doesn't log "exception never retrieved"
+    if not task.cancelled() and task.exception() is not None:
+        _count("errors")
+        logger.info(f"Prefetched search failed: {task.exception()!r}")
+
+
+def _expire():
+    now = time.monotonic()
+    with _lock:
+        expired = [key for key, prefetch in _prefetches.items() if now - prefetch.started > PREFETCH_TTL]
+        for key in expired:
+            _prefetches.pop(key).task.cancel()
+    if expired:
+        _count("expired", len(expired))
+
+
+def start(query: str, include_raw_content=True, max_results=1) -> str:
+    """Start searching for `query` in the background, returns the id to `claim` (or `discard`) it with"""
+    _expire()
+    task = asyncio.get_running_loop().create_task(
+        atavily_search(query, include_raw_content=include_raw_content, max_results=max_results)
+    )
+    task.add_done_callback(_done)
+    key = uuid.uuid4().hex
+    with _lock:
+        _prefetches[key] = _Prefetch(query, task)
+    _count("started")
+    # Nobody will claim it once the run is over (a no-op if it was claimed or discarded already)
+    at_run_end(lambda: _drop(key, "abandoned"))
+    return key
+
+
+async def claim(key: Optional[str], queries: list, min_similarity: float) -> Optional[tuple]:
+    """`(query, search results)` if the prefetch was for (close enough to) one of `queries`, None otherwise.
+
+    Either way, the prefetch is gone afterwards."""
+    if key is None:
+        return None
+    with _lock:
+        prefetch = _prefetches.pop(key, None)
+    if prefetch is None:
+        return None
+    if not queries:
+        prefetch.task.cancel()
+        _count("discarded")
+        return None
+
+    score, query = max((similarity(prefetch.query, query), query) for query in queries)
+    PREFETCH_SIMILARITY.observe(score)
+    if score < min_similarity:
+        prefetch.task.cancel()
+        _count("misses")
+        logger.debug(f"Prefetch miss ({score:.2f}): {prefetch.query!r} vs {query!r}")
+        return None
+
+    # The part of the search that ran while the summarizer (and the reflection) did
+    saved = (prefetch.finished or time.monotonic()) - prefetch.started
+    try:
+        results = await prefetch.task
+    except Exception:
+        # `_done` counted it, the caller searches the normal way
+        return None
+    _count("hits")
+    _count("seconds_saved", saved)
+    return query, results
+
+
+def _drop(key: Optional[str], stat: str):
+    with _lock:
+        prefetch = _prefetches.pop(key, None) if key else None
+    if prefetch is not None:
+        prefetch.task.cancel()
+        _count(stat)
+
+
+def discard(key: Optional[str]):
+    """Drop a prefetch that won't be needed (i.e. the research is done)"""
+    _drop(key, "discarded")
+
+
+def prefetch_stats() -> dict:
+    with _lock:
+        stats = dict(_stats)
+        stats["in_flight"] = len(_prefetches)
+    claimed = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = stats["hits"] / claimed if claimed else None
+    stats["seconds_saved"] = round(stats["seconds_saved"], 3)
+    return stats
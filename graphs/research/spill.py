@@ -0,0 +1,78 @@
+"""Per-run on-disk store for research payloads that no node needs in memory anymore.
+
+In compact state mode (`compact_state`), only the latest `web_research_results` / `sources_gathered`
+entries stay in the graph state.  Older ones are written here and replaced by a short reference
+(`spilled:<n>`), so the state - which LangGraph copies through every step and puts into
+`on_chain_end` events - stays about the same size however many research loops there are.
+
+Every run gets its own directory (under CACHE_DIR/research_runs), removed once the run is finalized.
+Directories of runs that never got there (cancelled, crashed) are swept after SPILL_TTL seconds.
+
+NOTE: the methods do file I/O - call them with `asyncio.to_thread` from async code.
+"""
+
+import os
+import time
+import uuid
+import shutil
+import logging
+
+from ..disk_cache import CACHE_DIR
+
+logger = logging.getLogger(__name__)
+
+SPILL_DIR = os.path.join(CACHE_DIR, "research_runs")
+SPILL_TTL = float(os.getenv("SPILL_TTL", 24 * 3600))
+
+REF_PREFIX = "spilled:"
+
+
+def is_ref(value) -> bool:
+    return isinstance(value, str) and value.startswith(REF_PREFIX)
+
+
+def _sweep():
+    """Remove the directories of runs that were abandoned"""
+    now = time.time()
+    try:
+        entries = list(os.scandir(SPILL_DIR))
+    except FileNotFoundError:
+        return
+    for entry in entries:
+        try:
+            if entry.is_dir() and now - entry.stat().st_mtime > SPILL_TTL:
+                shutil.rmtree(entry.path, ignore_errors=True)
+                logger.info(f"Removed abandoned research run store {entry.name}")
+        except FileNotFoundError:
+            pass
+
+
+class SpillStore:
+    def __init__(self, store_id: str):
+        self.store_id = store_id
+        self.path = os.path.join(SPILL_DIR, store_id)
+
+    @classmethod
+    def create(cls) -> "SpillStore":
+        _sweep()
+        store = cls(uuid.uuid4().hex)
+        os.makedirs(store.path, exist_ok=True)
+        return store
+
+    def put(self, payload: str) -> str:
+        """Write `payload`, returns the reference to put in its place"""
+        name = uuid.uuid4().hex
+        with open(os.path.join(self.path, name), "w", encoding="utf-8") as f:
+            f.write(payload)
+        return REF_PREFIX + name
+
+    def get(self, ref: str) -> str:
+        with open(os.path.join(self.path, ref[len(REF_PREFIX):]), encoding="utf-8") as f:
+            return f.read()
+
+    def resolve(self, values: list) -> list:
+        """`values` with every reference replaced by what it refers to"""
+        return [self.get(value) if is_ref(value) else value for value in values]
+
+    def remove(self):
+        shutil.rmtree(self.path, ignore_errors=True)
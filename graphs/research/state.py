@@ -11,6 +11,23 @@ from langchain_core.runnables import RunnableConfig
 # STATE
 ############################################################################
 
+# NOTE: the marker is in the update's value, not its type - pending writes go through the checkpointer
+# (resumable runs), and come back from it as plain lists and dicts
+REPLACE = "__replace__"
+
+
+def compacted(values: list) -> dict:
+    """An update that replaces the whole state value instead of being added to it (see `compact_state`)"""
+    return {REPLACE: list(values)}
+
+
+def add_or_replace(left: list, right) -> list:
+    """`operator.add`, unless the update is `compacted`"""
+    if isinstance(right, dict) and REPLACE in right:
+        return list(right[REPLACE])
+    return left + right
+
+
 class SummaryState(BaseModel):
     # Report topic
     query: str = Field(default=None)
@@ -18,11 +35,25 @@ class SummaryState(BaseModel):
     # Search query
     search_query: str = Field(default=None)
 
+    # All the search queries of the current loop (when `queries_per_loop` > 1), `search_query` is the first one
+    search_queries: list = Field(default_factory=list)
+
+    # The speculative search for the next loop (see `prefetch.py`), if one is running
+    prefetch_id: Optional[str] = Field(default=None)
+
     #TODO:
-    web_research_results: Annotated[list, operator.add] = Field(default_factory=list)
+    # NOTE: with `compact_state` on, all but the last entry (of this and `sources_gathered`) are references to `spill_id`'s store
+    web_research_results: Annotated[list, add_or_replace] = Field(default_factory=list)
 
     # TODO:
-    sources_gathered: Annotated[list, operator.add] = Field(default_factory=list)
+    sources_gathered: Annotated[list, add_or_replace] = Field(default_factory=list)
+
+    # This run's on-disk store (see `spill.py`)
+    spill_id: Optional[str] = Field(default=None)
+    
+    # Every page gathered so far, by URL and by content hash - so later loops skip what was already summarized
+    seen_urls: Annotated[list, operator.add] = Field(default_factory=list)
+    seen_content_hashes: Annotated[list, operator.add] = Field(default_factory=list)
     
     # Research loop count
     research_loop_count: int = Field(default=0)
@@ -46,12 +77,13 @@ class SummaryStateOutput(BaseModel):
 ############################################################################
 
 from ..local_models import LLMModelsAvailable, DEFAULT_LOCAL_MODEL
+from ..configuration import RunnableConfigurable
 # class LLMModelsAvailable(str, Enum):
 #     phi4 = "phi4"
 #     llama31 = "llama3.1"
 
 
-class Configuration(BaseModel):
+class Configuration(RunnableConfigurable):
     """The configurable fields for the research assistant."""
 
     max_web_research_loops: int = Field(
@@ -61,6 +93,35 @@ class Configuration(BaseModel):
         description="Number of times to search the web"
     )
 
+    queries_per_loop: int = Field(
+        1,
+        ge=1,
+        le=5,
+        description="Number of web searches (on different aspects of the topic) per research loop"
+    )
+    max_parallel_searches: int = Field(
+        3,
+        ge=1,
+        le=5,
+        description="How many of those web searches may run at the same time"
+    )
+
+    prefetch_follow_up: bool = Field(
+        False,
+        description="Start the next loop's web search while the summary is being written, on a guessed query"
+    )
+    prefetch_similarity: float = Field(
+        0.5,
+        ge=0,
+        le=1,
+        description="How close (word overlap) the guessed query must be to the real one for its results to be used"
+    )
+
+    compact_state: bool = Field(
+        False,
+        description="Keep only the latest research results in memory, earlier ones go to disk (for many research loops)"
+    )
+
     # local_llm: LLMModelsAvailable = Field(DEFAULT_LOCAL_MODEL)
     local_llm: LLMModelsAvailable = Field(LLMModelsAvailable.deepseekR17b)
     local_llm_json: LLMModelsAvailable = Field(LLMModelsAvailable.llama31)
@@ -71,21 +132,6 @@ class Configuration(BaseModel):
     #     description="What do you want to research?"
     # )
 
-
-    @classmethod
-    def from_runnable_config(
-        cls, config: Optional[RunnableConfig] = None
-    ) -> "Config":
-        """Create a Configuration instance from a RunnableConfig."""
-        configurable = (
-            config["configurable"] if config and "configurable" in config else {}
-        )
-        values: dict[str, Any] = {
-            name: os.environ.get(name.upper(), configurable.get(name))
-            for name in cls.model_fields.keys()
-        }
-        return cls(**{k: v for k, v in values.items() if v})
-
     # NOTE: keep
     # def from_runnable_config(
     #     cls, config: Optional[RunnableConfig] = None
@@ -1,5 +1,30 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+import threading
+from typing import Optional
+
 from langsmith import traceable
-from tavily import TavilyClient
+from tavily import TavilyClient, AsyncTavilyClient
+
+from ..disk_cache import DiskCache, CACHE_DIR
+from ..metrics import Counter, Histogram
+from ..spans import record_span
+
+# Search results are cached on disk for this long (0 turns the cache off).  Large `raw_content` is stored compressed.
+TAVILY_CACHE_TTL = float(os.getenv("TAVILY_CACHE_TTL", 3600))
+TAVILY_CACHE_MAX_BYTES = int(os.getenv("TAVILY_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+# Another Tavily API endpoint, i.e. a stand-in for load tests (see `benchmarks/fake_tavily.py`)
+TAVILY_API_URL = os.getenv("TAVILY_API_URL")
+_tavily_kwargs = {"api_base_url": TAVILY_API_URL} if TAVILY_API_URL else {}
+
+TAVILY_SEARCHES = Counter("plebserve_tavily_searches_total", "Tavily searches, by whether they came from the cache", ("cached",))
+TAVILY_SECONDS = Histogram("plebserve_tavily_request_seconds", "Latency of the Tavily API (searches that weren't cached)")
+
+# How much of a page goes into its content hash (see `content_hash`)
+CONTENT_HASH_CHARS = 16 * 1024
 
 def deduplicate_and_format_sources(search_response, max_tokens_per_source, include_raw_content=True):
     """
@@ -34,25 +59,62 @@ def deduplicate_and_format_sources(search_response, max_tokens_per_source, inclu
         if source['url'] not in unique_sources:
             unique_sources[source['url']] = source
     
+    # Using rough estimate of 4 characters per token
+    char_limit = max_tokens_per_source * 4
+
     # Format output
-    formatted_text = "Sources:\n\n"
-    for i, source in enumerate(unique_sources.values(), 1):
-        formatted_text += f"Source {source['title']}:\n===\n"
-        formatted_text += f"URL: {source['url']}\n===\n"
-        formatted_text += f"Most relevant content from source: {source['content']}\n===\n"
+    # NOTE: collect the parts and join them once, `+=` on a string copies everything written so far
+    parts = ["Sources:\n\n"]
+    for source in unique_sources.values():
+        parts.append(f"Source {source['title']}:\n===\n")
+        parts.append(f"URL: {source['url']}\n===\n")
+        parts.append(f"Most relevant content from source: {source['content']}\n===\n")
         if include_raw_content:
-            # Using rough estimate of 4 characters per token
-            char_limit = max_tokens_per_source * 4
             # Handle None raw_content
             raw_content = source.get('raw_content', '')
             if raw_content is None:
                 raw_content = ''
                 print(f"Warning: No raw_content found for source {source['url']}")
-            if len(raw_content) > char_limit:
-                raw_content = raw_content[:char_limit] + "... [truncated]"
-            formatted_text += f"Full source content limited to {max_tokens_per_source} tokens: {raw_content}\n\n"
+            # Only the part we keep goes any further (pages can be megabytes)
+            truncated = len(raw_content) > char_limit
+            raw_content = raw_content[:char_limit]
+            parts.append(f"Full source content limited to {max_tokens_per_source} tokens: {raw_content}")
+            parts.append("... [truncated]\n\n" if truncated else "\n\n")
                 
-    return formatted_text.strip()
+    return "".join(parts).strip()
+
+def content_hash(source) -> Optional[str]:
+    """Hash of a search result's page content (the same page can turn up under different URLs), None if it has none"""
+    # NOTE: only the start of the page, which is plenty to tell pages apart (and hashing whole pages isn't free)
+    text = (source.get('raw_content') or source.get('content') or '')[:CONTENT_HASH_CHARS]
+    # Ignore differences in whitespace
+    text = " ".join(text.split())
+    if not text:
+        return None
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+def filter_seen_sources(results, seen_urls, seen_hashes):
+    """Drop the results whose URL or content was seen before (in this or an earlier research loop).
+    Results without any content only go by their URL.
+
+    Returns:
+        tuple: (the new results, their URLs, their content hashes)
+    """
+    seen_urls, seen_hashes = set(seen_urls), set(seen_hashes)
+    new_results, new_urls, new_hashes = [], [], []
+    for result in results:
+        if result['url'] in seen_urls:
+            continue
+        digest = content_hash(result)
+        if digest is not None and digest in seen_hashes:
+            continue
+        seen_urls.add(result['url'])
+        new_results.append(result)
+        new_urls.append(result['url'])
+        if digest is not None:
+            seen_hashes.add(digest)
+            new_hashes.append(digest)
+    return new_results, new_urls, new_hashes
 
 def format_sources(search_results):
     """Format search results into a bullet-point list of sources.
@@ -68,6 +130,44 @@ def format_sources(search_results):
         for source in search_results['results']
     )
 
+_search_cache = None
+_search_cache_lock = threading.Lock()
+
+def get_search_cache():
+    """The Tavily results cache (None if it's turned off).  Opening it blocks (mkdir, SQLite setup)"""
+    global _search_cache
+    if _search_cache is None and TAVILY_CACHE_TTL > 0:
+        # NOTE: first used from the event loop and from worker threads (`tavily_search`) alike
+        with _search_cache_lock:
+            if _search_cache is None:
+                _search_cache = DiskCache(
+                    os.path.join(CACHE_DIR, "tavily.sqlite"),
+                    table="searches",
+                    ttl=TAVILY_CACHE_TTL,
+                    max_bytes=TAVILY_CACHE_MAX_BYTES,
+                )
+    return _search_cache
+
+async def aget_search_cache():
+    """`get_search_cache`, opening the cache off the event loop"""
+    if _search_cache is not None or TAVILY_CACHE_TTL <= 0:
+        return _search_cache
+    return await asyncio.to_thread(get_search_cache)
+
+def _search_key(query, include_raw_content, max_results):
+    return json.dumps([query, max_results, bool(include_raw_content)])
+
+def _record_search(query, started, cached, response=None, error=None):
+    """The search's span in the run's timeline (if it has one)"""
+    results = (response or {}).get("results") or []
+    record_span("search", "tavily_search", started, time.perf_counter(), status="error" if error else "completed", attributes={
+        "query": query,
+        "cached": cached,
+        "results": len(results),
+        "content_chars": sum(len(r.get("raw_content") or r.get("content") or "") for r in results),
+        **({"error": repr(error)} if error else {}),
+    })
+
 @traceable
 def tavily_search(query, include_raw_content=True, max_results=3):
     """ Search the web using the Tavily API.
@@ -85,7 +185,58 @@ def tavily_search(query, include_raw_content=True, max_results=3):
                 - content (str): Snippet/summary of the content
                 - raw_content (str): Full content of the page if available"""
      
-    tavily_client = TavilyClient()
-    return tavily_client.search(query, 
-                         max_results=max_results, 
-                         include_raw_content=include_raw_content)
\ No newline at end of file
+    cache = get_search_cache()
+    key = _search_key(query, include_raw_content, max_results)
+    start = time.perf_counter()
+    if cache and (cached := cache.get(key)) is not None:
+        TAVILY_SEARCHES.labels("true").inc()
+        response = json.loads(cached)
+        _record_search(query, start, True, response)
+        return response
+
+    TAVILY_SEARCHES.labels("false").inc()
+    tavily_client = TavilyClient(**_tavily_kwargs)
+    try:
+        response = tavily_client.search(query, 
+                             max_results=max_results, 
+                             include_raw_content=include_raw_content)
+    except Exception as e:
+        _record_search(query, start, False, error=e)
+        raise
+    TAVILY_SECONDS.observe(time.perf_counter() - start)
+    _record_search(query, start, False, response)
+    if cache:
+        cache.set(key, json.dumps(response).encode("utf-8"))
+    return response
+
+# NOTE: shared, so that searches reuse its connection pool.  Created on first use (it reads TAVILY_API_KEY)
+_async_tavily_client = None
+
+@traceable
+async def atavily_search(query, include_raw_content=True, max_results=3):
+    """ Async version of `tavily_search` (same arguments and return value)"""
+    global _async_tavily_client
+    cache = await aget_search_cache()
+    key = _search_key(query, include_raw_content, max_results)
+    start = time.perf_counter()
+    if cache and (cached := await asyncio.to_thread(cache.get, key)) is not None:
+        TAVILY_SEARCHES.labels("true").inc()
+        response = json.loads(cached)
+        _record_search(query, start, True, response)
+        return response
+
+    TAVILY_SEARCHES.labels("false").inc()
+    if _async_tavily_client is None:
+        _async_tavily_client = AsyncTavilyClient(**_tavily_kwargs)
+    try:
+        response = await _async_tavily_client.search(query,
+                             max_results=max_results,
+                             include_raw_content=include_raw_content)
+    except Exception as e:
+        _record_search(query, start, False, error=e)
+        raise
+    TAVILY_SECONDS.observe(time.perf_counter() - start)
+    _record_search(query, start, False, response)
+    if cache:
+        await asyncio.to_thread(cache.set, key, json.dumps(response).encode("utf-8"))
+    return response
@@ -0,0 +1,18 @@
+"""Background work a graph leaves behind (i.e. a speculative search), stopped when its run ends.
+
+`at_run_end` hands a callback to every callback handler of the current run that has an
+`add_run_end_callback` method (see `server/cancellation.py`), which calls it once the run is over -
+completed, failed or cancelled.  Outside of a run, or without such a handler, it does nothing.
+"""
+
+from typing import Callable
+
+from .spans import run_handlers
+
+
+def at_run_end(callback: Callable[[], None]) -> bool:
+    """Call `callback` once the current run is over.  False if nobody will"""
+    handlers, _ = run_handlers("add_run_end_callback")
+    for handler in handlers:
+        handler.add_run_end_callback(callback)
+    return bool(handlers)
@@ -0,0 +1,28 @@
+"""Spans for the work in our graphs that isn't a LangChain run of its own (i.e. web searches).
+
+`record_span` hands the span to every callback handler of the current run that has an `on_span`
+method (see `server/timeline.py`), with the run it happened in (i.e. the node) as its parent.
+Outside of a run, or without such a handler, it does nothing.
+"""
+
+from typing import Optional
+
+from langchain_core.runnables.config import var_child_runnable_config
+
+
+def run_handlers(method: str) -> tuple:
+    """(the current run's callback handlers that have `method`, id of the current run)"""
+    config = var_child_runnable_config.get()
+    callbacks = config.get("callbacks") if config else None
+    if callbacks is None:
+        return (), None
+    handlers = getattr(callbacks, "handlers", callbacks)
+    return [h for h in handlers if hasattr(h, method)], getattr(callbacks, "parent_run_id", None)
+
+
+def record_span(kind: str, name: str, started: float, ended: float, status: str = "completed",
+                attributes: Optional[dict] = None):
+    """Record a span (`started`, `ended`: `time.perf_counter()`)"""
+    handlers, parent_run_id = run_handlers("on_span")
+    for handler in handlers:
+        handler.on_span(kind, name, started, ended, parent_run_id=parent_run_id, status=status, attributes=attributes or {})
@@ -0,0 +1,158 @@
+"""Per-model concurrency limits for graph runs, with a FIFO queue.
+
+Limits come from the environment, i.e.:
+
+    MODEL_CONCURRENCY="deepseek-r1:14b=1,phi4=3"
+    MODEL_CONCURRENCY_DEFAULT=2
+
+A run holds a slot for every model it is configured with, for its whole duration.
+Slots are acquired in a fixed (sorted) order, so two runs can never deadlock each other.
+"""
+
+import os
+import math
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import AsyncIterator, Iterable, Optional
+
+from graphs.local_models import LLMModelsAvailable
+
+logger = logging.getLogger("PlebServe")
+
+# How often a waiting request is told where it is in the queue (even if nothing changed)
+QUEUE_STATUS_INTERVAL = 2.0
+
+
+def parse_limits(spec: Optional[str]) -> dict:
+    limits = {}
+    for item in (spec or "").split(","):
+        model, _, limit = item.strip().rpartition("=")
+        if model:
+            limits[model] = max(int(limit), 1)
+    return limits
+
+
+class ModelSlots:
+    """A FIFO semaphore for one model.  A released slot is handed straight to the oldest waiter."""
+    ALPHA = 0.2
+
+    def __init__(self, model: str, limit: int):
+        self.model = model
+        self.limit = limit
+        self.active = 0
+        self.waiters = deque()
+        self.average_hold: Optional[float] = None  # Moving average of how long a run holds a slot
+
+    def try_acquire(self) -> bool:
+        if self.active < self.limit and not self.waiters:
+            self.active += 1
+            return True
+        return False
+
+    def enqueue(self) -> asyncio.Future:
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+        return waiter
+
+    def position(self, waiter: asyncio.Future) -> int:
+        return self.waiters.index(waiter) + 1
+
+    def estimated_wait(self, position: int) -> Optional[float]:
+        if self.average_hold is None:
+            return None
+        return math.ceil(position / self.limit) * self.average_hold
+
+    def abandon(self, waiter: asyncio.Future):
+        """The request stopped waiting (i.e. the client disconnected)"""
+        if waiter.done() and not waiter.cancelled():
+            # We were handed a slot in the meantime - pass it on
+            self.release()
+        else:
+            waiter.cancel()
+            self.waiters.remove(waiter)
+
+    def release(self, held_for: Optional[float] = None):
+        if held_for is not None:
+            self.average_hold = held_for if self.average_hold is None else self.average_hold + self.ALPHA * (held_for - self.average_hold)
+        while self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(True)
+                return
+        self.active -= 1
+
+    def status(self) -> dict:
+        return {"limit": self.limit, "active": self.active, "queued": len(self.waiters), "average_hold": self.average_hold}
+
+
+class Ticket:
+    """One run's claim on the slots of the models it uses"""
+    def __init__(self, controller: "AdmissionController", models: Iterable[str]):
+        self._controller = controller
+        self.models = sorted(set(models))
+        self._held = []
+        self.admitted_at: Optional[float] = None
+
+    async def wait(self) -> AsyncIterator[dict]:
+        """Acquire every slot, yielding a status update (model, position, estimated_wait) while we're queued."""
+        try:
+            for model in self.models:
+                slots = self._controller.slots(model)
+                if slots.try_acquire():
+                    self._held.append(slots)
+                    continue
+
+                waiter = slots.enqueue()
+                try:
+                    while not waiter.done():
+                        position = slots.position(waiter)
+                        yield {"model": model, "position": position, "estimated_wait": slots.estimated_wait(position)}
+                        await asyncio.wait({waiter}, timeout=QUEUE_STATUS_INTERVAL)
+                except BaseException:
+                    slots.abandon(waiter)
+                    raise
+                self._held.append(slots)
+        except BaseException:
+            self.release()
+            raise
+        self.admitted_at = time.monotonic()
+
+    def release(self):
+        held_for = time.monotonic() - self.admitted_at if self.admitted_at is not None else None
+        while self._held:
+            self._held.pop().release(held_for)
+
+
+class AdmissionController:
+    def __init__(self, limits: Optional[dict] = None, default_limit: int = 2):
+        self.limits = limits or {}
+        self.default_limit = default_limit
+        self._slots = {}
+
+    def slots(self, model: str) -> ModelSlots:
+        if model not in self._slots:
+            self._slots[model] = ModelSlots(model, self.limits.get(model, self.default_limit))
+        return self._slots[model]
+
+    def ticket(self, models: Iterable[str]) -> Ticket:
+        return Ticket(self, models)
+
+    def status(self) -> dict:
+        return {model: self.slots(model).status() for model in (m.value for m in LLMModelsAvailable)}
+
+
+def models_for_run(agent, config: dict) -> list:
+    """The models a run of this agent will use - every `LLMModelsAvailable` field of its resolved config"""
+    configurable = agent.config_schema.from_runnable_config(config)
+    return [
+        value.value for value in (getattr(configurable, name) for name in type(configurable).model_fields)
+        if isinstance(value, LLMModelsAvailable)
+    ]
+
+
+ADMISSION = AdmissionController(
+    limits=parse_limits(os.getenv("MODEL_CONCURRENCY")),
+    default_limit=int(os.getenv("MODEL_CONCURRENCY_DEFAULT", 2)),
+)
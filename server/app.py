@@ -1,17 +1,38 @@
 import dotenv
 dotenv.load_dotenv()
 
-from typing import List
-from pydantic import BaseModel
+from typing import List, Optional, Callable, AsyncIterator
+from pydantic import BaseModel, Field
+import re
 import json
+import fnmatch
 import asyncio
+import hashlib
+import time
+import uuid
 from enum import Enum
-from functools import lru_cache
+from contextlib import asynccontextmanager, aclosing
 
-from fastapi import FastAPI
-from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi import FastAPI, Request, Header
+from fastapi.responses import StreamingResponse, JSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
-app = FastAPI(title="agent testing")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await RUNS.open()
+    await THREADS.open()
+    await RESIDENCY.open()
+    # Import and compile the graphs in the background so that we can pass the health check right away
+    # NOTE: after RESIDENCY.open(), the preload at the end of the warm-up needs its client
+    warm_up_task = asyncio.create_task(warm_up_graphs())
+    yield
+    warm_up_task.cancel()
+    await RUNS.close()
+    await THREADS.close()
+    await RESIDENCY.close()
+
+app = FastAPI(title="agent testing", lifespan=lifespan)
 
 import logging
 from util.logger import setup_logging
@@ -25,7 +46,15 @@ logging.getLogger("httpx").setLevel(logging.INFO)
 logging.getLogger("watchdog.observers.inotify_buffer").setLevel(logging.INFO)
 
 
-from graphs import AGENTS
+from graphs import AGENTS, get_agent, warm_up, startup_report
+from sse_compression import negotiate_encoding, compress_frames
+from cancellation import RunCancellation
+from admission import ADMISSION, Ticket, models_for_run
+from runs import RUNS
+from threads import THREADS, thread_reply
+from residency import RESIDENCY, PRELOAD_MODELS, parse_models
+from metrics import RunMetrics, STREAM_REQUESTS, metered
+from timeline import TIMELINES, RunTimeline
 
 
 
@@ -37,15 +66,124 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Run-ID", "X-Timeline-ID"],
 )
 
+def models_to_preload() -> list:
+    """PRELOAD_MODELS, by default the models the (loaded) agents use out of the box"""
+    if PRELOAD_MODELS:
+        return parse_models(PRELOAD_MODELS)
+    models = set()
+    for agent in AGENTS:
+        if agent.loaded:
+            try:
+                models.update(models_for_run(agent, {}))
+            except Exception as e:
+                logger.warning(f"Couldn't tell which models '{agent.id}' uses: {e!r}")
+    return sorted(models)
+
+async def warm_up_graphs():
+    # NOTE: `warm_up` logs the graphs that fail to load and carries on with the others
+    report = await asyncio.to_thread(warm_up)
+    logger.info("Graph startup report (import + compile time):")
+    for agent_id, stats in report.items():
+        logger.info(f"  {agent_id}: {stats['load_seconds']}s" if stats["loaded"] else f"  {agent_id}: FAILED TO LOAD")
+    # Then get the models loaded in Ollama
+    models = []
+    try:
+        models = models_to_preload()
+    finally:
+        # Even with nothing to preload - that's what ends `preloading` (and gets /health/ready to 200)
+        RESIDENCY.start_preload(models)
+    await asyncio.to_thread(build_agents_payload)
+
 @app.get("/health")
 async def health_check():
-    return {"status": "ok"}
+    """Up - and which models are loaded (`resident`), so the first token comes fast, and which are `cold`"""
+    return {"status": "ok", **RESIDENCY.status()}
+
+@app.get("/health/ready")
+async def readiness_check():
+    """503 until the preloaded models are resident"""
+    status = RESIDENCY.status()
+    return JSONResponse({"status": "ready" if status["ready"] else "warming", **status}, status_code=200 if status["ready"] else 503)
+
+@app.get("/health/ollama")
+async def ollama_health():
+    """The Ollama host(s) we route to: health, outstanding requests and loaded models (see `ollama_pool.py`)"""
+    from graphs.ollama_pool import ollama_pool_status
+    return ollama_pool_status()
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics (for this worker process)"""
+    from graphs.metrics import render_metrics
+    return Response(render_metrics(), media_type="text/plain; version=0.0.4")
+
+@app.get("/queue")
+async def queue_status():
+    """Slots in use and requests waiting, per model"""
+    return {"models": ADMISSION.status()}
+
+def collect_cache_stats() -> dict:
+    from graphs.research.utils import get_search_cache
+    from graphs.llm_clients import LLM_RESPONSE_CACHE, llm_client_cache_info
+    from graphs.configuration import config_cache_info
+    from graphs.research.prefetch import prefetch_stats
+    from graphs.ollama.history import history_cache_info
+
+    search_cache = get_search_cache()
+    stats = {
+        "tavily": search_cache.stats() if search_cache else None,
+        "search_prefetch": prefetch_stats(),
+        "llm_responses": None,
+        "llm_clients": llm_client_cache_info(),
+        "configs": config_cache_info(),
+        "history_summaries": history_cache_info(),
+    }
+    if LLM_RESPONSE_CACHE:
+        from graphs.cached_llm import get_response_cache
+        stats["llm_responses"] = get_response_cache().stats()
+    return stats
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """Hits, misses and sizes of our caches (hit/miss counters are for this worker process only)"""
+    stats = await asyncio.to_thread(collect_cache_stats)
+    stats["threads"] = THREADS.status()
+    return stats
+
+@app.get("/runs")
+async def runs_status():
+    """The runs whose event logs we still have (see `runs.py`)"""
+    return RUNS.status()
+
+@app.get("/runs/{run_id}/timeline")
+async def run_timeline(run_id: str, format: str = "json"):
+    """Where the run's time went: its spans as a tree (`json`), or as Chrome trace events (`chrome`, see `timeline.py`)"""
+    timeline = TIMELINES.get(run_id)
+    if timeline is None:
+        return JSONResponse(status_code=404, content={"message": "No timeline for this run"})
+    return timeline.to_chrome_trace() if format == "chrome" else timeline.to_json()
+
+@app.get("/threads/{thread_id}")
+async def get_thread(thread_id: str):
+    """The messages of a thread stored on the server"""
+    return {"thread_id": thread_id, "messages": await THREADS.get(thread_id)}
+
+@app.delete("/threads/{thread_id}")
+async def truncate_thread(thread_id: str, keep: int = 0):
+    """Drop all but the first `keep` messages of a thread (all of them by default)"""
+    await THREADS.truncate(thread_id, keep)
+    return {"thread_id": thread_id, "length": len(await THREADS.get(thread_id))}
+
+@app.get("/health/startup")
+async def startup_time_report():
+    """Import cost per graph (`load_seconds` is null until the graph has been loaded)"""
+    return {"graphs": startup_report()}
 
-@lru_cache(maxsize=32)
 def generate_schema_for_agent(agent):
-    """Generate and cache schema for an agent."""
+    """Generate the schema for an agent (only called once per agent - see `build_agents_payload`)."""
     # Get full schemas with enum values
     input_schema = agent.input_schema.model_json_schema(mode='serialization')
     config_schema = agent.config_schema.model_json_schema(mode='serialization')
@@ -63,32 +201,129 @@ def generate_schema_for_agent(agent):
         "config": config_schema
     }
 
-@app.get("/agents")
-async def agents():
-    agent_list = []
-    for agent in AGENTS:
-        agent_data = {
+def agent_entry(agent):
+    return {
+        "data": {
             "id": agent.id,
             "name": agent.name,
             "placeholder": agent.placeholder,
             "info": agent.info,
             "version": agent.version
-        }
-        
-        # Use cached schema generation
-        schema = generate_schema_for_agent(agent)
-        
-        agent_list.append({
-            "data": agent_data,
-            "schema": schema
-        })
-    
-    return {"agents": agent_list}
+        },
+        "schema": generate_schema_for_agent(agent)
+    }
+
+
+# NOTE: the /agents responses never change while the server is running, so we serialize them once.
+# Maps agent id -> (body, etag); the full list is stored under the `None` key
+AGENTS_PAYLOAD: dict = {}
+
+def _payload(content) -> tuple:
+    body = json.dumps(content, separators=(",", ":")).encode("utf-8")
+    return body, f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+
+def build_agents_payload():
+    """Serialize the /agents and /agents/{id} responses (this loads every graph).
+    Agents whose graph fails to load are left out, rather than taking /agents down with them."""
+    entries = []
+    for agent in AGENTS:
+        try:
+            entries.append(agent_entry(agent))
+        except Exception as e:
+            logger.error(f"Leaving '{agent.id}' out of /agents, its graph failed to load: {e!r}")
+    payload = {entry["data"]["id"]: _payload(entry) for entry in entries}
+    payload[None] = _payload({"agents": entries})
+    AGENTS_PAYLOAD.update(payload)
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison, as required for If-None-Match"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+async def cached_payload_response(key: Optional[str], request: Request) -> Response:
+    if None not in AGENTS_PAYLOAD:
+        await asyncio.to_thread(build_agents_payload)
+
+    body, etag = AGENTS_PAYLOAD[key]
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+@app.get("/agents")
+async def agents(request: Request):
+    return await cached_payload_response(None, request)
+
+@app.get("/agents/{agent_id}")
+async def agent_by_id(agent_id: str, request: Request):
+    if not get_agent(agent_id):
+        return JSONResponse(status_code=404, content={"message": "Agent not found"})
+    if None not in AGENTS_PAYLOAD:
+        await asyncio.to_thread(build_agents_payload)
+    if agent_id not in AGENTS_PAYLOAD:
+        return JSONResponse(status_code=503, content={"message": "Agent failed to load"})
+    return await cached_payload_response(agent_id, request)
+
+def _glob_regex(patterns: List[str]) -> re.Pattern:
+    """One regex for a list of glob patterns (an empty list matches nothing)"""
+    if not patterns:
+        return re.compile("(?!)")
+    return re.compile("|".join(fnmatch.translate(p) for p in patterns))
+
+class EventSubscription(BaseModel):
+    """Which `astream_events` events the client wants.  Everything else is dropped before it's serialized."""
+    events: Optional[List[str]] = None  # Event types to send (e.g. "on_chat_model_stream").  None means all of them
+    include_nodes: Optional[List[str]] = None  # Only send events from nodes that match one of these glob patterns
+    exclude_nodes: List[str] = []  # Never send events from nodes that match one of these glob patterns
+    hide_underscore_nodes: bool = False  # Drop events from nodes (or runs) whose name starts with '_' (i.e. "__start__", "_write", "_summarize_history")
+
+    def compile(self) -> Callable[[dict], bool]:
+        """Build a predicate for events, with the glob patterns compiled up front"""
+        events = frozenset(self.events) if self.events is not None else None
+        include = _glob_regex(self.include_nodes) if self.include_nodes is not None else None
+        exclude = _glob_regex(self.exclude_nodes) if self.exclude_nodes else None
+        hide_underscore = self.hide_underscore_nodes
+
+        def wanted(event: dict) -> bool:
+            if events is not None and event.get("event") not in events:
+                return False
+            name = event.get("name") or ""
+            # NOTE: the node an event comes from, not its own name - the tokens a node streams are named
+            # after the LLM (i.e. "ChatOllama").  Events outside of any node (the graph's own) go by their name
+            node = (event.get("metadata") or {}).get("langgraph_node") or name
+            if hide_underscore and (node.startswith("_") or name.startswith("_")):
+                return False
+            if include is not None and not include.match(node):
+                return False
+            if exclude is not None and exclude.match(node):
+                return False
+            return True
+
+        return wanted
+
+class TokenCoalescing(BaseModel):
+    """Merge consecutive `on_chat_model_stream` tokens from the same LLM run into one event"""
+    interval_ms: int = Field(50, ge=1, le=5000)  # Flush pending tokens at least this often
+    max_bytes: int = Field(1024, ge=1)  # ... or as soon as this many bytes of text are pending
 
 class StreamRequest(BaseModel):
     agent_id: str
     input_data: dict = {}  # Default to empty
     config: dict = {}  # Default to empty
+    subscribe: Optional[EventSubscription] = None  # Default to every event
+    coalesce: Optional[TokenCoalescing] = None  # Default to one event per token
+    run_id: Optional[str] = None  # Set to reconnect to a run (the `X-Run-ID` of its first response), see `runs.py`
+    thread_id: Optional[str] = None  # Set to continue a thread stored on the server: `input_data.messages` holds only the new message(s), see `threads.py`
+
+    def runnable_config(self) -> dict:
+        """The config to run the graph with.
+        Clients (i.e. our frontend) may send the agent's configurable fields as-is - those belong under `configurable`"""
+        if "configurable" in self.config:
+            return self.config
+        return {"configurable": self.config}
 
     def model_dump(self):
         data = super().model_dump()
@@ -119,20 +354,233 @@ def serialize_custom_objects(obj: Any) -> Any:
         return list(obj)
     return str(obj)
 
-async def stream_generator(agent, input_data, config):
+async def filter_events(events: AsyncIterator[dict], wanted: Callable[[dict], bool]) -> AsyncIterator[dict]:
+    async for event in events:
+        if wanted(event):
+            yield event
+
+async def capture_output(events: AsyncIterator[dict], captured: dict) -> AsyncIterator[dict]:
+    """Pass the events through, keeping the graph's final output in `captured["output"]`"""
+    async for event in events:
+        if event.get("event") == "on_chain_end" and not event.get("parent_ids"):
+            captured["output"] = (event.get("data") or {}).get("output")
+        yield event
+
+def _mergeable_token(event: dict) -> bool:
+    if event.get("event") != "on_chat_model_stream":
+        return False
+    chunk = (event.get("data") or {}).get("chunk")
+    return isinstance(getattr(chunk, "content", None), str) and hasattr(chunk, "model_copy")
+
+def _merge_token_events(pending: List[dict], parts: List[str]) -> dict:
+    if len(pending) == 1:
+        return pending[0]
+    first, last = pending[0], pending[-1]
+    last_chunk = last["data"]["chunk"]
+    # Take the metadata of the last chunk (that's where Ollama puts `done_reason` and usage) and the text of all of them
+    merged_chunk = last_chunk.model_copy(update={"content": "".join(parts), "id": first["data"]["chunk"].id})
+    return {**first, "data": {**first["data"], "chunk": merged_chunk}}
+
+_DONE = object()
+
+class EventPump:
+    """Drives an event iterator in its own task, so that the run can be cancelled from the outside
+    (see `watch_for_disconnect`) and the next event can be waited on with a timeout (see `coalesce_token_events`).
+
+    NOTE: the queue is unbounded so that `_on_done` can always post the end of the stream.
+    Events are small and the graph is rarely faster than the socket, so this is fine.
+    """
+    def __init__(self, events: AsyncIterator[dict]):
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self.task = asyncio.create_task(self._pump(events))
+        self.task.add_done_callback(self._on_done)
+
+    async def _pump(self, events: AsyncIterator[dict]):
+        async for event in events:
+            self._queue.put_nowait(event)
+
+    def _on_done(self, task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            self._queue.put_nowait(task.exception())
+        else:
+            self._queue.put_nowait(_DONE)
+
+    async def get(self, timeout: Optional[float] = None):
+        """The next event, or `_DONE` once the run is over.  Raises asyncio.TimeoutError"""
+        item = await asyncio.wait_for(self._queue.get(), timeout) if timeout is not None else await self._queue.get()
+        if isinstance(item, Exception):
+            raise item
+        return item
+
+    async def __aiter__(self):
+        while (item := await self.get()) is not _DONE:
+            yield item
+
+    def cancel(self):
+        self.task.cancel()
+
+async def coalesce_token_events(pump: EventPump, coalescing: TokenCoalescing) -> AsyncIterator[dict]:
+    """Merge runs of token events into windows of `interval_ms` / `max_bytes`.
+    Every other event flushes the pending tokens and is passed through right away, in order."""
+    interval = coalescing.interval_ms / 1000
+    max_bytes = coalescing.max_bytes
+    loop = asyncio.get_running_loop()
+
+    pending: List[dict] = []
+    parts: List[str] = []
+    pending_bytes = 0
+    deadline = 0.0
+
+    while True:
+        if pending:
+            # Flush on a timer, even when no new event arrives
+            try:
+                item = await pump.get(timeout=max(deadline - loop.time(), 0))
+            except asyncio.TimeoutError:
+                yield _merge_token_events(pending, parts)
+                pending, parts, pending_bytes = [], [], 0
+                continue
+        else:
+            item = await pump.get()
+
+        if item is _DONE:
+            if pending:
+                yield _merge_token_events(pending, parts)
+            return
+
+        if _mergeable_token(item):
+            if pending and pending[0]["run_id"] != item["run_id"]:
+                yield _merge_token_events(pending, parts)
+                pending, parts, pending_bytes = [], [], 0
+            if not pending:
+                deadline = loop.time() + interval
+            text = item["data"]["chunk"].content
+            pending.append(item)
+            parts.append(text)
+            pending_bytes += len(text.encode("utf-8"))
+            if pending_bytes >= max_bytes:
+                yield _merge_token_events(pending, parts)
+                pending, parts, pending_bytes = [], [], 0
+            continue
+
+        if pending:
+            yield _merge_token_events(pending, parts)
+            pending, parts, pending_bytes = [], [], 0
+        yield item
+
+# How often we check whether the client of a /stream is still there
+DISCONNECT_POLL_INTERVAL = 1.0
+
+async def watch_for_disconnect(is_disconnected: Callable, cancellation: RunCancellation, pump: EventPump):
+    """Cancel the run as soon as the client goes away, even if we have nothing to send it at the moment
+    (i.e. during a web search, or while its events are filtered out)"""
+    while not pump.task.done():
+        if await is_disconnected():
+            cancellation.cancel()
+            pump.cancel()
+            return
+        await asyncio.sleep(DISCONNECT_POLL_INTERVAL)
+
+# Keep references to fire-and-forget tasks, so they don't get garbage collected
+BACKGROUND_TASKS = set()
+
+def run_in_background(coroutine):
+    task = asyncio.create_task(coroutine)
+    BACKGROUND_TASKS.add(task)
+    task.add_done_callback(BACKGROUND_TASKS.discard)
+    return task
+
+async def finish_cancelled_run(pump: EventPump, cancellation: RunCancellation, ticket: Optional[Ticket]):
+    await asyncio.wait({pump.task}, timeout=30)
+    if ticket:
+        ticket.release()
+    cancellation.run_ended()
+    cancellation.log_savings()
+
+def sse_frame(event: dict) -> str:
+    serialized_event = json.dumps(
+        event, 
+        default=serialize_custom_objects
+    ).replace('\n', '\\n')
+    return f"data: {serialized_event}\n\n"
+
+async def stream_generator(agent, input_data, config,
+                           subscription: Optional[EventSubscription] = None,
+                           coalescing: Optional[TokenCoalescing] = None,
+                           is_disconnected: Optional[Callable] = None,
+                           graph=None,
+                           on_output: Optional[Callable] = None,
+                           run_id: Optional[str] = None):
     # async for chunk in agent.graph.astream_events(input=input_data, config=config, version="v2"):
     #     yield json.dumps({"chunk": chunk}) + "\n"
 
-    async for event in agent.graph.astream_events(input=input_data, config=config, version="v2"):
-        try:
-            serialized_event = json.dumps(
-                event, 
-                default=serialize_custom_objects
-            ).replace('\n', '\\n')
+    # Wait for our turn on the model(s) this run uses, letting the client know where it is in the queue
+    # NOTE: `queued` events are ours, not the graph's, so they are never filtered out by the subscription
+    # Where the run's time goes (see `timeline.py`)
+    timeline = TIMELINES.open(run_id or uuid.uuid4().hex, agent.id)
+    recorder = RunTimeline(timeline)
+    admitted = False
+    try:
+        models = models_for_run(agent, config)
+        RESIDENCY.touch(models)
+        ticket = ADMISSION.ticket(models)
+        queued_at = time.perf_counter()
+        async with aclosing(ticket.wait()) as queue_updates:
+            async for status in queue_updates:
+                if is_disconnected and await is_disconnected():
+                    logger.info(f"Client disconnected while queued for '{status['model']}'")
+                    return
+                yield sse_frame({"event": "queued", "name": status["model"], "data": status})
+        recorder.span("queue", "admission", queued_at, time.perf_counter(), models=models)
+        admitted = True
+    finally:
+        # NOTE: from here on, the run's `finally` below closes it
+        if not admitted:
+            TIMELINES.close(timeline)
 
-            yield f"data: {serialized_event}\n\n"
-        except Exception as e:
-            print(f"Serialization error: {e}")
+    # Lets us abort LLM calls (even synchronous ones, running in a thread) once the client is gone
+    cancellation = RunCancellation(agent.id)
+    config = {**config, "callbacks": [cancellation, RunMetrics(agent.id), recorder]}
+
+    graph = graph or agent.graph
+    events = graph.astream_events(input=input_data, config=config, version="v2")
+    # Handed to `on_output` once the graph is done (it's filtered out of what's sent more often than not)
+    captured = {}
+    if on_output is not None:
+        events = capture_output(events, captured)
+    # Filter before serializing - unwanted events cost us nothing but the check
+    if subscription is not None:
+        events = filter_events(events, subscription.compile())
+
+    pump = EventPump(events)
+    watcher = asyncio.create_task(watch_for_disconnect(is_disconnected, cancellation, pump)) if is_disconnected else None
+    events = coalesce_token_events(pump, coalescing) if coalescing is not None else pump
+
+    finished = False
+    try:
+        async for event in events:
+            try:
+                yield sse_frame(event)
+            except Exception as e:
+                print(f"Serialization error: {e}")
+        finished = True
+    finally:
+        TIMELINES.close(timeline)
+        if watcher:
+            watcher.cancel()
+        # NOTE: we also end up here if Starlette cancels us because the client disconnected
+        if cancellation.cancelled or not pump.task.done():
+            cancellation.cancel()
+            pump.cancel()
+            # The model slots are only given back once the graph has actually stopped
+            run_in_background(finish_cancelled_run(pump, cancellation, ticket))
+        else:
+            ticket.release()
+            cancellation.run_ended()
+            if finished:
+                cancellation.completed()
+                if on_output is not None and "output" in captured:
+                    await on_output(captured["output"])
 
 
 # KEEP THIS
@@ -149,19 +597,82 @@ async def stream_generator(agent, input_data, config):
 #     )
 
 @app.post("/stream")
-async def stream(request: StreamRequest):
+async def stream(request: StreamRequest, http_request: Request, accept_encoding: Optional[str] = Header(None),
+                 last_event_id: Optional[str] = Header(None)):
     # Find the agent with the matching ID
-    agent = next((a for a in AGENTS if a.id == request.agent_id), None)
+    agent = get_agent(request.agent_id)
     if not agent:
         return JSONResponse(status_code=404, content={"message": "Agent not found"})
+
+    # Import and compile the graph if the warm-up task hasn't gotten to it yet
+    if not agent.loaded:
+        await asyncio.to_thread(agent.load)
     
     # print("STREAM: ", agent)
     logger.debug(agent)
     # print(request)
     logger.debug(request)
+    STREAM_REQUESTS.labels(agent.id).inc()
+
+    input_data = request.input_data
+    config = request.runnable_config()
+    store_turn = None
+    if request.thread_id:
+        # Lets graphs keep per-thread state of their own (i.e. the ollama graph's history summary)
+        config = {**config, "configurable": {**config.get("configurable", {}), "conversation_id": request.thread_id}}
+        # The client only sent the new message(s) - the rest of the thread is ours
+        new_messages = input_data.get("messages") or []
+        if not request.run_id:
+            input_data = {**input_data, "messages": await THREADS.get(request.thread_id) + new_messages}
+            # NOTE: stored right away, like the client shows them - even if the run fails or is cancelled,
+            # so that both sides have the same messages (undo truncates by count)
+            await THREADS.append(request.thread_id, new_messages)
+
+        async def store_turn(output):
+            reply = thread_reply(output)
+            if reply:
+                await THREADS.append(request.thread_id, [reply])
+
+    headers = {"Vary": "Accept-Encoding"}
+    if request.run_id and not RUNS.enabled:
+        # NOTE: we never handed out a run id to come back with (starting over would repeat the turn)
+        return JSONResponse(status_code=409, content={"message": "Resumable streams are off"})
+    if RUNS.enabled:
+        # The run goes on in the background, this connection (and any later one, see `runs.py`) follows it
+        def run_frames(graph, input_data, config, is_disconnected):
+            return stream_generator(agent, input_data, config, request.subscribe, request.coalesce,
+                                    is_disconnected=is_disconnected, graph=graph, on_output=store_turn,
+                                    run_id=config["configurable"]["thread_id"])
+
+        try:
+            last_seen = int(last_event_id or 0)
+        except ValueError:
+            last_seen = 0
+        if request.run_id:
+            run = await RUNS.resume(request.run_id, agent, config, run_frames, last_seen)
+            if run is None:
+                return JSONResponse(status_code=404, content={"message": "Run not found"})
+        else:
+            run = RUNS.start(agent, input_data, config, run_frames)
+            last_seen = 0
+        frames = run.follow(last_seen)
+        headers["X-Run-ID"] = headers["X-Timeline-ID"] = run.id
+    else:
+        run_id = uuid.uuid4().hex
+        frames = stream_generator(agent, input_data, config, request.subscribe, request.coalesce,
+                                  is_disconnected=http_request.is_disconnected, on_output=store_turn, run_id=run_id)
+        # NOTE: not resumable (no `X-Run-ID`: clients reconnect to any run they get one of), but its timeline is at /runs/{id}/timeline
+        headers["X-Timeline-ID"] = run_id
+
+    # Compress the stream if the client supports it (each frame is flushed as soon as it's written)
+    encoding = negotiate_encoding(accept_encoding)
+    if encoding:
+        frames = compress_frames(frames, encoding)
+        headers["Content-Encoding"] = encoding
 
     # Return the streaming response directly without awaiting
     return StreamingResponse(
-        stream_generator(agent, request.input_data, request.config),
-        media_type="text/event-stream"
+        metered(frames, agent.id),
+        media_type="text/event-stream",
+        headers=headers
     )
@@ -0,0 +1,118 @@
+"""Stop graph runs whose client has gone away.
+
+Cancelling the task that drives `astream_events` stops the graph from scheduling more nodes and
+cancels any awaited (async) LLM or search call.  Synchronous calls running in the thread pool can't
+be interrupted that way, so `RunCancellation` is also attached as a callback handler: once the run is
+cancelled, the next token (or the next LLM call) raises `RunCancelled` inside the worker thread,
+which closes the HTTP stream to Ollama and stops the generation.
+"""
+
+import time
+import logging
+import threading
+from typing import Any, Optional
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+logger = logging.getLogger("PlebServe")
+
+
+class RunCancelled(Exception):
+    pass
+
+
+class RunStats:
+    """Moving average of completed runs per agent, used to estimate what a cancelled run would have cost."""
+    ALPHA = 0.2
+
+    def __init__(self):
+        self._averages: dict = {}  # agent id -> (tokens, seconds)
+
+    def record(self, agent_id: str, tokens: int, seconds: float):
+        if agent_id not in self._averages:
+            self._averages[agent_id] = (float(tokens), seconds)
+            return
+        avg_tokens, avg_seconds = self._averages[agent_id]
+        self._averages[agent_id] = (
+            avg_tokens + self.ALPHA * (tokens - avg_tokens),
+            avg_seconds + self.ALPHA * (seconds - avg_seconds),
+        )
+
+    def expected(self, agent_id: str) -> Optional[tuple]:
+        return self._averages.get(agent_id)
+
+
+RUN_STATS = RunStats()
+
+
+class RunCancellation(BaseCallbackHandler):
+    """Callback handler that counts tokens and aborts the run's LLM calls once `cancel()` has been called."""
+    raise_error = True
+    run_inline = True
+
+    def __init__(self, agent_id: str):
+        self.agent_id = agent_id
+        self.started = time.monotonic()
+        self.tokens = 0
+        self.cancelled_at: Optional[float] = None
+        self.tokens_at_cancel = 0
+        self._cancelled = threading.Event()
+        self._at_end = []  # See `graphs/run_end.py`
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def cancel(self):
+        if not self._cancelled.is_set():
+            self.cancelled_at = time.monotonic()
+            self.tokens_at_cancel = self.tokens
+            self._cancelled.set()
+
+    def _check(self):
+        if self._cancelled.is_set():
+            raise RunCancelled(f"'{self.agent_id}' run was cancelled")
+
+    def on_llm_new_token(self, token: str, **kwargs: Any):
+        self.tokens += 1
+        self._check()
+
+    def on_chat_model_start(self, serialized, messages, **kwargs: Any):
+        self._check()
+
+    def on_llm_start(self, serialized, prompts, **kwargs: Any):
+        self._check()
+
+    ##############################################################
+    def add_run_end_callback(self, callback):
+        self._at_end.append(callback)
+
+    def run_ended(self):
+        """The graph has stopped (however it ended): stop what it left running in the background"""
+        callbacks, self._at_end = self._at_end, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.warning(f"Run end callback of '{self.agent_id}' failed: {e!r}")
+
+    def completed(self):
+        RUN_STATS.record(self.agent_id, self.tokens, time.monotonic() - self.started)
+
+    def log_savings(self):
+        """Log what cancelling this run saved (estimated from the average completed run of this agent)"""
+        elapsed = self.cancelled_at - self.started
+        stopped_after = time.monotonic() - self.cancelled_at
+        wasted = self.tokens - self.tokens_at_cancel
+
+        expected = RUN_STATS.expected(self.agent_id)
+        if expected:
+            expected_tokens, expected_seconds = expected
+            savings = f"saved ~{max(expected_tokens - self.tokens, 0):.0f} tokens and ~{max(expected_seconds - elapsed, 0):.1f}s"
+        else:
+            savings = "no completed runs yet to estimate savings from"
+
+        logger.info(
+            f"Client disconnected: cancelled '{self.agent_id}' run after {elapsed:.1f}s and {self.tokens_at_cancel} tokens "
+            f"(stopped {stopped_after:.2f}s later, {wasted} tokens generated meanwhile) - {savings}"
+        )
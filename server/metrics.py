@@ -0,0 +1,141 @@
+"""What /metrics reports (the metrics themselves are in `graphs/metrics.py`).
+
+ - /stream requests, open streams and the SSE bytes sent (`metered`)
+ - per model: LLM calls, time to first token, tokens and tokens/second
+ - per graph node: how long it took, and per graph: how long whole runs took
+ - Tavily searches and their latency (recorded in `graphs/research/utils.py`)
+
+Everything but the stream counters comes from `RunMetrics`, a callback handler attached to every run.
+Per token it only bumps a counter on the call's own (preallocated) record - the metrics are updated
+once the call is over.
+"""
+
+import time
+from typing import Any, AsyncIterator, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from graphs.metrics import Counter, Gauge, Histogram
+
+STREAM_REQUESTS = Counter("plebserve_stream_requests_total", "/stream requests", ("agent",))
+ACTIVE_STREAMS = Gauge("plebserve_active_streams", "/stream responses being sent right now")
+SSE_BYTES = Counter("plebserve_sse_bytes_total", "Bytes of SSE sent by /stream (after compression)", ("agent",))
+
+GRAPH_RUNS = Counter("plebserve_graph_runs_total", "Graph runs, by how they ended", ("graph", "status"))
+GRAPH_SECONDS = Histogram("plebserve_graph_run_seconds", "How long graph runs took", ("graph",))
+NODE_SECONDS = Histogram("plebserve_node_duration_seconds", "How long graph nodes took", ("graph", "node"))
+
+LLM_CALLS = Counter("plebserve_llm_calls_total", "LLM calls, by how they ended", ("model", "status"))
+LLM_TTFT = Histogram("plebserve_llm_time_to_first_token_seconds", "Time from the LLM call to its first token", ("model",))
+LLM_TOKENS = Counter("plebserve_llm_tokens_total", "Tokens generated", ("model",))
+LLM_TOKENS_PER_SECOND = Histogram(
+    "plebserve_llm_tokens_per_second", "Generation speed of LLM calls (after the first token)", ("model",),
+    buckets=(1, 2, 5, 10, 15, 20, 30, 40, 50, 75, 100, 150, 200, 300),
+)
+
+
+class _Call:
+    __slots__ = ("model", "started", "first_token", "tokens")
+
+    def __init__(self, model: str, started: float):
+        self.model = model
+        self.started = started
+        self.first_token = 0.0
+        self.tokens = 0
+
+
+def _model_of(serialized: Optional[dict], metadata: Optional[dict]) -> str:
+    model = (metadata or {}).get("ls_model_name")
+    if not model and serialized:
+        model = (serialized.get("kwargs") or {}).get("model")
+    return str(model or "unknown")
+
+
+class RunMetrics(BaseCallbackHandler):
+    """Callback handler that times a run's graph, nodes and LLM calls"""
+    run_inline = True
+
+    def __init__(self, graph_id: str):
+        self.graph_id = graph_id
+        self._calls = {}  # run id -> _Call
+        self._chains = {}  # run id -> (node name, or None for the graph itself, start)
+
+    ##############################################################
+    # Graph and nodes
+    def on_chain_start(self, serialized, inputs, *, run_id: UUID, parent_run_id: Optional[UUID] = None,
+                       metadata: Optional[dict] = None, **kwargs: Any):
+        if parent_run_id is None:
+            self._chains[run_id] = (None, time.perf_counter())
+            return
+        node = (metadata or {}).get("langgraph_node")
+        # Only the node itself, not what runs inside of it (nor LangGraph's own `__start__`)
+        if node and kwargs.get("name") == node and not node.startswith("__"):
+            self._chains[run_id] = (node, time.perf_counter())
+
+    def _chain_done(self, run_id: UUID, status: str):
+        chain = self._chains.pop(run_id, None)
+        if chain is None:
+            return
+        node, started = chain
+        seconds = time.perf_counter() - started
+        if node is None:
+            GRAPH_SECONDS.labels(self.graph_id).observe(seconds)
+            GRAPH_RUNS.labels(self.graph_id, status).inc()
+        else:
+            NODE_SECONDS.labels(self.graph_id, node).observe(seconds)
+
+    def on_chain_end(self, outputs, *, run_id: UUID, **kwargs: Any):
+        self._chain_done(run_id, "completed")
+
+    def on_chain_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any):
+        self._chain_done(run_id, "error")
+
+    ##############################################################
+    # LLM calls
+    def on_chat_model_start(self, serialized, messages, *, run_id: UUID, metadata: Optional[dict] = None, **kwargs: Any):
+        self._calls[run_id] = _Call(_model_of(serialized, metadata), time.perf_counter())
+
+    def on_llm_start(self, serialized, prompts, *, run_id: UUID, metadata: Optional[dict] = None, **kwargs: Any):
+        self._calls[run_id] = _Call(_model_of(serialized, metadata), time.perf_counter())
+
+    def on_llm_new_token(self, token: str, *, run_id: UUID, **kwargs: Any):
+        # NOTE: the hot path - no allocations, no locks
+        call = self._calls.get(run_id)
+        # The final chunk (with Ollama's timings) is empty
+        if call is not None and token:
+            if not call.tokens:
+                call.first_token = time.perf_counter()
+            call.tokens += 1
+
+    def _call_done(self, run_id: UUID, status: str):
+        call = self._calls.pop(run_id, None)
+        if call is None:
+            return
+        LLM_CALLS.labels(call.model, status).inc()
+        if not call.tokens:
+            return
+        LLM_TTFT.labels(call.model).observe(call.first_token - call.started)
+        LLM_TOKENS.labels(call.model).inc(call.tokens)
+        generating = time.perf_counter() - call.first_token
+        if call.tokens > 1 and generating > 0:
+            LLM_TOKENS_PER_SECOND.labels(call.model).observe((call.tokens - 1) / generating)
+
+    def on_llm_end(self, response, *, run_id: UUID, **kwargs: Any):
+        self._call_done(run_id, "completed")
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any):
+        self._call_done(run_id, "error")
+
+
+async def metered(frames: AsyncIterator, agent_id: str) -> AsyncIterator:
+    """`frames`, counted as an active stream while they're sent, and their bytes"""
+    sent = SSE_BYTES.labels(agent_id)
+    ACTIVE_STREAMS.inc()
+    try:
+        async for frame in frames:
+            # NOTE: uncompressed frames are str, but ASCII (`json.dumps` escapes the rest)
+            sent.inc(len(frame))
+            yield frame
+    finally:
+        ACTIVE_STREAMS.dec()
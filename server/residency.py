@@ -0,0 +1,187 @@
+"""Keeps the models we serve loaded in Ollama, so that first tokens come fast.
+
+A model that isn't loaded costs its whole load time (seconds, for the bigger ones) on the first
+request after it was idle - and the research graph alternates between two models on every loop.
+
+ - at startup, the PRELOAD_MODELS are loaded on every Ollama host (by default: the models the
+   agents are configured with by default), one model at a time per host
+ - every RESIDENCY_CHECK_INTERVAL seconds, every host is asked which models it has loaded (`/api/ps`)
+ - a loaded model that was used since we last refreshed it gets its keep_alive set to
+   RESIDENCY_KEEP_ALIVE (requests set it to their own, often shorter, keep_alive) - so models stay
+   loaded for a while after their traffic stops
+ - /health reports every model as `resident` (loaded on a host), `loading` or `cold`, and
+   /health/ready answers 503 until the preloaded models are resident
+
+NOTE: models that were unloaded (i.e. to make room for another one) are not loaded back - the next
+request does that, and reloading them here could evict a model that's in use.
+
+Environment:
+
+    PRELOAD_MODELS="phi4,llama3.1"            # Unset: the agents' default models, "none": preload nothing
+    RESIDENCY_KEEP_ALIVE=30m
+    RESIDENCY_CHECK_INTERVAL=30
+    RESIDENCY_LOAD_TIMEOUT=300
+"""
+
+import os
+import time
+import asyncio
+import logging
+from typing import Iterable, Optional
+
+import httpx
+
+from graphs.local_models import LLMModelsAvailable
+from graphs.ollama_pool import OLLAMA_HOSTS, loaded_models, model_name
+
+logger = logging.getLogger("PlebServe")
+
+# Empty: the agents' default models
+PRELOAD_MODELS = os.getenv("PRELOAD_MODELS", "")
+RESIDENCY_KEEP_ALIVE = os.getenv("RESIDENCY_KEEP_ALIVE", "30m")
+RESIDENCY_CHECK_INTERVAL = float(os.getenv("RESIDENCY_CHECK_INTERVAL", 30))
+RESIDENCY_LOAD_TIMEOUT = float(os.getenv("RESIDENCY_LOAD_TIMEOUT", 300))
+
+
+def parse_models(spec: str) -> list:
+    return [model.strip() for model in spec.split(",") if model.strip() and model.strip().lower() != "none"]
+
+
+class ResidencyManager:
+    def __init__(self, hosts: list = OLLAMA_HOSTS):
+        self.hosts = hosts
+        self.preload = []
+        self.preloading = True  # Until `start_preload` is done
+        self.resident = {host: set() for host in hosts}  # As of the last check
+        self.loading = set()  # (host, model)
+        self.last_used = {}  # model -> when a run last used it
+        self.refreshed = {}  # (host, model) -> when we last set its keep_alive
+        self.last_check: Optional[float] = None
+        self.stats = {"loads": 0, "refreshes": 0, "failed": 0}
+        self._client: Optional[httpx.AsyncClient] = None
+        self._tasks = []
+
+    ##############################################################
+    async def open(self):
+        self._client = httpx.AsyncClient()
+        self._tasks.append(asyncio.create_task(self._check_loop()))
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def start_preload(self, models: Iterable[str]):
+        """Load `models` on every host, in the background"""
+        self.preload = [model_name(model) for model in models]
+        if self.preload and self._client is None:
+            logger.warning(f"Not preloading {', '.join(self.preload)}: called before open()")
+        if self.preload and self._client is not None:
+            self._tasks.append(asyncio.create_task(self._preload()))
+        else:
+            self.preloading = False
+
+    def touch(self, models: Iterable[str]):
+        """A run is about to use `models`"""
+        now = time.monotonic()
+        for model in models:
+            self.last_used[model_name(model)] = now
+
+    ##############################################################
+    async def _load(self, host: str, model: str) -> bool:
+        """Load `model` on `host` (or just set its keep_alive, if it's loaded already)"""
+        self.loading.add((host, model))
+        try:
+            # NOTE: a chat without messages only loads the model
+            response = await self._client.post(
+                f"{host}/api/chat",
+                json={"model": model, "messages": [], "keep_alive": RESIDENCY_KEEP_ALIVE, "stream": False},
+                timeout=RESIDENCY_LOAD_TIMEOUT,
+            )
+            response.raise_for_status()
+        except httpx.HTTPError as e:
+            self.stats["failed"] += 1
+            logger.warning(f"Couldn't load '{model}' on {host}: {e!r}")
+            return False
+        finally:
+            self.loading.discard((host, model))
+        self.refreshed[(host, model)] = time.monotonic()
+        self.resident[host].add(model)
+        return True
+
+    async def _preload(self):
+        start = time.perf_counter()
+
+        async def preload_host(host: str):
+            # One at a time - loading several models at once only makes every one of them slower
+            for model in self.preload:
+                if await self._load(host, model):
+                    self.stats["loads"] += 1
+
+        try:
+            await asyncio.gather(*(preload_host(host) for host in self.hosts))
+            logger.info(f"Preloaded {', '.join(self.preload)} in {time.perf_counter() - start:.1f}s")
+        finally:
+            self.preloading = False
+
+    async def _probe(self, host: str):
+        try:
+            response = await self._client.get(f"{host}/api/ps", timeout=10)
+            response.raise_for_status()
+            self.resident[host] = loaded_models(response.json())
+        except (httpx.HTTPError, ValueError) as e:
+            logger.debug(f"Couldn't ask {host} for its loaded models: {e!r}")
+            self.resident[host] = set()
+
+    async def check(self):
+        await asyncio.gather(*(self._probe(host) for host in self.hosts))
+        self.last_check = time.monotonic()
+
+        refresh = [
+            (host, model)
+            for model, used in self.last_used.items()
+            for host in self.hosts
+            if model in self.resident[host] and (host, model) not in self.loading
+            and self.refreshed.get((host, model), 0) < used
+        ]
+        for host, model in refresh:
+            if await self._load(host, model):
+                self.stats["refreshes"] += 1
+
+    async def _check_loop(self):
+        while True:
+            try:
+                await self.check()
+            except Exception as e:
+                logger.error(f"Model residency check failed: {e!r}")
+            await asyncio.sleep(RESIDENCY_CHECK_INTERVAL)
+
+    ##############################################################
+    def model_status(self, model: str) -> str:
+        if any(model in resident for resident in self.resident.values()):
+            return "resident"
+        if any(loading == model for _, loading in self.loading):
+            return "loading"
+        return "cold"
+
+    @property
+    def ready(self) -> bool:
+        """Every preloaded model is loaded somewhere"""
+        return not self.preloading and all(self.model_status(model) == "resident" for model in self.preload)
+
+    def status(self) -> dict:
+        models = {m.value for m in LLMModelsAvailable} | set(self.preload) | set(self.last_used)
+        return {
+            "ready": self.ready,
+            "preloading": self.preloading,
+            "models": {model: self.model_status(model) for model in sorted(models)},
+            "hosts": {host: sorted(resident) for host, resident in self.resident.items()},
+            "last_check_age": round(time.monotonic() - self.last_check, 1) if self.last_check else None,
+            **self.stats,
+        }
+
+
+RESIDENCY = ResidencyManager()
@@ -0,0 +1,278 @@
+"""Resumable /stream runs.
+
+A run is decoupled from the connection that started it:
+ - the graph runs in its own task and appends its SSE frames to a numbered log (`id: <n>` on every frame)
+ - connections only follow that log, so a client that lost its connection can come back with the run's
+   id (the `X-Run-ID` response header) and `Last-Event-ID`, get what it missed, and continue live
+ - a run with nobody following it is cancelled after STREAM_RESUME_GRACE seconds (see `watch_for_disconnect`)
+ - the graphs run with a SQLite checkpointer (thread id = run id), so a run that was cancelled, or
+   cut short by a server restart, resumes from its last completed node instead of starting over.
+   A run that failed is not resumed (it would most likely fail again), and its checkpoints are deleted
+ - checkpoints go with the run: once it's completed or failed, or once nobody came back for it within
+   RUN_RETENTION (a sweep every RUN_RETENTION seconds also gets those of runs cut short by a restart)
+
+Environment:
+
+    RESUMABLE_STREAMS=1                       # 0 turns all of this off (connections own their runs again)
+    CHECKPOINT_DB=~/.cache/plebserve/checkpoints.sqlite
+    STREAM_RESUME_GRACE=15
+    RUN_LOG_MAX_FRAMES=20000
+    RUN_RETENTION=300                         # How long a finished run's log (and an interrupted run's checkpoints) are kept around
+
+NOTE: the frame logs are in memory - after a restart a resumed run's frames start again at the
+resumed node (numbered on from the client's `Last-Event-ID`).
+"""
+
+import os
+import time
+import uuid
+import asyncio
+import logging
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, Callable, Optional
+
+from graphs.disk_cache import CACHE_DIR
+
+logger = logging.getLogger("PlebServe")
+
+RESUMABLE_STREAMS = os.getenv("RESUMABLE_STREAMS", "1").lower() not in ("0", "false", "no")
+CHECKPOINT_DB = os.getenv("CHECKPOINT_DB", os.path.join(CACHE_DIR, "checkpoints.sqlite"))
+STREAM_RESUME_GRACE = float(os.getenv("STREAM_RESUME_GRACE", 15))
+RUN_LOG_MAX_FRAMES = int(os.getenv("RUN_LOG_MAX_FRAMES", 20000))
+RUN_RETENTION = float(os.getenv("RUN_RETENTION", 300))
+
+
+class Run:
+    def __init__(self, run_id: str, agent_id: str, input_data: dict, last_seq: int = 0):
+        self.id = run_id
+        self.agent_id = agent_id
+        self.input_data = input_data  # To start over with, if the run was cut short before its first checkpoint
+        self.frames = deque(maxlen=RUN_LOG_MAX_FRAMES)  # (seq, frame)
+        self.last_seq = last_seq
+        self.task: Optional[asyncio.Task] = None
+        self.finished_at: Optional[float] = None
+        self.completed = False  # The graph ran to its end (as opposed to: was cancelled, or failed)
+        self.failed = False  # The graph raised
+        self.listeners = 0
+        self.detached_at = time.monotonic()
+        self._changed = asyncio.Event()
+
+    @property
+    def finished(self) -> bool:
+        return self.finished_at is not None
+
+    @property
+    def interrupted(self) -> bool:
+        """Cancelled (or cut short) before its end - the only kind of run that's resumed"""
+        return self.finished and not self.completed and not self.failed
+
+    def _wake(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def append(self, frame: str):
+        self.last_seq += 1
+        self.frames.append((self.last_seq, f"id: {self.last_seq}\n{frame}"))
+        self._wake()
+
+    async def follow(self, last_event_id: int = 0) -> AsyncIterator[str]:
+        """The frames after `last_event_id` (those still in the log), then the new ones as they come"""
+        self.listeners += 1
+        try:
+            last = last_event_id
+            while True:
+                changed = self._changed
+                while self.frames and last < self.last_seq:
+                    index = max(last + 1 - self.frames[0][0], 0)
+                    last, frame = self.frames[index]
+                    yield frame
+                if self.finished:
+                    return
+                await changed.wait()
+        finally:
+            self.listeners -= 1
+            self.detached_at = time.monotonic()
+
+    async def abandoned(self) -> bool:
+        """Nobody has been following this run for a while (used in place of `Request.is_disconnected`)"""
+        return self.listeners == 0 and time.monotonic() - self.detached_at > STREAM_RESUME_GRACE
+
+
+class RunRegistry:
+    def __init__(self):
+        self.runs = {}
+        self.checkpointer = None
+        self._graphs = {}
+        self._checkpointer_context = None
+        self._sweeper: Optional[asyncio.Task] = None
+        self._background = set()
+
+    @property
+    def enabled(self) -> bool:
+        return self.checkpointer is not None
+
+    async def open(self):
+        if not RESUMABLE_STREAMS:
+            return
+        try:
+            from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+        except ImportError:
+            logger.warning("langgraph-checkpoint-sqlite is not installed: streams can't be resumed")
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(CHECKPOINT_DB)), exist_ok=True)
+        self._checkpointer_context = AsyncSqliteSaver.from_conn_string(CHECKPOINT_DB)
+        self.checkpointer = await self._checkpointer_context.__aenter__()
+        await self.checkpointer.setup()
+        self._sweeper = asyncio.create_task(self._sweep_periodically())
+        logger.info(f"Resumable streams on (checkpoints in {CHECKPOINT_DB})")
+
+    async def close(self):
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+        for run in list(self.runs.values()):
+            if run.task and not run.task.done():
+                run.task.cancel()
+        if self._checkpointer_context is not None:
+            await self._checkpointer_context.__aexit__(None, None, None)
+            self.checkpointer = self._checkpointer_context = None
+
+    def graph_for(self, agent):
+        """The agent's graph, with our checkpointer"""
+        graph = self._graphs.get(agent.id)
+        if graph is None:
+            graph = self._graphs[agent.id] = agent.graph.copy(update={"checkpointer": self.checkpointer})
+        return graph
+
+    @staticmethod
+    def config_for(run_id: str, config: dict) -> dict:
+        return {**config, "configurable": {**config.get("configurable", {}), "thread_id": run_id}}
+
+    ##############################################################
+    # Checkpoints of runs we're done with
+    def _delete_checkpoints(self, run_id: str):
+        if self.checkpointer is None:
+            return
+        task = asyncio.create_task(self.checkpointer.adelete_thread(run_id))
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def sweep_checkpoints(self, max_age: float = RUN_RETENTION):
+        """Delete the checkpoints of runs we don't know about (i.e. cut short by a restart) that are older than `max_age`"""
+        async with self.checkpointer.lock:
+            async with self.checkpointer.conn.execute("SELECT DISTINCT thread_id FROM checkpoints") as cursor:
+                thread_ids = [row[0] for row in await cursor.fetchall()]
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=max_age)
+        for thread_id in thread_ids:
+            if thread_id in self.runs:
+                continue
+            latest = await self.checkpointer.aget_tuple({"configurable": {"thread_id": thread_id}})
+            if latest is None or datetime.fromisoformat(latest.checkpoint["ts"]) < cutoff:
+                await self.checkpointer.adelete_thread(thread_id)
+                logger.debug(f"Deleted the checkpoints of run {thread_id} (nobody came back for it)")
+
+    async def _sweep_periodically(self):
+        while True:
+            try:
+                await self.sweep_checkpoints()
+            except Exception as e:
+                logger.warning(f"Couldn't sweep old checkpoints: {e!r}")
+            await asyncio.sleep(max(RUN_RETENTION, 60))
+
+    def _expire(self):
+        now = time.monotonic()
+        for run_id, run in list(self.runs.items()):
+            if run.finished and now - run.finished_at > RUN_RETENTION:
+                del self.runs[run_id]
+                if run.interrupted:
+                    # Too late to come back for it (completed and failed runs lost theirs as they finished)
+                    self._delete_checkpoints(run_id)
+
+    def get(self, run_id: str) -> Optional[Run]:
+        self._expire()
+        return self.runs.get(run_id)
+
+    def start(self, agent, input_data: dict, config: dict, frames: Callable) -> Run:
+        """Start a new run.  `frames(graph, input, config, is_disconnected)` makes its SSE frames"""
+        self._expire()
+        run = Run(uuid.uuid4().hex, agent.id, input_data)
+        self.runs[run.id] = run
+        self._launch(run, agent, input_data, config, frames)
+        return run
+
+    async def resume(self, run_id: str, agent, config: dict, frames: Callable, last_event_id: int = 0) -> Optional[Run]:
+        """The run to follow for a client that comes back: the run itself if it's still going (or was
+        completed, or failed), otherwise the run picked up again from its last checkpoint.
+        None if we know nothing about it, or only that it failed (before a restart - we have nothing of it to send)."""
+        run = self.get(run_id)
+        if run is not None and not run.interrupted:
+            return run
+
+        graph = self.graph_for(agent)
+        snapshot = await graph.aget_state(self.config_for(run_id, config))
+        # Another connection may have resumed it in the meantime
+        run = self.runs.get(run_id, run)
+        if run is not None and not run.finished:
+            return run
+
+        if any(task.error for task in snapshot.tasks):
+            # It failed (before a restart, or we'd know) - running it again would most likely fail again
+            self._delete_checkpoints(run_id)
+            if run is not None:
+                run.failed = True
+            return run
+        if snapshot.next:
+            # Continue from the last completed node
+            input_data = None
+        elif not snapshot.values and run is not None:
+            # Cut short before the first checkpoint (i.e. while queued) - start over
+            input_data = run.input_data
+        else:
+            return run
+
+        if run is None:
+            run = Run(run_id, agent.id, {}, last_event_id)
+            self.runs[run_id] = run
+        run.finished_at = None
+        logger.info(f"Resuming run {run_id} of '{agent.id}'" + (f" at {snapshot.next}" if snapshot.next else ""))
+        self._launch(run, agent, input_data, config, frames)
+        return run
+
+    def _launch(self, run: Run, agent, input_data, config: dict, frames: Callable):
+        graph = self.graph_for(agent)
+        config = self.config_for(run.id, config)
+
+        async def produce():
+            try:
+                async for frame in frames(graph, input_data, config, run.abandoned):
+                    run.append(frame)
+            except Exception as e:
+                run.failed = True
+                logger.error(f"Run {run.id} of '{agent.id}' failed: {e!r}")
+            finally:
+                try:
+                    snapshot = await graph.aget_state(config)
+                    run.completed = not run.failed and bool(snapshot.values) and not snapshot.next
+                    if run.completed or run.failed:
+                        # Nothing left to resume
+                        await self.checkpointer.adelete_thread(run.id)
+                except Exception as e:
+                    logger.warning(f"Couldn't check the state of run {run.id}: {e!r}")
+                run.finished_at = time.monotonic()
+                run._wake()
+
+        run.task = asyncio.create_task(produce())
+
+    def status(self) -> dict:
+        self._expire()
+        return {
+            "enabled": self.enabled,
+            "runs": [
+                {"run_id": run.id, "agent_id": run.agent_id, "frames": run.last_seq, "listeners": run.listeners,
+                 "finished": run.finished, "completed": run.completed, "failed": run.failed}
+                for run in self.runs.values()
+            ],
+        }
+
+
+RUNS = RunRegistry()
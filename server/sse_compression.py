@@ -0,0 +1,63 @@
+"""Streaming gzip/deflate compression for our server-sent event responses.
+
+Every frame is compressed and then flushed with Z_SYNC_FLUSH, so the client can decode
+(and render) it right away - we keep the latency of an uncompressed stream while the
+compressor still gets to reuse its window across frames.
+
+NOTE: Starlette's GZipMiddleware deliberately skips `text/event-stream`, which is why this exists.
+"""
+
+import os
+import zlib
+from typing import AsyncIterator, Optional
+
+# 1 (fastest) - 9 (smallest).  0 turns compression off.
+SSE_COMPRESSION_LEVEL = int(os.getenv("SSE_COMPRESSION_LEVEL", 6))
+
+# In order of preference
+ENCODINGS = {
+    "gzip": 16 + zlib.MAX_WBITS,
+    "deflate": zlib.MAX_WBITS, # HTTP "deflate" is zlib-wrapped
+}
+
+
+def negotiate_encoding(accept_encoding: Optional[str], level: int = SSE_COMPRESSION_LEVEL) -> Optional[str]:
+    """Pick an encoding from an Accept-Encoding header, or None to send the stream uncompressed."""
+    if not accept_encoding or level == 0:
+        return None
+
+    accepted = {}
+    for item in accept_encoding.split(","):
+        coding, _, params = item.strip().partition(";")
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[coding.strip().lower()] = q
+
+    for encoding in ENCODINGS:
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+
+class FrameCompressor:
+    def __init__(self, encoding: str, level: int = SSE_COMPRESSION_LEVEL):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, ENCODINGS[encoding])
+
+    def compress(self, frame: bytes) -> bytes:
+        return self._compressor.compress(frame) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+async def compress_frames(frames: AsyncIterator[str], encoding: str, level: int = SSE_COMPRESSION_LEVEL) -> AsyncIterator[bytes]:
+    compressor = FrameCompressor(encoding, level)
+    async for frame in frames:
+        yield compressor.compress(frame.encode("utf-8"))
+    yield compressor.finish()
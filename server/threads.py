@@ -0,0 +1,194 @@
+"""Server-side conversation threads, so clients only send what's new.
+
+A /stream request with a `thread_id` carries just the new message(s) in `input_data.messages`; the
+server puts the thread's history in front of them and stores them, then stores the agent's reply once
+the run is complete.  A run that fails or is cancelled leaves its new message(s) in the thread without
+a reply - like the client shows it, so that undo (which keeps the first `keep` messages) agrees with it.
+
+ - threads are stored in SQLite (THREAD_DB), one row per message, so a turn only writes that turn
+ - the most recently used threads (THREAD_CACHE_SIZE) are kept in memory
+ - writes are queued and done by a background task, in order and in batches - a request never waits
+   on the disk to store a message (reading a thread that's not in memory waits for pending writes)
+"""
+
+import os
+import json
+import asyncio
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from graphs.disk_cache import CACHE_DIR
+
+logger = logging.getLogger("PlebServe")
+
+THREAD_DB = os.getenv("THREAD_DB", os.path.join(CACHE_DIR, "threads.sqlite"))
+THREAD_CACHE_SIZE = int(os.getenv("THREAD_CACHE_SIZE", 256))
+
+
+def _message(message) -> dict:
+    """A message as we store it (graphs may hand back LangChain messages instead of dicts)"""
+    if isinstance(message, dict):
+        return {"role": message.get("role"), "content": message.get("content")}
+    role = {"human": "user", "ai": "assistant"}.get(getattr(message, "type", None), getattr(message, "type", None))
+    return {"role": role, "content": getattr(message, "content", str(message))}
+
+
+def thread_reply(output) -> Optional[dict]:
+    """The agent's reply in a run's final output: the last message, or the research summary"""
+    if not isinstance(output, dict):
+        return None
+    if output.get("messages"):
+        return _message(output["messages"][-1])
+    for key in ("reply", "running_summary"):
+        if output.get(key):
+            return {"role": "assistant", "content": output[key]}
+    return None
+
+
+class ThreadStore:
+    def __init__(self, path: str = THREAD_DB, cache_size: int = THREAD_CACHE_SIZE):
+        self.path = path
+        self.cache_size = cache_size
+        self._hot = OrderedDict()  # thread_id -> list of messages
+        self._loading = {}  # thread_id -> asyncio.Future, so concurrent misses read the thread once
+        self._writes: Optional[asyncio.Queue] = None
+        self._writer: Optional[asyncio.Task] = None
+        self._local = threading.local()
+        self.stats = {"hits": 0, "misses": 0, "writes": 0}
+
+    ##############################################################
+    # Disk (these run in a thread)
+    def _connection(self) -> sqlite3.Connection:
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    def _setup(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._connection().execute("""
+            CREATE TABLE IF NOT EXISTS messages (
+                thread_id TEXT NOT NULL,
+                idx INTEGER NOT NULL,
+                message TEXT NOT NULL,
+                PRIMARY KEY (thread_id, idx)
+            )""")
+
+    def _read(self, thread_id: str) -> list:
+        rows = self._connection().execute(
+            "SELECT message FROM messages WHERE thread_id = ? ORDER BY idx", (thread_id,)
+        ).fetchall()
+        return [json.loads(message) for message, in rows]
+
+    def _write(self, ops: list):
+        db = self._connection()
+        db.execute("BEGIN")
+        try:
+            for op, thread_id, index, messages in ops:
+                # Both start by dropping whatever is at (or after) `index`
+                db.execute("DELETE FROM messages WHERE thread_id = ? AND idx >= ?", (thread_id, index))
+                if op == "append":
+                    db.executemany(
+                        "INSERT INTO messages (thread_id, idx, message) VALUES (?, ?, ?)",
+                        [(thread_id, index + i, json.dumps(m)) for i, m in enumerate(messages)],
+                    )
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+
+    ##############################################################
+    async def open(self):
+        await asyncio.to_thread(self._setup)
+        self._writes = asyncio.Queue()
+        self._writer = asyncio.create_task(self._write_loop())
+
+    async def close(self):
+        if self._writer is not None:
+            await self.flush()
+            self._writer.cancel()
+            self._writer = None
+
+    async def _write_loop(self):
+        while True:
+            ops = [await self._writes.get()]
+            # Everything else that's waiting goes into the same transaction
+            while not self._writes.empty():
+                ops.append(self._writes.get_nowait())
+            try:
+                await asyncio.to_thread(self._write, ops)
+                self.stats["writes"] += len(ops)
+            except Exception as e:
+                logger.error(f"Failed to store {len(ops)} thread update(s): {e!r}")
+            finally:
+                for _ in ops:
+                    self._writes.task_done()
+
+    async def flush(self):
+        """Wait until every queued write is on disk"""
+        if self._writes is not None:
+            await self._writes.join()
+
+    def _remember(self, thread_id: str, messages: list):
+        self._hot[thread_id] = messages
+        self._hot.move_to_end(thread_id)
+        while len(self._hot) > self.cache_size:
+            self._hot.popitem(last=False)
+
+    async def _messages(self, thread_id: str) -> list:
+        """The thread's (cached, mutable) list of messages"""
+        messages = self._hot.get(thread_id)
+        if messages is not None:
+            self._hot.move_to_end(thread_id)
+            self.stats["hits"] += 1
+            return messages
+
+        loading = self._loading.get(thread_id)
+        if loading is not None:
+            return await asyncio.shield(loading)
+
+        self.stats["misses"] += 1
+        loading = self._loading[thread_id] = asyncio.get_running_loop().create_future()
+        try:
+            # NOTE: the thread may have writes waiting in the queue (i.e. it was just evicted)
+            await self.flush()
+            messages = await asyncio.to_thread(self._read, thread_id)
+            self._remember(thread_id, messages)
+            loading.set_result(messages)
+            return messages
+        except BaseException as e:
+            loading.set_exception(e)
+            loading.exception()  # Retrieved - whoever else waits on it gets it raised
+            raise
+        finally:
+            del self._loading[thread_id]
+
+    async def get(self, thread_id: str) -> list:
+        return list(await self._messages(thread_id))
+
+    async def append(self, thread_id: str, new_messages: list):
+        messages = await self._messages(thread_id)
+        index = len(messages)
+        new_messages = [_message(m) for m in new_messages]
+        messages.extend(new_messages)
+        self._writes.put_nowait(("append", thread_id, index, new_messages))
+
+    async def truncate(self, thread_id: str, keep: int = 0):
+        """Drop all but the first `keep` messages (i.e. to undo the last turn)"""
+        messages = await self._messages(thread_id)
+        keep = max(keep, 0)
+        del messages[keep:]
+        self._writes.put_nowait(("truncate", thread_id, keep, None))
+
+    def status(self) -> dict:
+        return {**self.stats, "hot": len(self._hot), "max_hot": self.cache_size,
+                "pending_writes": self._writes.qsize() if self._writes else 0}
+
+
+THREADS = ThreadStore()
@@ -0,0 +1,274 @@
+"""Where a run's time went: a tree of spans (graph, nodes, LLM calls, searches) per /stream run.
+
+ - `RunTimeline` is a callback handler attached to every run; searches (and anything else that
+   isn't a LangChain run) add their spans with `graphs.spans.record_span`
+ - every span has its start and end, status, and what's cheap to know about it: token counts and
+   payload sizes (characters of the prompts, replies, node inputs and outputs)
+ - GET /runs/{id}/timeline returns the tree as JSON, or with `?format=chrome` in the Chrome trace
+   event format (open it in https://ui.perfetto.dev or chrome://tracing for a flame chart).
+   The id is in the `X-Timeline-ID` header of the /stream response
+ - the timelines of the last TIMELINE_HISTORY finished runs are kept (in memory, per worker)
+
+A resumed run (see `runs.py`) goes on in the timeline it had.
+
+Environment:
+
+    TIMELINE_HISTORY=100
+    TIMELINE_MAX_SPANS=5000                   # Per run, spans after that are dropped
+"""
+
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+from uuid import UUID, uuid4
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+TIMELINE_HISTORY = int(os.getenv("TIMELINE_HISTORY", 100))
+TIMELINE_MAX_SPANS = int(os.getenv("TIMELINE_MAX_SPANS", 5000))
+
+
+def _size(payload, depth: int = 0) -> int:
+    """Characters of text in `payload` (its strings and message contents) - roughly what it weighs in the
+    events we send.  NOTE: called inline for every node, on the whole graph state: no serializing, just len()"""
+    if isinstance(payload, str):
+        return len(payload)
+    if depth > 4:
+        return 0
+    if isinstance(payload, dict):
+        return sum(_size(value, depth + 1) for value in payload.values())
+    if isinstance(payload, (list, tuple)):
+        return sum(_size(item, depth + 1) for item in payload)
+    content = getattr(payload, "content", None)
+    if content is not None:
+        return _size(content, depth + 1)
+    return 0
+
+
+def _message_chars(messages) -> int:
+    return sum(_size(m.content) for m in messages)
+
+
+class Span:
+    __slots__ = ("id", "parent", "kind", "name", "start", "end", "status", "tokens", "attributes")
+
+    def __init__(self, span_id, parent, kind: str, name: str, start: float, attributes: Optional[dict] = None):
+        self.id = span_id
+        self.parent = parent
+        self.kind = kind
+        self.name = name
+        self.start = start
+        self.end: Optional[float] = None
+        self.status = "running"
+        self.tokens = 0  # Streamed tokens (LLM calls)
+        self.attributes = attributes or {}
+
+
+class Timeline:
+    def __init__(self, run_id: str, agent_id: str):
+        self.run_id = run_id
+        self.agent_id = agent_id
+        # perf_counter is what we time with, this is how it maps to the wall clock
+        self.wall_offset = time.time() - time.perf_counter()
+        self.spans = OrderedDict()  # span id -> Span
+        self.dropped = 0
+        self.finished = False
+
+    def add(self, span: Span) -> Optional[Span]:
+        if len(self.spans) >= TIMELINE_MAX_SPANS:
+            self.dropped += 1
+            return None
+        self.spans[span.id] = span
+        return span
+
+    ##############################################################
+    def _span_json(self, span: Span, origin: float) -> dict:
+        end = span.end if span.end is not None else time.perf_counter()
+        attributes = dict(span.attributes)
+        if span.tokens:
+            attributes.setdefault("streamed_tokens", span.tokens)
+        return {
+            "kind": span.kind,
+            "name": span.name,
+            "status": span.status,
+            "start": round(self.wall_offset + span.start, 6),
+            "end": round(self.wall_offset + end, 6) if span.end is not None else None,
+            "offset_ms": round((span.start - origin) * 1000, 3),
+            "duration_ms": round((end - span.start) * 1000, 3),
+            "attributes": attributes,
+            "children": [],
+        }
+
+    def to_json(self) -> dict:
+        spans = list(self.spans.values())
+        origin = min((s.start for s in spans), default=0.0)
+        nodes = {span.id: self._span_json(span, origin) for span in spans}
+        roots = []
+        for span in spans:
+            parent = nodes.get(span.parent)
+            (parent["children"] if parent is not None else roots).append(nodes[span.id])
+        return {"run_id": self.run_id, "agent_id": self.agent_id, "finished": self.finished,
+                "dropped_spans": self.dropped, "spans": roots}
+
+    def to_chrome_trace(self) -> dict:
+        """Chrome trace events ("X" events, in microseconds), one row (tid) per lane of properly nested spans"""
+        now = time.perf_counter()
+        spans = sorted(self.spans.values(), key=lambda s: (s.start, -((s.end or now) - s.start)))
+        # Per lane: the ends of its spans that are still open at the current start, innermost last.
+        # NOTE: spans come by start, so a span fits a lane if it ends within the innermost one still open there
+        lanes = []
+        lane_of = {}
+
+        def fits(lane: list, start: float, end: float) -> bool:
+            while lane and lane[-1] <= start:
+                lane.pop()
+            return not lane or end <= lane[-1]
+
+        events = []
+        for span in spans:
+            end = span.end if span.end is not None else now
+            order = [lane_of[span.parent]] if span.parent in lane_of else []
+            order += [i for i in range(len(lanes)) if i not in order]
+            lane = next((i for i in order if fits(lanes[i], span.start, end)), None)
+            if lane is None:
+                lane = len(lanes)
+                lanes.append([])
+            lanes[lane].append(end)
+            lane_of[span.id] = lane
+            args = dict(span.attributes, status=span.status)
+            if span.tokens:
+                args.setdefault("streamed_tokens", span.tokens)
+            events.append({
+                "name": span.name, "cat": span.kind, "ph": "X", "pid": 1, "tid": lane + 1,
+                "ts": round((self.wall_offset + span.start) * 1e6), "dur": round((end - span.start) * 1e6),
+                "args": args,
+            })
+        events.append({"name": "process_name", "ph": "M", "pid": 1, "args": {"name": f"{self.agent_id} run {self.run_id}"}})
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+class TimelineStore:
+    def __init__(self, history: int = TIMELINE_HISTORY):
+        self.history = history
+        self.active = {}  # run id -> Timeline
+        self.finished = OrderedDict()  # run id -> Timeline, the oldest first
+
+    def open(self, run_id: str, agent_id: str) -> Timeline:
+        """The run's timeline: a new one, or the one it had before (a resumed run)"""
+        timeline = self.active.get(run_id) or self.finished.pop(run_id, None) or Timeline(run_id, agent_id)
+        timeline.finished = False
+        self.active[run_id] = timeline
+        return timeline
+
+    def close(self, timeline: Timeline):
+        timeline.finished = True
+        self.active.pop(timeline.run_id, None)
+        self.finished[timeline.run_id] = timeline
+        self.finished.move_to_end(timeline.run_id)
+        while len(self.finished) > self.history:
+            self.finished.popitem(last=False)
+
+    def get(self, run_id: str) -> Optional[Timeline]:
+        return self.active.get(run_id) or self.finished.get(run_id)
+
+
+TIMELINES = TimelineStore()
+
+
+class RunTimeline(BaseCallbackHandler):
+    """Callback handler that records the spans of a run"""
+    run_inline = True
+
+    def __init__(self, timeline: Timeline):
+        self.timeline = timeline
+        self._root = None  # This run's graph span
+
+    def _start(self, run_id: UUID, parent_run_id: Optional[UUID], kind: str, name: str, attributes: dict) -> Optional[Span]:
+        spans = self.timeline.spans
+        # NOTE: spans whose parent we didn't record (i.e. runs inside a node) hang off the closest one we did
+        return self.timeline.add(Span(run_id, parent_run_id if parent_run_id in spans else self._root,
+                                      kind, name, time.perf_counter(), attributes))
+
+    def _end(self, run_id: UUID, status: str, **attributes):
+        span = self.timeline.spans.get(run_id)
+        if span is not None and span.end is None:
+            span.end = time.perf_counter()
+            span.status = status
+            span.attributes.update(attributes)
+
+    ##############################################################
+    # Graph and nodes
+    def on_chain_start(self, serialized, inputs, *, run_id: UUID, parent_run_id: Optional[UUID] = None,
+                       metadata: Optional[dict] = None, **kwargs: Any):
+        name = kwargs.get("name") or "chain"
+        if parent_run_id is None:
+            span = self._start(run_id, None, "graph", name, {"input_chars": _size(inputs)})
+            self._root = span.id if span else None
+            return
+        node = (metadata or {}).get("langgraph_node")
+        if node and name == node and not node.startswith("__"):
+            self._start(run_id, parent_run_id, "node", node, {
+                "input_chars": _size(inputs),
+                "step": (metadata or {}).get("langgraph_step"),
+            })
+
+    def on_chain_end(self, outputs, *, run_id: UUID, **kwargs: Any):
+        if run_id in self.timeline.spans:
+            self._end(run_id, "completed", output_chars=_size(outputs))
+
+    def on_chain_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any):
+        self._end(run_id, "error", error=repr(error))
+
+    ##############################################################
+    # LLM calls
+    def on_chat_model_start(self, serialized, messages, *, run_id: UUID, parent_run_id: Optional[UUID] = None,
+                            metadata: Optional[dict] = None, **kwargs: Any):
+        model = (metadata or {}).get("ls_model_name")
+        self._start(run_id, parent_run_id, "llm", kwargs.get("name") or model or "llm", {
+            "model": model,
+            "prompt_chars": sum(_message_chars(batch) for batch in messages),
+        })
+
+    def on_llm_start(self, serialized, prompts, *, run_id: UUID, parent_run_id: Optional[UUID] = None,
+                     metadata: Optional[dict] = None, **kwargs: Any):
+        model = (metadata or {}).get("ls_model_name")
+        self._start(run_id, parent_run_id, "llm", kwargs.get("name") or model or "llm", {
+            "model": model,
+            "prompt_chars": sum(len(prompt) for prompt in prompts),
+        })
+
+    def on_llm_new_token(self, token: str, *, run_id: UUID, **kwargs: Any):
+        span = self.timeline.spans.get(run_id)
+        if span is not None and token:
+            if not span.tokens:
+                span.attributes["first_token_ms"] = round((time.perf_counter() - span.start) * 1000, 3)
+            span.tokens += 1
+
+    def on_llm_end(self, response, *, run_id: UUID, **kwargs: Any):
+        attributes = {}
+        generations = [g for batch in response.generations for g in batch]
+        if generations:
+            attributes["output_chars"] = sum(len(g.text) for g in generations)
+            # Ollama's own counts
+            info = generations[-1].generation_info or {}
+            if "eval_count" in info:
+                attributes["prompt_tokens"] = info.get("prompt_eval_count")
+                attributes["completion_tokens"] = info.get("eval_count")
+                attributes["prefill_ms"] = round((info.get("prompt_eval_duration") or 0) / 1e6, 3)
+        self._end(run_id, "completed", **attributes)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any):
+        self._end(run_id, "error", error=repr(error))
+
+    ##############################################################
+    # Everything else (see `graphs/spans.py`)
+    def on_span(self, kind: str, name: str, started: float, ended: float, parent_run_id: Optional[UUID] = None,
+                status: str = "completed", attributes: Optional[dict] = None):
+        span = self._start(uuid4(), parent_run_id, kind, name, attributes or {})
+        if span is not None:
+            span.start, span.end, span.status = started, ended, status
+
+    def span(self, kind: str, name: str, started: float, ended: float, **attributes):
+        """A span of our own (i.e. the time spent queued for a model), at the top of the tree"""
+        self.on_span(kind, name, started, ended, parent_run_id=self._root, attributes=attributes)
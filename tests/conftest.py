@@ -0,0 +1,11 @@
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The server imports its modules top-level (`from runs import RUNS`), the graphs are a package at the root
+sys.path[:0] = [ROOT, os.path.join(ROOT, "server")]
+
+# NOTE: set before anything is imported - the caches and databases pick their paths at import time
+os.environ.setdefault("CACHE_DIR", tempfile.mkdtemp(prefix="plebserve-tests-"))
@@ -0,0 +1,99 @@
+import asyncio
+
+from admission import AdmissionController, ModelSlots, parse_limits
+
+
+def test_parse_limits():
+    assert parse_limits("deepseek-r1:14b=1, phi4=3,") == {"deepseek-r1:14b": 1, "phi4": 3}
+    assert parse_limits("phi4=0") == {"phi4": 1}
+    assert parse_limits(None) == {}
+
+
+def test_fifo_admission():
+    async def run():
+        slots = ModelSlots("phi4", limit=1)
+        assert slots.try_acquire()
+        first, second = slots.enqueue(), slots.enqueue()
+        assert (slots.position(first), slots.position(second)) == (1, 2)
+        # Nobody jumps the queue while it's not empty
+        assert not slots.try_acquire()
+
+        slots.release()
+        assert first.done() and not second.done()
+        assert slots.active == 1
+        slots.release()
+        assert second.done()
+        slots.release()
+        assert slots.active == 0 and slots.try_acquire()
+    asyncio.run(run())
+
+
+def test_abandoned_waiter_is_skipped():
+    async def run():
+        slots = ModelSlots("phi4", limit=1)
+        slots.try_acquire()
+        first, second = slots.enqueue(), slots.enqueue()
+        slots.abandon(first)
+        assert first.cancelled() and slots.position(second) == 1
+        slots.release()
+        assert second.done()
+    asyncio.run(run())
+
+
+def test_abandoning_a_handed_over_slot_passes_it_on():
+    async def run():
+        slots = ModelSlots("phi4", limit=1)
+        slots.try_acquire()
+        first, second = slots.enqueue(), slots.enqueue()
+        slots.release()
+        assert first.done()
+        # The client left just as its turn came
+        slots.abandon(first)
+        assert second.done() and slots.active == 1
+    asyncio.run(run())
+
+
+def test_estimated_wait():
+    slots = ModelSlots("phi4", limit=2)
+    assert slots.estimated_wait(1) is None
+    slots.active = 1
+    slots.release(held_for=10.0)
+    assert slots.estimated_wait(1) == 10.0
+    assert slots.estimated_wait(3) == 20.0
+
+
+def test_tickets_are_admitted_in_order():
+    async def run():
+        controller = AdmissionController({"phi4": 1})
+        admitted = []
+
+        async def use(name):
+            ticket = controller.ticket(["phi4"])
+            async for _ in ticket.wait():
+                pass
+            admitted.append(name)
+            await asyncio.sleep(0.01)
+            ticket.release()
+
+        await asyncio.gather(*(use(i) for i in range(5)))
+        assert admitted == list(range(5))
+        assert controller.slots("phi4").status()["active"] == 0
+    asyncio.run(run())
+
+
+def test_queued_ticket_reports_its_position():
+    async def run():
+        controller = AdmissionController({"phi4": 1})
+        holder = controller.ticket(["phi4"])
+        async for _ in holder.wait():
+            pass
+        waiting = controller.ticket(["phi4"])
+        updates = waiting.wait()
+        assert await updates.__anext__() == {"model": "phi4", "position": 1, "estimated_wait": None}
+        holder.release()
+        async for _ in updates:
+            pass
+        assert controller.slots("phi4").active == 1
+        waiting.release()
+        assert controller.slots("phi4").active == 0
+    asyncio.run(run())
@@ -0,0 +1,18 @@
+from app import etag_matches
+
+
+def test_no_header():
+    assert not etag_matches(None, '"abc"')
+    assert not etag_matches("", '"abc"')
+
+
+def test_exact_and_weak():
+    assert etag_matches('"abc"', '"abc"')
+    assert etag_matches('W/"abc"', '"abc"')
+    assert not etag_matches('"abd"', '"abc"')
+
+
+def test_list_and_wildcard():
+    assert etag_matches('"x", W/"abc" ,"y"', '"abc"')
+    assert not etag_matches('"x", "y"', '"abc"')
+    assert etag_matches(" * ", '"abc"')
@@ -0,0 +1,104 @@
+import asyncio
+import time
+
+import pytest
+
+import app
+from admission import AdmissionController, models_for_run
+from cancellation import RunCancellation, RunCancelled
+from graphs import get_agent
+
+
+def test_llm_calls_raise_once_cancelled():
+    cancellation = RunCancellation("ollama")
+    cancellation.on_llm_new_token("a")
+    cancellation.cancel()
+    assert cancellation.cancelled and cancellation.tokens_at_cancel == 1
+    with pytest.raises(RunCancelled):
+        cancellation.on_llm_new_token("b")
+    with pytest.raises(RunCancelled):
+        cancellation.on_chat_model_start({}, [[]])
+    assert cancellation.tokens == 2
+
+
+def test_run_end_callbacks_fire_once():
+    cancellation = RunCancellation("ollama")
+    called = []
+
+    def failing():
+        raise RuntimeError("boom")
+    cancellation.add_run_end_callback(lambda: called.append("first"))
+    cancellation.add_run_end_callback(failing)
+    cancellation.add_run_end_callback(lambda: called.append("last"))
+    cancellation.run_ended()
+    cancellation.run_ended()
+    assert called == ["first", "last"]
+
+
+class SlowGraph:
+    """Streams one event, then sits in a node that takes `cleanup` seconds to stop once it's cancelled"""
+    def __init__(self, admission, model, cleanup=0.2):
+        self.admission, self.model, self.cleanup = admission, model, cleanup
+        self.held_while_stopping = None
+        self.stopped = asyncio.Event()
+
+    async def astream_events(self, input, config, version):
+        yield {"event": "on_chain_start", "name": "LangGraph", "run_id": "1", "data": {}}
+        try:
+            await asyncio.sleep(60)
+        except asyncio.CancelledError:
+            # i.e. a synchronous LLM call in a thread that only notices at its next token
+            await asyncio.sleep(self.cleanup)
+            self.held_while_stopping = self.admission.slots(self.model).active
+            self.stopped.set()
+            raise
+
+
+@pytest.fixture
+def slow_run(monkeypatch):
+    agent = get_agent("ollama")
+    [model] = models_for_run(agent, {})
+    admission = AdmissionController(default_limit=1)
+    monkeypatch.setattr(app, "ADMISSION", admission)
+    monkeypatch.setattr(app, "DISCONNECT_POLL_INTERVAL", 0.01)
+    return agent, admission, model
+
+
+def test_client_that_goes_away_cancels_the_run(slow_run):
+    agent, admission, model = slow_run
+    graph = SlowGraph(admission, model)
+    frames = []
+
+    async def is_disconnected():
+        return bool(frames)
+
+    async def run():
+        started = time.monotonic()
+        async for frame in app.stream_generator(agent, {}, {}, is_disconnected=is_disconnected, graph=graph):
+            frames.append(frame)
+        await asyncio.gather(*app.BACKGROUND_TASKS)
+        return time.monotonic() - started
+
+    assert asyncio.run(run()) < 5
+    assert len(frames) == 1 and graph.stopped.is_set()
+    # The slot was only given back once the graph had stopped
+    assert graph.held_while_stopping == 1
+    assert admission.slots(model).active == 0
+
+
+def test_closed_response_releases_the_ticket_once_the_graph_stopped(slow_run):
+    agent, admission, model = slow_run
+    graph = SlowGraph(admission, model)
+
+    async def run():
+        # What Starlette does when the client disconnects: close the generator mid-stream
+        frames = app.stream_generator(agent, {}, {}, graph=graph)
+        await frames.__anext__()
+        await frames.aclose()
+        held_after_close = admission.slots(model).active
+        await asyncio.gather(*app.BACKGROUND_TASKS)
+        return held_after_close
+
+    assert asyncio.run(run()) == 1
+    assert graph.stopped.is_set() and graph.held_while_stopping == 1
+    assert admission.slots(model).active == 0
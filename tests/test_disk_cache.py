@@ -0,0 +1,58 @@
+import time
+
+from graphs.disk_cache import DiskCache
+
+
+def size_total(cache):
+    db = cache._connection()
+    return cache._total(db), db.execute(f"SELECT COALESCE(SUM(size), 0) FROM {cache.table}").fetchone()[0]
+
+
+def test_round_trip_and_compression(tmp_path):
+    cache = DiskCache(str(tmp_path / "cache.sqlite"), compress_above=100)
+    small, large = b"x" * 10, b"y" * 10_000
+    cache.set("small", small)
+    cache.set("large", large)
+    assert cache.get("small") == small and cache.get("large") == large
+    assert cache.get("missing") is None
+    stored = dict(cache._connection().execute("SELECT key, compressed FROM cache").fetchall())
+    assert stored == {"small": 0, "large": 1}
+    assert cache.stats()["hits"] == 2 and cache.stats()["misses"] == 1
+
+
+def test_entries_expire(tmp_path, monkeypatch):
+    cache = DiskCache(str(tmp_path / "cache.sqlite"), ttl=60)
+    cache.set("key", b"value")
+    assert cache.get("key") == b"value"
+    later = time.time() + 61
+    monkeypatch.setattr(time, "time", lambda: later)
+    assert cache.get("key") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_least_recently_used_are_evicted(tmp_path, monkeypatch):
+    cache = DiskCache(str(tmp_path / "cache.sqlite"), max_bytes=300, compress_above=None)
+    clock = iter(range(1_000_000, 2_000_000))
+    monkeypatch.setattr(time, "time", lambda: next(clock))
+    for key in "abc":
+        cache.set(key, b"." * 100)
+    cache.get("a")  # "b" is the least recently used now
+    cache.set("d", b"." * 100)
+    assert cache.get("b") is None
+    assert all(cache.get(key) is not None for key in "acd")
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["bytes"] == 300
+
+
+def test_size_total_follows_every_write(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    cache = DiskCache(path, max_bytes=1000, compress_above=None)
+    for i in range(30):
+        cache.set(f"key{i % 7}", b"." * (10 * i))
+        assert size_total(cache)[0] == size_total(cache)[1] <= 1000
+    cache.clear()
+    assert size_total(cache) == (0, 0)
+
+    # Another connection (i.e. another worker) sees the same total
+    cache.set("key", b"." * 50)
+    assert DiskCache(path).stats()["bytes"] == 50
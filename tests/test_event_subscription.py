@@ -0,0 +1,97 @@
+import asyncio
+from typing import TypedDict
+
+from langchain_core.language_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage
+from langgraph.graph import StateGraph, START, END
+
+from app import EventSubscription
+
+
+class State(TypedDict):
+    query: str
+    summary: str
+
+
+async def web_research(state: State):
+    return {"query": state["query"]}
+
+
+async def summarize_sources(state: State):
+    llm = GenericFakeChatModel(messages=iter([AIMessage(content="solar panels convert light")]))
+    result = await llm.ainvoke("summarize")
+    return {"summary": result.content}
+
+
+def run_events() -> list:
+    """The events of a real run: what `astream_events` hands `/stream`"""
+    builder = StateGraph(State)
+    builder.add_node("web_research", web_research)
+    builder.add_node("summarize_sources", summarize_sources)
+    builder.add_edge(START, "web_research")
+    builder.add_edge("web_research", "summarize_sources")
+    builder.add_edge("summarize_sources", END)
+    graph = builder.compile()
+
+    async def run():
+        return [event async for event in graph.astream_events({"query": "solar"}, version="v2")]
+    return asyncio.run(run())
+
+
+EVENTS = run_events()
+
+
+def tokens(events) -> str:
+    return "".join(e["data"]["chunk"].content for e in events if e["event"] == "on_chat_model_stream")
+
+
+def nodes(events) -> set:
+    return {e.get("metadata", {}).get("langgraph_node") for e in events}
+
+
+def test_everything_by_default():
+    wanted = EventSubscription().compile()
+    assert all(wanted(event) for event in EVENTS)
+    assert wanted({})
+
+
+def test_event_types():
+    wanted = EventSubscription(events=["on_chat_model_stream"]).compile()
+    kept = [e for e in EVENTS if wanted(e)]
+    assert kept and {e["event"] for e in kept} == {"on_chat_model_stream"}
+    assert tokens(kept) == "solar panels convert light"
+
+
+def test_include_nodes_keeps_the_tokens_a_node_streams():
+    # NOTE: the token events are named after the LLM, not the node
+    assert {e["name"] for e in EVENTS if e["event"] == "on_chat_model_stream"} == {"GenericFakeChatModel"}
+    wanted = EventSubscription(include_nodes=["summarize_*"]).compile()
+    kept = [e for e in EVENTS if wanted(e)]
+    assert tokens(kept) == "solar panels convert light"
+    assert nodes(kept) == {"summarize_sources"}
+
+
+def test_exclude_nodes():
+    wanted = EventSubscription(exclude_nodes=["summarize_sources"]).compile()
+    kept = [e for e in EVENTS if wanted(e)]
+    assert not tokens(kept)
+    assert "web_research" in nodes(kept)
+    # The graph's own events (outside of any node) go by their name
+    assert any(e["name"] == "LangGraph" for e in kept)
+
+
+def test_empty_include_matches_nothing():
+    wanted = EventSubscription(include_nodes=[]).compile()
+    assert not any(wanted(event) for event in EVENTS)
+
+
+def test_hide_underscore_nodes():
+    wanted = EventSubscription(hide_underscore_nodes=True).compile()
+    kept = [e for e in EVENTS if wanted(e)]
+    assert not any(e["name"].startswith("_") for e in kept)
+    assert tokens(kept) == "solar panels convert light"
+    # Runs named with a '_' inside a node are hidden too (i.e. the history summary's LLM call)
+    hidden = {"event": "on_chat_model_stream", "name": "_summarize_history", "metadata": {"langgraph_node": "ollama"}}
+    assert not wanted(hidden)
+    start = {"event": "on_chain_start", "name": "__start__", "metadata": {"langgraph_node": "__start__"}}
+    assert not wanted(start)
@@ -0,0 +1,70 @@
+import asyncio
+import uuid
+
+from graphs.ollama.history import compact_history, estimate_tokens
+
+
+class FakeLLM:
+    def __init__(self):
+        self.prompts = []
+
+    async def ainvoke(self, messages, config=None):
+        self.prompts.append(messages[0]["content"])
+        return type("Reply", (), {"content": f"<think>hmm</think> summary {len(self.prompts)}"})()
+
+
+def conversation(turns, chars=400, start=0):
+    return [{"role": "user" if i % 2 == 0 else "assistant", "content": f"{i} " + "x" * chars} for i in range(start, start + turns)]
+
+
+def compact(messages, llm, budget=500, conversation_id=None):
+    return asyncio.run(compact_history(messages, "You are helpful.", budget, llm, conversation_id or uuid.uuid4().hex))
+
+
+def test_fits_as_is():
+    llm = FakeLLM()
+    messages = conversation(3)
+    assert compact(messages, llm) is messages
+    assert compact(messages, llm, budget=0) is messages
+    assert not llm.prompts
+
+
+def test_older_messages_are_folded_into_a_summary():
+    llm = FakeLLM()
+    messages = conversation(20)
+    compacted = compact(messages, llm)
+    assert compacted[0] == {"role": "system", "content": "Summary of the earlier conversation:\nsummary 1"}
+    # The newest messages are kept as they are, and it all fits now
+    assert compacted[-1] == messages[-1]
+    assert compacted[1:] == messages[-(len(compacted) - 1):]
+    assert sum(estimate_tokens(m["content"]) for m in compacted) <= 500
+    assert len(llm.prompts) == 1
+
+
+def test_summary_is_reused_and_extended():
+    llm, key = FakeLLM(), uuid.uuid4().hex
+    messages = conversation(20)
+    first = compact(messages, llm, conversation_id=key)
+    # The next turn fits next to the cached summary: no LLM call
+    second = compact(messages + conversation(1, chars=10, start=20), llm, conversation_id=key)
+    assert len(llm.prompts) == 1 and second[0] == first[0]
+    # Once it doesn't, only the messages folded since go to the LLM, with the summary so far
+    compact(messages + conversation(12, start=20), llm, conversation_id=key)
+    assert len(llm.prompts) == 2
+    assert "summary 1" in llm.prompts[1] and "user: " + messages[0]["content"] not in llm.prompts[1]
+
+
+def test_summary_is_not_used_after_the_history_changed():
+    llm, key = FakeLLM(), uuid.uuid4().hex
+    messages = conversation(20)
+    compact(messages, llm, conversation_id=key)
+    edited = [{"role": "user", "content": "edited " + "y" * 400}] + messages[1:]
+    compact(edited, llm, conversation_id=key)
+    assert len(llm.prompts) == 2 and "(none yet)" in llm.prompts[1]
+
+
+def test_a_single_long_message_is_left_alone():
+    llm = FakeLLM()
+    messages = conversation(1, chars=10_000)
+    assert compact(messages, llm) == messages
+    assert not llm.prompts
@@ -0,0 +1,50 @@
+import pytest
+
+from graphs.metrics import Counter, Gauge, Histogram, render_metrics
+
+
+def test_counter_and_gauge():
+    requests = Counter("test_requests_total", "Requests", ("agent",))
+    requests.labels("chat").inc()
+    requests.labels("chat").inc(2)
+    requests.labels('say "hi"\n').inc()
+    assert requests.render().splitlines() == [
+        "# HELP test_requests_total Requests",
+        "# TYPE test_requests_total counter",
+        'test_requests_total{agent="chat"} 3',
+        'test_requests_total{agent="say \\"hi\\"\\n"} 1',
+    ]
+
+    queued = Gauge("test_queued", "Queued runs")
+    queued.inc(3)
+    queued.dec()
+    assert queued.render().splitlines()[-1] == "test_queued 2"
+    queued.set(0.5)
+    assert queued.render().splitlines()[-1] == "test_queued 0.5"
+
+
+def test_histogram_buckets_are_cumulative():
+    latency = Histogram("test_latency_seconds", "Latency", ("model",), buckets=(1.0, 0.1))
+    series = latency.labels("phi4")
+    for value in (0.05, 0.1, 0.5, 2.0):
+        series.observe(value)
+    assert latency.render().splitlines()[2:] == [
+        'test_latency_seconds_bucket{model="phi4",le="0.1"} 2',
+        'test_latency_seconds_bucket{model="phi4",le="1"} 3',
+        'test_latency_seconds_bucket{model="phi4",le="+Inf"} 4',
+        'test_latency_seconds_sum{model="phi4"} 2.65',
+        'test_latency_seconds_count{model="phi4"} 4',
+    ]
+
+
+def test_wrong_number_of_labels():
+    metric = Counter("test_labelled_total", "Labelled", ("a", "b"))
+    with pytest.raises(ValueError):
+        metric.labels("only one")
+
+
+def test_render_metrics_has_every_metric():
+    Counter("test_rendered_total", "Rendered").inc()
+    text = render_metrics()
+    assert text.endswith("\n")
+    assert "# TYPE test_rendered_total counter\ntest_rendered_total 1" in text
@@ -0,0 +1,123 @@
+import pytest
+
+from graphs import ollama_pool
+from graphs.ollama_pool import OllamaPool, loaded_models, model_name
+
+HOSTS = ["http://gpu1:11434", "http://gpu2:11434", "http://gpu3:11434"]
+
+
+@pytest.fixture
+def pool():
+    pool = OllamaPool(HOSTS)
+    # No prober thread talking to hosts that don't exist
+    pool.stop_probing()
+    return pool
+
+
+def backend(pool, url):
+    return next(b for b in pool.backends if b.url == url)
+
+
+def test_model_names():
+    assert model_name("phi4:latest") == "phi4"
+    assert model_name("deepseek-r1:14b") == "deepseek-r1:14b"
+    ps = {"models": [{"name": "phi4:latest"}, {"model": "deepseek-r1:14b"}]}
+    assert loaded_models(ps) == {"phi4", "deepseek-r1:14b"}
+    assert loaded_models({}) == set()
+
+
+def test_least_outstanding_first(pool):
+    picked = [pool.pick(None) for _ in range(3)]
+    assert sorted(b.url for b in picked) == HOSTS
+    pool.release(picked[0], ok=True)
+    assert pool.pick(None) is picked[0]
+
+
+def test_prefers_hosts_with_the_model_loaded(pool):
+    gpu2 = backend(pool, HOSTS[1])
+    gpu2.loaded = {"phi4"}
+    gpu2.outstanding = 5
+    assert pool.pick("phi4:latest") is gpu2
+    # Nobody has it: least outstanding, which then counts as having it
+    other = pool.pick("deepseek-r1:14b")
+    assert other is not gpu2 and "deepseek-r1:14b" in other.loaded
+
+
+def test_failing_host_is_ejected(pool, monkeypatch):
+    monkeypatch.setattr(ollama_pool, "OLLAMA_EJECT_AFTER", 2)
+    gpu1 = backend(pool, HOSTS[0])
+    gpu1.loaded = {"phi4"}
+    pool.record(gpu1, ok=False)
+    assert gpu1.healthy
+    pool.record(gpu1, ok=False)
+    assert not gpu1.healthy
+    assert all(pool.pick("phi4") is not gpu1 for _ in range(10))
+
+
+def test_ejection_backs_off(pool, monkeypatch):
+    monkeypatch.setattr(ollama_pool, "OLLAMA_EJECT_AFTER", 1)
+    gpu1 = backend(pool, HOSTS[0])
+    pool.record(gpu1, ok=False)
+    first = gpu1.status()["ejected_for"]
+    gpu1.ejected_until = 0.0  # Back, and failing again right away
+    pool.record(gpu1, ok=False)
+    assert gpu1.status()["ejected_for"] == pytest.approx(2 * first, abs=0.2)
+    # A success resets it
+    pool.record(gpu1, ok=True)
+    assert (gpu1.failures, gpu1.ejections) == (0, 0)
+
+
+def test_every_host_ejected_still_picks_one(pool, monkeypatch):
+    monkeypatch.setattr(ollama_pool, "OLLAMA_EJECT_AFTER", 1)
+    for b in pool.backends:
+        pool.record(b, ok=False)
+    assert pool.pick(None) in pool.backends
+
+
+def test_excluded_hosts_are_skipped(pool):
+    gpu1, gpu2 = backend(pool, HOSTS[0]), backend(pool, HOSTS[1])
+    assert pool.pick(None, exclude=[gpu1, gpu2]).url == HOSTS[2]
+
+
+def test_conversation_sticks_to_its_host(pool):
+    key = "conversation-1"
+    first = pool.pick(None, key=key)
+    with ollama_pool.affinity(key) as current:
+        current.resolve(first.url)
+    pool.release(first, ok=True)
+    # Busier than the others, but within the slack
+    first.outstanding = ollama_pool.OLLAMA_AFFINITY_SLACK
+    assert pool.pick(None, key=key) is first
+
+
+def test_too_busy_host_overflows(pool):
+    key = "conversation-2"
+    with ollama_pool.affinity(key) as current:
+        current.resolve(HOSTS[0])
+    backend(pool, HOSTS[0]).outstanding = ollama_pool.OLLAMA_AFFINITY_SLACK + 1
+    assert pool.pick(None, key=key).url != HOSTS[0]
+
+
+def test_unknown_conversation_hashes_to_the_same_host_everywhere(pool):
+    # Another worker (its own pool) sends it to the same host
+    other = OllamaPool(HOSTS)
+    other.stop_probing()
+    keys = [f"conversation-{i}" for i in range(100, 120)]
+
+    def host(pool, key):
+        picked = pool.pick(None, key=key)
+        pool.release(picked, ok=True)
+        return picked.url
+    assert [host(pool, k) for k in keys] == [host(other, k) for k in keys]
+    # ...and they don't all go to the same one
+    assert len({host(pool, k) for k in keys}) > 1
+
+
+def test_warm_turns_are_told_apart():
+    with ollama_pool.affinity("conversation-3") as current:
+        current.resolve(HOSTS[0])
+        assert not current.warm
+        current.resolve(HOSTS[0])
+        assert current.warm
+        current.resolve(HOSTS[1])
+        assert not current.warm
@@ -0,0 +1,73 @@
+import asyncio
+
+import pytest
+from langchain_core.runnables import RunnableLambda
+
+from cancellation import RunCancellation
+from graphs.research import prefetch
+
+
+@pytest.fixture
+def searches(monkeypatch):
+    """The queries searched for, by a search that takes `delay` seconds"""
+    searched = []
+
+    async def search(query, include_raw_content=True, max_results=1):
+        searched.append(query)
+        await asyncio.sleep(search.delay)
+        return {"results": [{"url": f"https://example.com/{len(searched)}", "title": query, "content": ""}]}
+    search.delay = 0.0
+    monkeypatch.setattr(prefetch, "atavily_search", search)
+    search.searched = searched
+    return search
+
+
+def test_similarity():
+    assert prefetch.similarity("the rust borrow checker", "Rust borrow checker rules") == 0.75
+    assert prefetch.similarity("the", "rust") == 0.0
+
+
+def test_guess_follow_up_query():
+    results = {"results": [
+        {"title": "Lifetimes in Rust", "content": "lifetimes and borrowing"},
+        {"title": "Borrowing explained", "content": "borrowing rules, lifetimes"},
+    ]}
+    assert prefetch.guess_follow_up_query("rust", results) == "rust lifetimes borrowing explained"
+
+
+def test_claim_hit_and_miss(searches):
+    async def run():
+        key = prefetch.start("rust borrow checker")
+        hit = await prefetch.claim(key, ["something else", "rust borrow checker rules"], min_similarity=0.5)
+        key = prefetch.start("rust borrow checker")
+        miss = await prefetch.claim(key, ["python packaging"], min_similarity=0.5)
+        # Gone either way
+        assert await prefetch.claim(key, ["rust borrow checker"], min_similarity=0.5) is None
+        return hit, miss
+
+    before = prefetch.prefetch_stats()
+    hit, miss = asyncio.run(run())
+    assert hit[0] == "rust borrow checker rules" and hit[1]["results"]
+    assert miss is None
+    stats = prefetch.prefetch_stats()
+    assert (stats["hits"] - before["hits"], stats["misses"] - before["misses"]) == (1, 1)
+
+
+def test_prefetch_is_cancelled_when_the_run_ends(searches):
+    searches.delay = 60
+
+    async def node(_):
+        return prefetch.start("rust borrow checker")
+
+    async def run():
+        cancellation = RunCancellation("research")
+        key = await RunnableLambda(node).ainvoke(None, {"callbacks": [cancellation]})
+        task = prefetch._prefetches[key].task
+        cancellation.run_ended()
+        await asyncio.sleep(0)
+        return key, task
+
+    before = prefetch.prefetch_stats()["abandoned"]
+    key, task = asyncio.run(run())
+    assert task.cancelled() and key not in prefetch._prefetches
+    assert prefetch.prefetch_stats()["abandoned"] == before + 1
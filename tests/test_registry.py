@@ -0,0 +1,17 @@
+import graphs.ollama.graph
+from graphs import AGENTS, get_agent
+from graphs.ollama.state import Config, State
+
+
+def test_graph_loads_after_its_module_was_imported():
+    # `graphs.ollama.graph` is the submodule now, as an attribute of the package
+    agent = get_agent("ollama")
+    assert agent.graph is graphs.ollama.graph.graph
+    assert agent.input_schema is State and agent.config_schema is Config
+    assert agent.loaded
+
+
+def test_every_agent_loads():
+    for agent in AGENTS:
+        assert hasattr(agent.graph, "astream_events"), agent.id
+        assert agent.load_seconds is not None
@@ -0,0 +1,24 @@
+import pytest
+
+from graphs.research.nodes import _parse_queries
+
+
+@pytest.mark.parametrize("content, expected", [
+    ('{"queries": [{"query": "solar panel efficiency", "aspect": "a"}, {"query": "perovskite cells"}]}',
+     ["solar panel efficiency", "perovskite cells"]),
+    ('{"queries": ["a", "b", "a", "c", "d"]}', ["a", "b", "c"]),
+    # A single query instead of a list
+    ('{"queries": "solar panel efficiency"}', ["solar panel efficiency"]),
+    ('{"queries": {"query": "solar panel efficiency"}}', ["solar panel efficiency"]),
+    # A bare list
+    ('["a", "b"]', ["a", "b"]),
+    # Nothing usable: the caller falls back to the topic
+    ('{"queries": [" ", 3, {"aspect": "no query"}]}', []),
+    ('{"other": ["a"]}', []),
+    ('{"queries": 3}', []),
+    ('"just a string"', []),
+    ('not json at all', []),
+    ('', []),
+])
+def test_parse_queries(content, expected):
+    assert _parse_queries(content, "queries", 3) == expected
@@ -0,0 +1,36 @@
+from graphs.research.utils import content_hash, filter_seen_sources
+
+
+def result(url, content="", raw_content=None):
+    return {"url": url, "title": url, "content": content, "raw_content": raw_content}
+
+
+def test_content_hash_ignores_whitespace():
+    assert content_hash(result("a", "solar  panels\n")) == content_hash(result("b", " solar panels"))
+    # raw_content first, when there is some
+    assert content_hash(result("a", "snippet", "page")) == content_hash(result("b", "page"))
+    assert content_hash(result("a", "   ")) is None
+    assert content_hash(result("a")) is None
+
+
+def test_drops_urls_and_content_seen_before():
+    seen_hash = content_hash(result("x", "old page"))
+    results = [
+        result("https://a", "page a"),
+        result("https://a", "page a again"),     # Same URL, in this loop
+        result("https://b", "page  a"),          # Same content, other URL
+        result("https://seen", "new content"),   # URL from an earlier loop
+        result("https://c", "old page"),         # Content from an earlier loop
+        result("https://d", "page d"),
+    ]
+    new_results, new_urls, new_hashes = filter_seen_sources(results, ["https://seen"], [seen_hash])
+    assert new_urls == ["https://a", "https://d"]
+    assert [r["content"] for r in new_results] == ["page a", "page d"]
+    assert new_hashes == [content_hash(results[0]), content_hash(results[5])]
+
+
+def test_results_without_content_go_by_url_only():
+    results = [result("https://a"), result("https://b", raw_content=""), result("https://c", "  "), result("https://a")]
+    new_results, new_urls, new_hashes = filter_seen_sources(results, [], [])
+    assert new_urls == ["https://a", "https://b", "https://c"]
+    assert new_hashes == []
@@ -0,0 +1,19 @@
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+from graphs.research.state import add_or_replace, compacted
+
+
+def test_appends_by_default():
+    assert add_or_replace(["a"], ["b", "c"]) == ["a", "b", "c"]
+
+
+def test_compacted_replaces():
+    assert add_or_replace(["a", "b"], compacted(["ref:1", "c"])) == ["ref:1", "c"]
+    assert add_or_replace(["a"], compacted([])) == []
+
+
+def test_compacted_survives_serialization():
+    # NOTE: updates go through the checkpointer's serializer (i.e. pending writes of a resumed run)
+    serde = JsonPlusSerializer()
+    update = serde.loads_typed(serde.dumps_typed(compacted(["ref:1", "c"])))
+    assert add_or_replace(["a", "b"], update) == ["ref:1", "c"]
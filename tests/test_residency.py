@@ -0,0 +1,74 @@
+import asyncio
+import json
+
+import httpx
+
+from residency import ResidencyManager, parse_models
+
+HOSTS = ["http://gpu1:11434", "http://gpu2:11434"]
+
+
+def test_parse_models():
+    assert parse_models("phi4, llama3.1 ,,") == ["phi4", "llama3.1"]
+    assert parse_models("none") == []
+    assert parse_models("") == []
+
+
+class FakeOllama:
+    def __init__(self, loaded=None):
+        self.loaded = {host: set(models) for host, models in (loaded or {}).items()}
+        self.loads = []
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        host = f"{request.url.scheme}://{request.url.host}:{request.url.port}"
+        if request.url.path == "/api/ps":
+            return httpx.Response(200, json={"models": [{"name": f"{m}:latest"} for m in self.loaded.get(host, ())]})
+        model = json.loads(request.content)["model"]
+        self.loads.append((host, model))
+        self.loaded.setdefault(host, set()).add(model)
+        return httpx.Response(200, json={})
+
+
+def manager(ollama: FakeOllama) -> ResidencyManager:
+    residency = ResidencyManager(HOSTS)
+    residency._client = httpx.AsyncClient(transport=httpx.MockTransport(ollama))
+    return residency
+
+
+def test_preload_loads_every_model_on_every_host():
+    ollama = FakeOllama()
+
+    async def run():
+        residency = manager(ollama)
+        residency.start_preload(["phi4:latest", "llama3.1"])
+        assert residency.preloading and not residency.ready
+        await asyncio.gather(*residency._tasks)
+        return residency
+
+    residency = asyncio.run(run())
+    assert sorted(ollama.loads) == sorted((host, model) for host in HOSTS for model in ("phi4", "llama3.1"))
+    assert not residency.preloading and residency.ready
+    assert residency.status()["models"]["phi4"] == "resident"
+
+
+def test_preload_without_a_client_ends_right_away():
+    residency = ResidencyManager(HOSTS)
+    residency.start_preload(["phi4"])
+    assert not residency.preloading and not residency._tasks
+
+
+def test_check_refreshes_only_used_models():
+    ollama = FakeOllama({HOSTS[0]: {"phi4", "llama3.1"}})
+
+    async def run():
+        residency = manager(ollama)
+        residency.touch(["phi4:latest"])
+        await residency.check()
+        assert residency.resident == {HOSTS[0]: {"phi4", "llama3.1"}, HOSTS[1]: set()}
+        # Not used again since: nothing to refresh
+        await residency.check()
+        return residency
+
+    residency = asyncio.run(run())
+    assert ollama.loads == [(HOSTS[0], "phi4")]
+    assert residency.stats["refreshes"] == 1
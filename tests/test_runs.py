@@ -0,0 +1,194 @@
+import asyncio
+import json
+import time
+from types import SimpleNamespace
+from typing import TypedDict
+
+import pytest
+from langgraph.graph import StateGraph, START, END
+
+import runs
+from runs import Run, RunRegistry
+
+
+# Set by a test to hold the run in `second` (the graph streams ahead of whoever consumes its updates)
+GATE = None
+
+
+class State(TypedDict):
+    steps: list
+    fail: bool
+
+
+async def first(state: State):
+    return {"steps": state["steps"] + ["first"]}
+
+
+async def second(state: State):
+    if GATE is not None:
+        await GATE.wait()
+    if state.get("fail"):
+        raise RuntimeError("second failed")
+    return {"steps": state["steps"] + ["second"]}
+
+
+def agent():
+    builder = StateGraph(State)
+    builder.add_node("first", first)
+    builder.add_node("second", second)
+    builder.add_edge(START, "first")
+    builder.add_edge("first", "second")
+    builder.add_edge("second", END)
+    return SimpleNamespace(id="test", graph=builder.compile())
+
+
+class Frames:
+    """The `frames` callback: a frame per node update.  With `hold`, it stops after the first one as soon as
+    nobody follows the run (like `stream_generator` does once `watch_for_disconnect` cancels it)"""
+    def __init__(self, hold=False):
+        self.hold = hold
+        self.calls = 0
+
+    async def __call__(self, graph, input_data, config, is_disconnected):
+        self.calls += 1
+        hold = self.hold
+        self.hold = False
+        async for update in graph.astream(input_data, config, stream_mode="updates", durability="sync"):
+            yield f"data: {json.dumps(update)}\n\n"
+            if hold:
+                while not await is_disconnected():
+                    await asyncio.sleep(0.01)
+                return
+
+
+def registry_test(test):
+    """Run `test(registry)` with a registry on a fresh checkpoint database"""
+    def run(tmp_path, monkeypatch):
+        monkeypatch.setattr(runs, "CHECKPOINT_DB", str(tmp_path / "checkpoints.sqlite"))
+        monkeypatch.setattr(runs, "STREAM_RESUME_GRACE", 0.1)
+        monkeypatch.setitem(globals(), "GATE", None)
+
+        async def main():
+            registry = RunRegistry()
+            await registry.open()
+            try:
+                await test(registry)
+            finally:
+                await registry.close()
+        asyncio.run(main())
+    run.__name__ = test.__name__
+    return run
+
+
+async def collect(run: Run, last_event_id: int = 0) -> list:
+    return [frame async for frame in run.follow(last_event_id)]
+
+
+def ids(frames: list) -> list:
+    return [int(frame.split("\n", 1)[0].removeprefix("id: ")) for frame in frames]
+
+
+@registry_test
+async def test_followers_get_every_frame_live_or_after_the_end(registry):
+    test_agent = agent()
+    run = registry.start(test_agent, {"steps": [], "fail": False}, {}, Frames())
+    live = await collect(run)
+    await run.task
+    assert run.completed and not run.interrupted
+    assert ids(live) == [1, 2] and "second" in live[1]
+    # A follower that comes after the end gets the same frames, and is done right away
+    assert await collect(run) == live
+    # Nothing left to resume: the checkpoints went with it
+    assert await registry.checkpointer.aget_tuple(registry.config_for(run.id, {})) is None
+
+
+@registry_test
+async def test_replay_from_last_event_id(registry):
+    run = registry.start(agent(), {"steps": [], "fail": False}, {}, Frames())
+    await run.task
+    replayed = await collect(run, last_event_id=1)
+    assert ids(replayed) == [2]
+    assert await collect(run, last_event_id=2) == []
+
+
+@registry_test
+async def test_abandoned_run_is_stopped_after_the_grace_and_resumed(registry):
+    global GATE
+    GATE = asyncio.Event()
+    test_agent, frames = agent(), Frames(hold=True)
+    run = registry.start(test_agent, {"steps": [], "fail": False}, {}, frames)
+
+    # Followed: not abandoned, however long it takes
+    follower = run.follow()
+    assert ids([await follower.__anext__()]) == [1]
+    await asyncio.sleep(0.2)
+    assert not await run.abandoned() and not run.finished
+    await follower.aclose()
+
+    # Nobody follows it anymore: it stops once the grace is over
+    started = time.monotonic()
+    await asyncio.wait_for(run.task, timeout=5)
+    assert time.monotonic() - started >= 0.1
+    assert run.interrupted
+
+    # The client comes back: the run goes on from the node after the last checkpoint
+    GATE.set()
+    resumed = await registry.resume(run.id, test_agent, {}, frames, last_event_id=1)
+    assert resumed is run and not run.finished
+    rest = await collect(resumed, last_event_id=1)
+    # Only `second` ran again
+    assert ids(rest) == [2] and list(json.loads(rest[0].split("data: ", 1)[1])) == ["second"]
+    assert run.completed and frames.calls == 2
+
+
+@registry_test
+async def test_unknown_run_is_not_resumed(registry):
+    assert await registry.resume("unknown", agent(), {}, Frames()) is None
+
+
+@registry_test
+async def test_failed_run_is_not_resumed(registry):
+    test_agent, frames = agent(), Frames()
+    run = registry.start(test_agent, {"steps": [], "fail": True}, {}, frames)
+    await run.task
+    assert run.failed and not run.interrupted
+    # Its log is still there to follow, but it isn't run again
+    assert await registry.resume(run.id, test_agent, {}, frames) is run
+    assert frames.calls == 1
+
+
+@registry_test
+async def test_run_that_failed_before_a_restart_is_not_resumed(registry):
+    test_agent = agent()
+    config = registry.config_for("failed-run", {})
+    with pytest.raises(RuntimeError):
+        await registry.graph_for(test_agent).ainvoke({"steps": [], "fail": True}, config)
+
+    frames = Frames()
+    assert await registry.resume("failed-run", test_agent, {}, frames) is None
+    assert frames.calls == 0
+    await asyncio.gather(*registry._background)
+    assert await registry.checkpointer.aget_tuple(config) is None
+
+
+@registry_test
+async def test_sweep_deletes_only_old_unknown_threads(registry):
+    test_agent = agent()
+    graph = registry.graph_for(test_agent)
+
+    async def checkpoint(thread_id):
+        # Stopped after `first`: the kind of run a restart leaves behind
+        await graph.ainvoke({"steps": [], "fail": False}, registry.config_for(thread_id, {}), interrupt_before=["second"])
+
+    await checkpoint("old-unknown")
+    await checkpoint("old-known")
+    registry.runs["old-known"] = Run("old-known", test_agent.id, {})
+    await asyncio.sleep(0.3)
+    await checkpoint("new-unknown")
+
+    await registry.sweep_checkpoints(max_age=0.2)
+    remaining = {
+        thread_id for thread_id in ("old-unknown", "old-known", "new-unknown")
+        if await registry.checkpointer.aget_tuple(registry.config_for(thread_id, {})) is not None
+    }
+    assert remaining == {"old-known", "new-unknown"}
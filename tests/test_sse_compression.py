@@ -0,0 +1,59 @@
+import asyncio
+import gzip
+import zlib
+
+import pytest
+
+from sse_compression import FrameCompressor, compress_frames, negotiate_encoding
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, None),
+    ("", None),
+    ("gzip", "gzip"),
+    ("deflate", "deflate"),
+    ("deflate, gzip", "gzip"),  # Our preference, not the client's order
+    ("gzip;q=0, deflate", "deflate"),
+    ("GZIP ; q=0.5", "gzip"),
+    ("br", None),
+    ("*", "gzip"),
+    ("*;q=0, deflate", "deflate"),
+    ("gzip;q=0, *", "deflate"),
+    ("gzip;q=oops", None),
+    ("identity", None),
+])
+def test_negotiate_encoding(header, expected):
+    assert negotiate_encoding(header, level=6) == expected
+
+
+def test_level_zero_turns_compression_off():
+    assert negotiate_encoding("gzip", level=0) is None
+
+
+@pytest.mark.parametrize("encoding, wbits", [("gzip", 16 + zlib.MAX_WBITS), ("deflate", zlib.MAX_WBITS)])
+def test_every_frame_decodes_as_it_arrives(encoding, wbits):
+    compressor = FrameCompressor(encoding)
+    decompressor = zlib.decompressobj(wbits)
+    frames = [f"data: {{\"token\": \"{i}\"}}\n\n".encode() for i in range(20)]
+    for frame in frames:
+        # Z_SYNC_FLUSH: the frame is all there without waiting for the next one
+        assert decompressor.decompress(compressor.compress(frame)) == frame
+    assert decompressor.decompress(compressor.finish()) == b""
+    assert decompressor.eof
+
+
+def test_compress_frames_is_a_valid_gzip_stream():
+    frames = ["event: a\ndata: 1\n\n", "event: b\ndata: 2\n\n"] * 50
+
+    async def source():
+        for frame in frames:
+            yield frame
+
+    async def run():
+        return [chunk async for chunk in compress_frames(source(), "gzip")]
+    chunks = asyncio.run(run())
+    assert len(chunks) == len(frames) + 1
+    body = b"".join(chunks)
+    assert gzip.decompress(body) == "".join(frames).encode()
+    # The compressor's window carries over from frame to frame: much smaller than compressing each one on its own
+    assert len(body) < sum(len(gzip.compress(frame.encode())) for frame in frames) / 2
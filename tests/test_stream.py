@@ -0,0 +1,57 @@
+import asyncio
+
+import httpx
+import pytest
+
+import app
+from admission import AdmissionController, models_for_run
+from graphs import get_agent
+from timeline import TIMELINES
+
+
+def post_stream(body: dict) -> httpx.Response:
+    async def run():
+        # NOTE: no lifespan - RUNS isn't opened, so streams aren't resumable
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app.app), base_url="http://test") as client:
+            return await client.post("/stream", json=body)
+    return asyncio.run(run())
+
+
+@pytest.fixture
+def fake_run(monkeypatch):
+    async def frames(agent, input_data, config, *args, run_id=None, **kwargs):
+        yield app.sse_frame({"event": "on_chain_end", "name": "LangGraph", "data": {}})
+    monkeypatch.setattr(app, "stream_generator", frames)
+
+
+def test_not_resumable_stream_has_no_run_id(fake_run):
+    response = post_stream({"agent_id": "ollama", "input_data": {"messages": []}})
+    assert response.status_code == 200
+    assert "x-run-id" not in response.headers
+    assert response.headers["x-timeline-id"]
+
+
+def test_run_id_is_rejected_when_streams_are_not_resumable(fake_run):
+    response = post_stream({"agent_id": "ollama", "input_data": {"messages": []}, "run_id": "abc", "thread_id": "t1"})
+    assert response.status_code == 409
+
+
+def test_client_that_leaves_while_queued_closes_its_timeline(monkeypatch):
+    agent = get_agent("ollama")
+    admission = AdmissionController(default_limit=1)
+    monkeypatch.setattr(app, "ADMISSION", admission)
+
+    async def gone():
+        return True
+
+    async def run():
+        holder = admission.ticket(models_for_run(agent, {}))
+        async for _ in holder.wait():
+            pass
+        frames = [frame async for frame in app.stream_generator(agent, {}, {}, is_disconnected=gone, run_id="queued-run")]
+        holder.release()
+        return frames
+
+    assert asyncio.run(run()) == []
+    assert "queued-run" not in TIMELINES.active
+    assert TIMELINES.get("queued-run").finished
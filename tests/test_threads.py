@@ -0,0 +1,73 @@
+import asyncio
+
+from langchain_core.messages import AIMessage
+
+from threads import ThreadStore, thread_reply
+
+
+def test_append_and_truncate_are_stored(tmp_path):
+    path = str(tmp_path / "threads.sqlite")
+
+    async def run():
+        store = ThreadStore(path)
+        await store.open()
+        await store.append("t1", [{"role": "user", "content": "hi", "extra": "dropped"}])
+        await store.append("t1", [AIMessage(content="hello")])
+        await store.append("t1", [{"role": "user", "content": "again"}])
+        await store.truncate("t1", keep=2)
+        await store.append("t1", [{"role": "user", "content": "instead"}])
+        assert await store.get("t1") == [
+            {"role": "user", "content": "hi"},
+            {"role": "assistant", "content": "hello"},
+            {"role": "user", "content": "instead"},
+        ]
+        await store.close()
+
+        reopened = ThreadStore(path)
+        await reopened.open()
+        messages = await reopened.get("t1")
+        assert reopened.stats["misses"] == 1
+        await reopened.close()
+        return messages
+
+    assert [m["content"] for m in asyncio.run(run())] == ["hi", "hello", "instead"]
+
+
+def test_get_returns_a_copy(tmp_path):
+    async def run():
+        store = ThreadStore(str(tmp_path / "threads.sqlite"))
+        await store.open()
+        await store.append("t1", [{"role": "user", "content": "hi"}])
+        (await store.get("t1")).clear()
+        assert len(await store.get("t1")) == 1
+        await store.close()
+    asyncio.run(run())
+
+
+def test_evicted_thread_is_read_back_with_its_pending_writes(tmp_path):
+    async def run():
+        store = ThreadStore(str(tmp_path / "threads.sqlite"), cache_size=1)
+        await store.open()
+        await store.append("t1", [{"role": "user", "content": "one"}])
+        await store.append("t2", [{"role": "user", "content": "two"}])  # Evicts t1
+        assert "t1" not in store._hot
+        await store.append("t1", [{"role": "assistant", "content": "reply"}])
+        assert [m["content"] for m in await store.get("t1")] == ["one", "reply"]
+        await store.close()
+    asyncio.run(run())
+
+
+def test_concurrent_misses_read_once(tmp_path):
+    async def run():
+        store = ThreadStore(str(tmp_path / "threads.sqlite"))
+        await store.open()
+        results = await asyncio.gather(*(store.get("t1") for _ in range(5)))
+        assert results == [[]] * 5 and store.stats["misses"] == 1
+        await store.close()
+    asyncio.run(run())
+
+
+def test_thread_reply():
+    assert thread_reply({"messages": [{"role": "user", "content": "q"}, AIMessage(content="a")]}) == {"role": "assistant", "content": "a"}
+    assert thread_reply({"running_summary": "## Summary"}) == {"role": "assistant", "content": "## Summary"}
+    assert thread_reply({}) is None and thread_reply(None) is None
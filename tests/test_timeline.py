@@ -0,0 +1,89 @@
+import asyncio
+import time
+from typing import TypedDict
+
+from langgraph.graph import StateGraph, START, END
+
+from graphs.spans import record_span
+from timeline import RunTimeline, Span, Timeline, TimelineStore, _size
+
+
+def timeline_of(*spans) -> Timeline:
+    timeline = Timeline("run-1", "chat")
+    for span_id, parent, start, end in spans:
+        span = timeline.add(Span(span_id, parent, "node", span_id, start))
+        span.end, span.status = end, "completed"
+    return timeline
+
+
+def test_size_counts_text_without_serializing():
+    class Message:
+        content = "hello"
+    assert _size({"messages": [Message(), {"content": "abc"}], "n": 3, "query": "q"}) == 9
+    # Deeply nested payloads stop being counted
+    assert _size([[[[[["deep"]]]]]]) == 0
+
+
+def test_to_json_nests_spans():
+    timeline = timeline_of(("graph", None, 10.0, 13.0), ("a", "graph", 10.5, 11.0), ("b", "graph", 11.0, 12.5))
+    report = timeline.to_json()
+    assert report["run_id"] == "run-1" and report["dropped_spans"] == 0
+    [root] = report["spans"]
+    assert root["name"] == "graph" and root["duration_ms"] == 3000.0
+    assert [(c["name"], c["offset_ms"], c["duration_ms"]) for c in root["children"]] == [("a", 500.0, 500.0), ("b", 1000.0, 1500.0)]
+
+
+def test_chrome_trace_lanes():
+    timeline = timeline_of(
+        ("graph", None, 0.0, 10.0),
+        ("a", "graph", 1.0, 5.0),
+        ("a1", "a", 2.0, 3.0),
+        ("b", "graph", 4.0, 6.0),  # Overlaps `a` without nesting in it: its own lane
+        ("c", "graph", 7.0, 8.0),
+    )
+    events = timeline.to_chrome_trace()["traceEvents"]
+    lanes = {e["name"]: e["tid"] for e in events if e["ph"] == "X"}
+    assert lanes["graph"] == lanes["a"] == lanes["a1"] == lanes["c"] == 1
+    assert lanes["b"] == 2
+    a = next(e for e in events if e["name"] == "a")
+    assert a["dur"] == 4_000_000 and a["args"]["status"] == "completed"
+    assert events[-1]["ph"] == "M"
+
+
+def test_spans_past_the_limit_are_dropped(monkeypatch):
+    monkeypatch.setattr("timeline.TIMELINE_MAX_SPANS", 2)
+    timeline = timeline_of(("a", None, 0.0, 1.0), ("b", None, 1.0, 2.0))
+    assert timeline.add(Span("c", None, "node", "c", 2.0)) is None
+    assert timeline.to_json()["dropped_spans"] == 1
+
+
+class State(TypedDict):
+    text: str
+
+
+async def search(state: State):
+    started = time.perf_counter()
+    record_span("search", "tavily_search", started, started + 0.01, attributes={"results": 1})
+    return {"text": state["text"] + "!"}
+
+
+def test_graph_run_is_recorded():
+    builder = StateGraph(State)
+    builder.add_node("search", search)
+    builder.add_edge(START, "search")
+    builder.add_edge("search", END)
+    graph = builder.compile()
+
+    store = TimelineStore()
+    timeline = store.open("run-1", "research")
+    asyncio.run(graph.ainvoke({"text": "hi"}, {"callbacks": [RunTimeline(timeline)]}))
+    store.close(timeline)
+
+    report = store.get("run-1").to_json()
+    assert report["finished"]
+    [root] = report["spans"]
+    assert root["kind"] == "graph" and root["attributes"]["input_chars"] == 2
+    [node] = root["children"]
+    assert (node["kind"], node["name"], node["attributes"]["output_chars"]) == ("node", "search", 3)
+    [span] = node["children"]
+    assert (span["kind"], span["name"], span["attributes"]) == ("search", "tavily_search", {"results": 1})
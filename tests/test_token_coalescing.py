@@ -0,0 +1,67 @@
+import asyncio
+
+from langchain_core.messages import AIMessageChunk
+
+from app import EventPump, TokenCoalescing, coalesce_token_events
+
+
+def token(text, run_id="llm-1", **metadata):
+    return {"event": "on_chat_model_stream", "run_id": run_id, "name": "ChatOllama",
+            "data": {"chunk": AIMessageChunk(content=text, id=f"{run_id}-{text}", response_metadata=metadata)}}
+
+
+def other(name="summarize_sources"):
+    return {"event": "on_chain_end", "run_id": "node", "name": name, "data": {}}
+
+
+def coalesce(events, delay=0.0, **coalescing):
+    async def source():
+        for item in events:
+            if delay:
+                await asyncio.sleep(delay)
+            yield item
+
+    async def run():
+        pump = EventPump(source())
+        return [item async for item in coalesce_token_events(pump, TokenCoalescing(**coalescing))]
+    return asyncio.run(run())
+
+
+def text(event):
+    return event["data"]["chunk"].content
+
+
+def test_merges_a_burst_of_tokens():
+    merged = coalesce([token("Hel"), token("lo"), token(" world", done_reason="stop")], interval_ms=1000)
+    assert len(merged) == 1
+    chunk = merged[0]["data"]["chunk"]
+    assert chunk.content == "Hello world"
+    # The id of the first chunk, the metadata of the last one
+    assert chunk.id == "llm-1-Hel"
+    assert chunk.response_metadata == {"done_reason": "stop"}
+
+
+def test_other_events_flush_and_keep_their_order():
+    merged = coalesce([token("a"), token("b"), other(), token("c")], interval_ms=1000)
+    assert [e["event"] for e in merged] == ["on_chat_model_stream", "on_chain_end", "on_chat_model_stream"]
+    assert [text(merged[0]), text(merged[2])] == ["ab", "c"]
+
+
+def test_llm_runs_are_not_mixed():
+    merged = coalesce([token("a"), token("b", run_id="llm-2")], interval_ms=1000)
+    assert [(e["run_id"], text(e)) for e in merged] == [("llm-1", "a"), ("llm-2", "b")]
+
+
+def test_flushes_at_max_bytes():
+    merged = coalesce([token("aa"), token("bb"), token("cc")], interval_ms=1000, max_bytes=4)
+    assert [text(e) for e in merged] == ["aabb", "cc"]
+
+
+def test_flushes_on_the_timer():
+    merged = coalesce([token("a"), token("b"), token("c")], delay=0.03, interval_ms=1)
+    assert [text(e) for e in merged] == ["a", "b", "c"]
+
+
+def test_single_token_is_passed_as_is():
+    event = token("only")
+    assert coalesce([event]) == [event]